@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+# --------- Admission control for provider work ----------
+class Overloaded(Exception):
+    """Request turned away; maps to an HTTP status with a Retry-After header."""
+
+    def __init__(self, status, reason, retry_after_s):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after_s = max(1, int(retry_after_s + 0.999))
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self, cost, now) -> float:
+        """Takes `cost` tokens and returns 0, or returns the seconds until they would be available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+def estimate_tokens(prompt, max_new_tokens) -> int:
+    # ~4 characters per token for English/code; good enough for budgeting, no tokenizer needed
+    return max(1, len(prompt or "") // 4) + int(max_new_tokens)
+
+
+def client_id(api_key=None, remote_addr=None, forwarded_for=None) -> str:
+    """API key (hashed, so it never shows up in stats) or the client IP.
+
+    Pass only a key the caller has checked; otherwise anyone gets a fresh budget per made-up key.
+    """
+    if api_key:
+        return "key:" + hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12]
+    if forwarded_for:
+        return "ip:" + forwarded_for.split(",")[0].strip()
+    return "ip:" + (remote_addr or "unknown")
+
+
+class Admission:
+    """Token budgets plus a concurrency cap with a bounded FIFO wait queue.
+
+    Each request costs its estimated prompt tokens plus max_new_tokens.
+      * per client (`client_tokens_per_min`): over budget -> 429 with Retry-After
+      * whole process (`global_tokens_per_min`, i.e. provider quota): -> 503
+      * at most `max_concurrent` requests run; up to `max_queue` more wait, at
+        most `queue_timeout_s` each. A full queue or a wait that times out -> 503,
+        and the tokens it was charged are given back.
+    Rejections are immediate, so overload costs the client one round trip
+    instead of an ever-growing queue. A value of 0 turns a limit off.
+    Waiters are concurrent.futures Futures so Flask threads and asyncio
+    requests share one queue (same idea as SingleFlight).
+    """
+
+    def __init__(self, max_concurrent=0, max_queue=0, queue_timeout_s=5.0, client_tokens_per_min=0,
+                 client_burst=0, global_tokens_per_min=0, global_burst=0, max_clients=10000):
+        self.max_concurrent = int(max_concurrent)
+        self.max_queue = int(max_queue)
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.client_rate = float(client_tokens_per_min) / 60.0
+        self.client_burst = float(client_burst or client_tokens_per_min)
+        self.global_bucket = None
+        if global_tokens_per_min:
+            self.global_bucket = TokenBucket(float(global_tokens_per_min) / 60.0,
+                                             float(global_burst or global_tokens_per_min))
+        self.max_clients = int(max_clients)
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # client -> TokenBucket, least recently seen first
+        self._waiters = deque()
+        self._active = 0
+        self._service_s = 1.0  # moving average of slot hold time, for Retry-After hints
+        self._counts = {"admitted": 0, "queued": 0}
+        self._rejected = {"client_budget": 0, "global_budget": 0, "queue_full": 0, "queue_timeout": 0}
+        self._wait_s = 0.0
+
+    # ----- budgets -----
+    def _charge(self, client, cost):
+        now = time.monotonic()
+        with self._lock:
+            bucket = None
+            if self.client_rate > 0:
+                bucket = self._clients.pop(client, None) or TokenBucket(self.client_rate, self.client_burst)
+                self._clients[client] = bucket
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+                # a request bigger than the burst waits for a full bucket instead of never fitting
+                wait = bucket.take(min(cost, bucket.burst), now)
+                if wait:
+                    self._rejected["client_budget"] += 1
+                    raise Overloaded(429, "client token budget exceeded", wait)
+            if self.global_bucket is not None:
+                wait = self.global_bucket.take(min(cost, self.global_bucket.burst), now)
+                if wait:
+                    if bucket is not None:
+                        bucket.refund(min(cost, bucket.burst))
+                    self._rejected["global_budget"] += 1
+                    raise Overloaded(503, "provider token budget exhausted", wait)
+
+    def _refund(self, client, cost):
+        # the request never ran (no slot): its tokens go back to both buckets
+        with self._lock:
+            bucket = self._clients.get(client) if self.client_rate > 0 else None
+            if bucket is not None:
+                bucket.refund(min(cost, bucket.burst))
+            if self.global_bucket is not None:
+                self.global_bucket.refund(min(cost, self.global_bucket.burst))
+
+    # ----- concurrency slots -----
+    def _try_slot(self):
+        """Returns None when a slot was taken, else a Future to wait on (caller holds no lock)."""
+        with self._lock:
+            if self.max_concurrent <= 0 or (self._active < self.max_concurrent and not self._waiters):
+                self._active += 1
+                self._counts["admitted"] += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._rejected["queue_full"] += 1
+                raise Overloaded(503, "server busy", self._retry_hint(len(self._waiters)))
+            fut = Future()
+            self._waiters.append(fut)
+            self._counts["queued"] += 1
+            return fut
+
+    def _retry_hint(self, ahead):
+        return (ahead + 1) * self._service_s / max(1, self.max_concurrent)
+
+    def _give_up(self, fut, waited):
+        """Called when a waiter stops waiting; True if it was granted a slot in the meantime."""
+        with self._lock:
+            self._wait_s += waited
+            if fut.done() and not fut.cancelled():
+                self._counts["admitted"] += 1
+                return True
+            fut.cancel()
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+            self._rejected["queue_timeout"] += 1
+            return False
+
+    def _release(self, held_s):
+        with self._lock:
+            self._service_s += 0.1 * (held_s - self._service_s)
+            # hand the slot straight to the oldest waiter that is still waiting
+            while self._waiters:
+                fut = self._waiters.popleft()
+                if not fut.cancelled():
+                    fut.set_result(True)
+                    return
+            self._active -= 1
+
+    def _wait_limit(self, max_wait_s):
+        # a request with less time left than the queue timeout shouldn't wait past its own deadline
+        return self.queue_timeout_s if max_wait_s is None else min(self.queue_timeout_s, max_wait_s)
+
+    def admit(self, client, cost, max_wait_s=None) -> "Ticket":
+        """Blocks for at most queue_timeout_s (or max_wait_s); raises Overloaded. Use the ticket as a context manager."""
+        self._charge(client, cost)
+        try:
+            fut = self._try_slot()
+            if fut is None:
+                return Ticket(self, 0.0)
+            t0 = time.perf_counter()
+            try:
+                fut.result(timeout=self._wait_limit(max_wait_s))
+            except FutureTimeout:
+                pass
+            waited = time.perf_counter() - t0
+            if not self._give_up(fut, waited):
+                raise Overloaded(503, "queue wait timed out", self._retry_hint(len(self._waiters)))
+            return Ticket(self, waited)
+        except Overloaded:
+            self._refund(client, cost)
+            raise
+
+    async def aadmit(self, client, cost, max_wait_s=None) -> "Ticket":
+        """Async twin of `admit`; waiting never blocks the event loop."""
+        self._charge(client, cost)
+        try:
+            fut = self._try_slot()
+            if fut is None:
+                return Ticket(self, 0.0)
+            t0 = time.perf_counter()
+            try:
+                await asyncio.wait([asyncio.wrap_future(fut)], timeout=self._wait_limit(max_wait_s))
+            except BaseException:
+                # the request itself was cancelled: give back a slot if one arrived
+                if self._give_up(fut, time.perf_counter() - t0):
+                    self._release(0.0)
+                raise
+            waited = time.perf_counter() - t0
+            if not self._give_up(fut, waited):
+                raise Overloaded(503, "queue wait timed out", self._retry_hint(len(self._waiters)))
+            return Ticket(self, waited)
+        except BaseException:
+            self._refund(client, cost)
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queue_depth": len(self._waiters),
+                "max_concurrent": self.max_concurrent or None,
+                "max_queue": self.max_queue,
+                "queue_timeout_s": self.queue_timeout_s,
+                "client_tokens_per_min": round(self.client_rate * 60) or None,
+                "global_tokens_per_min": round(self.global_bucket.rate * 60) if self.global_bucket else None,
+                "global_tokens_left": int(self.global_bucket.tokens) if self.global_bucket else None,
+                "tracked_clients": len(self._clients),
+                **self._counts,
+                "rejected": dict(self._rejected),
+                "queue_wait_s_total": round(self._wait_s, 3),
+                "avg_service_ms": round(self._service_s * 1000, 1),
+            }
+
+
+class Ticket:
+    """A held concurrency slot; released on exit (or by `release()`, once)."""
+
+    def __init__(self, admission, waited_s):
+        self._admission = admission
+        self.waited_s = waited_s
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._admission._release(time.monotonic() - self._start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
@@ -1,16 +1,52 @@
+import os
+import threading
 from flask import Flask, request, jsonify
-from transformers import pipeline
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # Load the pre-trained language model for text generation
-nlp = pipeline("text-generation", model="gpt2")
+# (LAZY_STARTUP=1 loads it in the background so the server starts immediately)
+nlp = None
+_model_ready = threading.Event()
+_model_error = None  # set when loading failed (download error, out of memory, ...)
+
+def _load_model():
+    global nlp, _model_error
+    try:
+        from transformers import pipeline
+        nlp = pipeline("text-generation", model="gpt2")
+    except Exception as e:
+        _model_error = repr(e)
+        print("Model load error:", repr(e))
+        raise
+    _model_ready.set()
+
+def _status():
+    if _model_ready.is_set():
+        return "ready"
+    return "failed" if _model_error else "warming"
+
+if os.getenv("LAZY_STARTUP", "0") == "1":
+    threading.Thread(target=_load_model, daemon=True).start()
+else:
+    _load_model()
+
+@app.route('/health', methods=['GET'])
+def health():
+    payload = {"ok": True, "status": _status()}
+    if _model_error:
+        payload["error"] = _model_error
+    return jsonify(payload)
 
 @app.route('/query', methods=['GET', 'POST'])
 def query():
     if request.method == 'GET':
         return jsonify({"error": "Please use a POST request with a JSON payload"}), 405
+    if _model_error:
+        return jsonify({"error": "Model failed to load", "detail": _model_error}), 503
+    if not _model_ready.is_set():
+        return jsonify({"error": "Model is not ready yet"}), 503, {"Retry-After": "5"}
     try:
         data = request.get_json()
         user_query = data.get("query", "")
@@ -0,0 +1,282 @@
+import os
+import time
+import asyncio
+import contextvars
+import datetime as _dt
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+
+# Reuse the provider setup, caches and log writer from the Flask app
+import app_logging_autodetect as core
+import cancellation
+import export
+import http_pool
+import metrics
+from singleflight import Abandoned
+
+# --------- Concurrency limits (in-flight provider calls per process) ----------
+_LIMITS = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "256")),
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "256")),
+    "hf": int(os.getenv("HF_MAX_CONCURRENCY", "32")),
+    "fake": int(os.getenv("FAKE_MAX_CONCURRENCY", "256")),
+}
+_semaphores = {}
+_in_flight = {name: 0 for name in _LIMITS}
+
+# HF inference never runs on the event loop: it goes to the micro-batcher's
+# thread when batching is on, otherwise to this dedicated executor.
+_hf_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HF_EXECUTOR_WORKERS", "1")), thread_name_prefix="hf")
+
+_async_openai = None
+
+def _semaphore(provider):
+    # created lazily so they bind to the server's running loop
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(_LIMITS.get(provider, 32))
+    return _semaphores[provider]
+
+def _init_async_openai():
+    global _async_openai
+    try:
+        from openai import AsyncOpenAI
+        _async_openai = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_pool.httpx_client("openai_async", asynchronous=True),
+            timeout=http_pool.READ_TIMEOUT_S,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        )
+    except Exception:
+        _async_openai = None  # legacy SDK: fall back to the sync client on a thread
+
+async def _agenerate_openai(user_query: str) -> tuple[str, str]:
+    if _async_openai is None:
+        return await asyncio.to_thread(core._generate_openai, user_query)
+    resp = await _async_openai.chat.completions.create(
+        model=core._openai_model, temperature=0.3, max_tokens=300, messages=core._openai_messages(user_query),
+        timeout=cancellation.current().cap(http_pool.READ_TIMEOUT_S),
+    )
+    return resp.choices[0].message.content.strip(), core._openai_model
+
+async def _agenerate_gemini(user_query: str) -> tuple[str, str]:
+    model = core._gemini_model
+    if not hasattr(model, "generate_content_async"):
+        return await asyncio.to_thread(core._generate_gemini, user_query)
+    result = await model.generate_content_async(core._gemini_parts(user_query),
+                                                request_options=core.gemini_request_options())
+    return (result.text or "").strip(), core._gemini_model_name()
+
+async def _agenerate_hf(user_query: str) -> tuple[str, str]:
+    if core._hf_batcher is not None:
+        # cancelling this task cancels the Future too, so a prompt still queued never runs
+        fut = core._hf_batcher.submit(core._hf_prompt(user_query), deadline=cancellation.current())
+        text = await asyncio.wrap_future(fut)
+        metrics.record_stage("queue", fut.queue_wait_s)
+        return text, core._hf_model_name
+    loop = asyncio.get_running_loop()
+    # run_in_executor doesn't carry contextvars over; the deadline has to reach the StoppingCriteria
+    return await loop.run_in_executor(_hf_executor, contextvars.copy_context().run, core._generate_hf, user_query)
+
+async def _agenerate_with(provider: str, user_query: str) -> tuple[str, str]:
+    deadline = cancellation.current()
+    waited = time.perf_counter()
+    async with _semaphore(provider):
+        metrics.record_stage("queue", time.perf_counter() - waited)
+        _in_flight[provider] = _in_flight.get(provider, 0) + 1
+        try:
+            if provider == "openai":
+                return await _agenerate_openai(user_query)
+            elif provider == "gemini":
+                return await _agenerate_gemini(user_query)
+            elif provider == "fake":
+                return await core._fake.agenerate(user_query), core._fake.model
+            return await _agenerate_hf(user_query)
+        except Exception as e:
+            stop = cancellation.stopped(e, deadline)
+            if stop is None or stop is e:
+                raise
+            raise stop from e
+        finally:
+            _in_flight[provider] -= 1
+
+async def _agenerate(user_query: str) -> tuple[str, str, str]:
+    """(answer, model, provider that answered) via core's fallback chain."""
+    return await core.chain.acall(user_query, _agenerate_with)
+
+async def _ashared(user_query: str, key, deadline):
+    """core.inflight.do() for the event loop: ((answer, model, provider that answered), coalesced).
+
+    Shares core.inflight, so Flask and async requests in one process coalesce together.
+    """
+    while True:
+        fut, leader = core.inflight.begin(key)
+        if not leader:
+            try:
+                # shielded: a follower giving up must not cancel the leader's shared Future
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)),
+                                              timeout=deadline.remaining()), True
+            except Abandoned:
+                deadline.check()  # the leader stopped, not this request: lead a fresh call
+                continue
+        try:
+            answer, mdl, served_by = await _agenerate(user_query)
+        except BaseException as e:
+            # this request's client went away or its time ran out: that's no answer for the followers
+            own = isinstance(e, asyncio.CancelledError) or cancellation.stopped(e, deadline) is not None
+            core.inflight.finish(key, error=e, abandoned=own)
+            raise
+        core._remember_answer(user_query, key, answer, mdl, served_by)
+        core.inflight.finish(key, (answer, mdl, served_by))
+        return (answer, mdl, served_by), False
+
+# ------------------------------- Quart app ------------------------------------
+app = cors(Quart(__name__))
+if "openai" in core.PROVIDER_CHAIN:
+    _init_async_openai()
+
+@app.route("/health", methods=["GET"])
+async def health():
+    payload = core.health_payload()
+    payload["server"] = "asgi"
+    payload["concurrency"] = {
+        name: {"limit": limit, "in_flight": _in_flight.get(name, 0)} for name, limit in _LIMITS.items()
+    }
+    return jsonify(payload)
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(core.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/query", methods=["POST"])
+async def query():
+    if not core.is_ready():
+        return jsonify(core.not_ready_payload()), 503, {"Retry-After": "5"}
+    start = time.perf_counter()
+    timer = metrics.start_request()
+    deadline = cancellation.start(core.request_timeout(request))
+    with timer.stage("parse"):
+        data = await request.get_json(silent=True) or {}
+        user_query = (data.get("query") or "").strip()
+    if not user_query:
+        return jsonify({"error": "No query provided"}), 400
+
+    with timer.stage("cache"):
+        key = core.cache_key(user_query, core.provider_name, core.model_name, core.USE_SYSTEM_PROMPT)
+        cached = core._cached_answer(user_query, key)
+    coalesced = False
+    status = "ok"
+    if cached is not None:
+        answer, mdl, served_by = cached
+    else:
+        with timer.stage("provider"):
+            try:
+                ticket = await core.admission.aadmit(core.request_client(request), core.request_cost(user_query),
+                                                     max_wait_s=deadline.remaining())
+            except core.Overloaded as e:
+                payload, status, headers = core.overloaded(e)
+                return jsonify(payload), status, headers
+            timer.add("queue", ticket.waited_s)
+            with ticket:
+                try:
+                    (answer, mdl, served_by), coalesced = await _ashared(user_query, key, deadline)
+                except asyncio.CancelledError:
+                    # the client disconnected; the server cancels this task. Stop the model too, then log it.
+                    deadline.cancel()
+                    latency_ms = int((time.perf_counter() - start) * 1000)
+                    core.log_interaction(_dt.datetime.now().isoformat(timespec="seconds"), user_query,
+                                         "(cancelled) client went away", latency_ms, core.provider_name, "n/a",
+                                         coalesced=coalesced, stages=timer.ms, status="cancelled")
+                    raise
+                except Exception as e:
+                    stop = cancellation.stopped(e, deadline)
+                    status = stop.status if stop is not None else "error"
+                    answer = core.stopped_answer(stop) if stop is not None else f"(provider_error) {e}"
+                    mdl, served_by = "n/a", core.provider_name
+        timer.ms["provider"] -= timer.ms.get("queue", 0.0)
+
+    with timer.stage("post"):
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        ts = _dt.datetime.now().isoformat(timespec="seconds")
+        payload = {
+            "response": answer,
+            "latency_ms": latency_ms,
+            "timestamp": ts,
+            "provider": served_by,
+            "model": mdl,
+            "cached": cached is not None,
+            "coalesced": coalesced,
+            "status": status,
+            "use_system_prompt": core.USE_SYSTEM_PROMPT
+        }
+        body = jsonify(payload)
+    with timer.stage("log"):
+        try:
+            core.log_interaction(ts, user_query, answer, latency_ms, served_by, mdl, coalesced=coalesced,
+                                 stages=timer.ms, status=status)
+        except Exception as e:
+            print("Logging error:", repr(e))
+    core.observe_request(timer, served_by, mdl, time.perf_counter() - start, route="/query", query=user_query,
+                         status=status, cached=cached is not None, coalesced=coalesced)
+    return body, 504 if status == "timeout" else 200
+
+@app.route("/admin/clear", methods=["POST"])
+async def admin_clear():
+    stats = await asyncio.to_thread(core.clear_interactions)
+    return jsonify({"cleared": "queued", "maintenance": stats, "db_path": core.DB_PATH}), 202
+
+@app.route("/admin/search", methods=["GET"])
+async def admin_search():
+    if not core.admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    payload, status = await asyncio.to_thread(core.search_interactions, request.args)
+    return jsonify(payload), status
+
+@app.route("/admin/export", methods=["GET"])
+async def admin_export():
+    if not core.admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    try:
+        fmt, chunks = core.export_interactions(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async def body():
+        # each batch is read and encoded on a worker thread so the event loop keeps serving
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            chunks.close()
+
+    return Response(body(), mimetype=export.CONTENT_TYPES[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=interactions.{fmt}"})
+
+@app.route("/admin/profile", methods=["GET"])
+async def admin_profile():
+    if not core.admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    # sampled from a worker thread, so the event loop (and what it is busy with) shows up in the profile
+    result, status = await asyncio.to_thread(core.run_profile, request.args)
+    if status != 200 or request.args.get("format") == "json":
+        return jsonify(result), status
+    return Response(result["collapsed"] + "\n", mimetype="text/plain")
+
+@app.route("/admin/slow", methods=["GET"])
+async def admin_slow():
+    if not core.admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    return jsonify({**core.slow_requests.stats(),
+                    "traces": core.slow_requests.recent(request.args.get("limit", 50, type=int))})
+
+@app.route("/admin/stats", methods=["GET"])
+async def admin_stats():
+    stats = await asyncio.to_thread(core.interaction_stats)
+    return jsonify({**stats, "db_path": core.DB_PATH})
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
@@ -1,49 +1,83 @@
-import os
 import time
-import sqlite3
+_IMPORT_T0 = time.perf_counter()  # import-time budget is measured from here, before Flask and the rest load
+
+import os
+import atexit
+import threading
 from contextlib import closing
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
+import migrations
+import responses
+import rollups
+from db import Database
+from log_writer import BatchedLogWriter
+
 # Optional: swap to a stronger model later (e.g., OpenAI, Gemini). For now, keep it offline/demo-friendly.
-try:
-    from transformers import pipeline
-    nlp = pipeline("text-generation", model="gpt2")
-    _HAS_TRANSFORMERS = True
-except Exception:
-    _HAS_TRANSFORMERS = False
-    nlp = None
+# LAZY_STARTUP=1 loads GPT-2 on a background thread so the server binds immediately.
+LAZY_STARTUP = bool(int(os.getenv("LAZY_STARTUP", "0")))
+nlp = None
+_HAS_TRANSFORMERS = False
+_model_status = "warming"
+
+def _load_model():
+    global nlp, _HAS_TRANSFORMERS, _model_status
+    try:
+        from transformers import pipeline
+        nlp = pipeline("text-generation", model="gpt2")
+        nlp("Hello", max_length=8, num_return_sequences=1, do_sample=False)  # warm-up
+        _HAS_TRANSFORMERS = True
+        _model_status = "ready"
+    except Exception:
+        _HAS_TRANSFORMERS = False
+        nlp = None
+        _model_status = "unavailable"  # /query falls back to the demo echo
+
+if LAZY_STARTUP:
+    threading.Thread(target=_load_model, name="model-startup", daemon=True).start()
+else:
+    _load_model()
 
 DB_PATH = os.environ.get("CHATBOT_DB", "logs.db")
+DB = Database(DB_PATH)
 
 def init_db():
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS interactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ts TEXT NOT NULL,
-                query TEXT NOT NULL,
-                response TEXT NOT NULL,
-                latency_ms INTEGER NOT NULL
-            );
-        """)
-        conn.commit()
+    # same versioned schema as the main API (see migrations.py)
+    with closing(DB.connect()) as conn:
+        migrations.migrate(conn)
+
+# Inserts are batched on a background thread so requests never wait on SQLite
+_log_writer = None
+
+def start_log_writer():
+    global _log_writer
+    _log_writer = BatchedLogWriter(
+        DB.connect,
+        f"INSERT INTO interactions (ts, query, response, response_id, latency_ms, ts_epoch) "
+        f"VALUES (?, ?, '', {responses.ID_SQL}, ?, ?)",
+        max_batch=int(os.getenv("LOG_BATCH_SIZE", "100")),
+        flush_ms=float(os.getenv("LOG_FLUSH_MS", "200")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        on_full=os.getenv("LOG_QUEUE_FULL", "block").strip().lower(),
+        spill_path=os.environ.get("LOG_SPILL_PATH", DB_PATH + ".spill.jsonl"),
+        before_insert=lambda conn, rows: responses.store(conn, [r[2] for r in rows]),
+        after_insert=lambda conn, rows: rollups.apply(conn, [(r[0], r[1], r[3], None, None, ()) for r in rows]),
+    )
+    atexit.register(_log_writer.close)
 
 def log_interaction(ts, query, response, latency_ms):
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        conn.execute(
-            "INSERT INTO interactions (ts, query, response, latency_ms) VALUES (?, ?, ?, ?)",
-            (ts, query, response, latency_ms)
-        )
-        conn.commit()
+    import datetime as _dt
+    _log_writer.write((ts, query, response, latency_ms, int(_dt.datetime.fromisoformat(ts).timestamp())))
 
 app = Flask(__name__)
 CORS(app)
 init_db()
+start_log_writer()
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "status": _model_status, "import_ms": _IMPORT_MS})
 
 @app.route('/query', methods=['POST'])
 def query():
@@ -53,6 +87,8 @@ def query():
 
     if not user_query:
         return jsonify({"error": "No query provided"}), 400
+    if _model_status == "warming":
+        return jsonify({"error": "Model is not ready yet", "status": _model_status}), 503, {"Retry-After": "5"}
 
     # Generate a response (fallback to a simple echo if transformers not available)
     if _HAS_TRANSFORMERS and nlp is not None:
@@ -79,5 +115,8 @@ def query():
         "timestamp": ts
     })
 
+_IMPORT_MS = int((time.perf_counter() - _IMPORT_T0) * 1000)
+print(f"[startup] import took {_IMPORT_MS} ms")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5000")), debug=True)
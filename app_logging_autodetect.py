@@ -1,47 +1,154 @@
 import os
+import json
 import time
+
+_IMPORT_T0 = time.perf_counter()  # import-time budget is measured from here
+import atexit
+import hmac
 import sqlite3
-from flask import Flask, request, jsonify
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 
+import cancellation
+import export
+import hf_backend
+from admission import Admission, Overloaded, client_id, estimate_tokens
+from cancellation import Cancelled
+import http_pool
+import metrics
+import migrations
+from hf_batcher import MicroBatcher
+from db import Database
+from log_writer import BatchedLogWriter
+from profiler import ProfilerBusy, SamplingProfiler, SlowRequests
+from provider_chain import ProviderChain
+from maintenance import Maintenance
+import responses
+import rollups
+import search
+from response_cache import ResponseCache, cache_key
+from singleflight import SingleFlight
+
 # --------- Paths (anchor DB to this file’s folder) ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DB = os.path.join(BASE_DIR, "logs.db")
 DB_PATH = os.environ.get("CHATBOT_DB", DEFAULT_DB)
 
 # --------- DB helpers (WAL so API & dashboard don't block) ----------
+# Pooled reader/writer connections for request handlers (see db.py)
+DB = Database(DB_PATH, pool_size=int(os.getenv("DB_POOL_SIZE", "8")))
+
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
-    try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        conn.execute("PRAGMA busy_timeout=3000;")
-    except Exception:
-        pass
-    return conn
+    """Dedicated writer connection for long-lived threads (log writer, maintenance, migrations)."""
+    return DB.connect("writer")
 
 def init_db():
-    with get_conn() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS interactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ts TEXT NOT NULL,
-                query TEXT NOT NULL,
-                response TEXT NOT NULL,
-                latency_ms INTEGER NOT NULL,
-                provider TEXT,
-                model TEXT
-            );
-        """)
-        conn.commit()
-
-def log_interaction(ts, query, response, latency_ms, provider, model):
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO interactions (ts, query, response, latency_ms, provider, model) VALUES (?, ?, ?, ?, ?, ?)",
-            (ts, query, response, latency_ms, provider, model),
-        )
-        conn.commit()
+    # schema lives in migrations.py (versioned with PRAGMA user_version)
+    conn = get_conn()
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+
+# --------- Metrics (served at /metrics in Prometheus text format) ----------
+# Per-request stages; all but "log" are also stored as <stage>_ms columns in interactions.
+STAGES = ("parse", "cache", "queue", "provider", "post", "log")
+LOGGED_STAGES = STAGES[:-1]
+
+REGISTRY = metrics.Registry()
+STAGE_SECONDS = REGISTRY.register(metrics.Histogram(
+    "chatbot_stage_seconds", "Time spent per /query stage.", ("stage", "provider", "model")))
+REQUEST_SECONDS = REGISTRY.register(metrics.Histogram(
+    "chatbot_request_seconds", "End-to-end /query handling time.", ("provider", "model")))
+REQUESTS_TOTAL = REGISTRY.register(metrics.Counter(
+    "chatbot_requests_total", "Answered /query requests.", ("provider", "model")))
+LOG_BATCH_SECONDS = REGISTRY.register(metrics.Histogram(
+    "chatbot_log_batch_seconds", "Background SQLite write time per batch."))
+CANCELLED_TOTAL = REGISTRY.register(metrics.Counter(
+    "chatbot_cancelled_total", "Requests stopped by their deadline (timeout) or a client disconnect (cancelled).",
+    ("status",)))
+
+def observe_request(timer, provider, model, total_s, **trace):
+    """Per-stage metrics; a request over SLOW_REQUEST_MS also leaves a trace (`trace` adds route, query, status...)."""
+    for stage, ms in timer.ms.items():
+        STAGE_SECONDS.observe(ms / 1000.0, stage, provider, model)
+    REQUEST_SECONDS.observe(total_s, provider, model)
+    REQUESTS_TOTAL.inc(provider, model)
+    if slow_requests.wants(total_s):
+        slow_requests.add(timer, total_s, provider=provider, model=model, **trace)
+
+# --------- Profiling (admin only, see profiler.py) ----------
+# /admin/profile samples every thread for a few seconds; nothing runs in between
+sampler = SamplingProfiler(max_seconds=float(os.getenv("PROFILE_MAX_S", "60")))
+# Per-stage traces of /query calls slower than SLOW_REQUEST_MS (0 = off), newest SLOW_REQUEST_RING kept
+slow_requests = SlowRequests(float(os.getenv("SLOW_REQUEST_MS", "2000")), int(os.getenv("SLOW_REQUEST_RING", "200")))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def admin_allowed(req) -> bool:
+    """Profiles, traces and the log itself are sensitive: callers need ADMIN_TOKEN, or to be local when it's unset."""
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(req.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+    return req.remote_addr in ("127.0.0.1", "::1")
+
+# Rows are queued and written in batches by a background thread (see log_writer.py)
+_log_writer = None
+
+def start_log_writer():
+    global _log_writer
+    _log_writer = BatchedLogWriter(
+        get_conn,
+        # the answer goes to `responses` (before_insert) and the row keeps only its id (see responses.py)
+        "INSERT INTO interactions (ts, query, response, response_id, latency_ms, provider, model, ttft_ms, coalesced, "
+        + ", ".join(f"{stage}_ms" for stage in LOGGED_STAGES)
+        + f", ts_epoch, status) VALUES (?, ?, '', {responses.ID_SQL}, "
+        + ", ".join("?" * (7 + len(LOGGED_STAGES))) + ")",
+        max_batch=int(os.getenv("LOG_BATCH_SIZE", "100")),
+        flush_ms=float(os.getenv("LOG_FLUSH_MS", "200")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        on_full=os.getenv("LOG_QUEUE_FULL", "block").strip().lower(),
+        spill_path=os.environ.get("LOG_SPILL_PATH", DB_PATH + ".spill.jsonl"),
+        on_batch=lambda seconds, rows: LOG_BATCH_SECONDS.observe(seconds),
+        before_insert=lambda conn, rows: responses.store(conn, [r[2] for r in rows]),
+        # rows are (ts, query, response, latency_ms, provider, model, ttft_ms, coalesced, <stage>_ms..., ts_epoch, status)
+        after_insert=lambda conn, rows: rollups.apply(
+            conn, [(r[0], r[1], r[3], r[4], r[5], r[8:8 + len(LOGGED_STAGES)]) for r in rows]),
+    )
+    atexit.register(_log_writer.close)
+    REGISTRY.register(metrics.Gauge(
+        "chatbot_log_queue_depth", "Rows waiting for the background log writer.",
+        lambda: _log_writer.stats()["queue_depth"]))
+
+def log_interaction(ts, query, response, latency_ms, provider, model, ttft_ms=None, coalesced=False, stages=None,
+                    status="ok"):
+    # non-streamed answers reach the client all at once, so first token == full latency
+    ttft_ms = latency_ms if ttft_ms is None else ttft_ms
+    stages = stages or {}
+    if status in ("timeout", "cancelled"):
+        CANCELLED_TOTAL.inc(status)
+    _log_writer.write(
+        (ts, query, response, latency_ms, provider, model, ttft_ms, int(coalesced))
+        + tuple(round(stages[s], 3) if s in stages else None for s in LOGGED_STAGES)
+        + (epoch_of(ts), status)
+    )
+
+def epoch_of(ts):
+    import datetime as _dt
+    return int(_dt.datetime.fromisoformat(ts).timestamp())
+
+# Clear and retention run on a background thread in small chunks (see maintenance.py)
+maintenance = None
+
+def start_maintenance():
+    global maintenance
+    maintenance = Maintenance(
+        get_conn,
+        retention_days=float(os.getenv("RETENTION_DAYS", "0")),
+        interval_s=float(os.getenv("RETENTION_INTERVAL_S", "3600")),
+        chunk=int(os.getenv("RETENTION_CHUNK", "1000")),
+        pause_ms=float(os.getenv("RETENTION_PAUSE_MS", "20")),
+    ).start()
 
 # --------- Provider auto-detect (prefers Gemini if a key is present) ----------
 def detect_provider():
@@ -60,15 +167,49 @@ except Exception:
 
 PROVIDER = (os.environ.get("PROVIDER") or "").strip().lower() or detect_provider()
 
+PROVIDERS = ("openai", "gemini", "hf", "fake")
+
+def parse_provider_chain(value, default):
+    """"gemini, openai" -> ["gemini", "openai"]; [default] when empty. Unknown names raise ValueError."""
+    chain = [p.strip() for p in (value or "").lower().split(",") if p.strip()]
+    unknown = [p for p in chain if p not in PROVIDERS]
+    if unknown:
+        # a typo must not quietly turn into a local GPT-2 in place of the fallback that was asked for
+        raise ValueError(f"PROVIDER_CHAIN: unknown provider(s) {', '.join(unknown)} (use {', '.join(PROVIDERS)})")
+    return chain or [default]
+
+# Ordered fallback chain, e.g. PROVIDER_CHAIN=gemini,openai,hf (default: just PROVIDER)
+PROVIDER_CHAIN = parse_provider_chain(os.environ.get("PROVIDER_CHAIN"), PROVIDER if PROVIDER in PROVIDERS else "hf")
+
 # ------------------------------- Models ---------------------------------------
 _openai_client = None
+_openai_http = None
 _openai_model = None
 _gemini_model = None
 _hf_pipe = None
 _hf_model_name = None
+_hf_batcher = None
+_fake = None
+
+# HF micro-batching: concurrent /query prompts share one forward pass (HF_BATCH_MAX<=1 disables)
+HF_BATCH_MAX = int(os.getenv("HF_BATCH_MAX", "8"))
+HF_BATCH_WINDOW_MS = float(os.getenv("HF_BATCH_WINDOW_MS", "10"))
+
+# CPU inference backend for the local model: pytorch | int8 | onnx | onnx-int8 (see hf_backend.py)
+HF_BACKEND = os.getenv("HF_BACKEND", "pytorch").strip().lower()
+HF_INTRA_OP_THREADS = int(os.getenv("HF_INTRA_OP_THREADS", "0"))
+HF_INTER_OP_THREADS = int(os.getenv("HF_INTER_OP_THREADS", "0"))
+HF_ONNX_DIR = os.getenv("HF_ONNX_DIR", hf_backend.DEFAULT_ONNX_DIR)
+
+# Socket of a shared model_server.py process; set it to keep one model copy for all gunicorn workers
+HF_MODEL_SERVER = os.getenv("HF_MODEL_SERVER", "").strip()
+HF_MODEL_SERVER_SPAWN = bool(int(os.getenv("HF_MODEL_SERVER_SPAWN", "1")))
 
 USE_SYSTEM_PROMPT = not bool(int(os.getenv("DISABLE_SYSTEM_PROMPT", "0")))
 
+# Open provider connections during startup instead of on the first query
+HTTP_PREWARM = bool(int(os.getenv("HTTP_PREWARM", "1")))
+
 def _system_prompt():
     return (
         "You are a concise developer support assistant. "
@@ -76,17 +217,27 @@ def _system_prompt():
     )
 
 def _init_openai():
-    global _openai_client, _openai_model
+    global _openai_client, _openai_model, _openai_http
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is required for OpenAI provider")
     try:
         from openai import OpenAI
-        _openai_client = OpenAI(api_key=api_key)
+        # one keep-alive pool for every call; the SDK's own default would be per-client too,
+        # but with httpx's 5 s idle expiry and a 600 s timeout
+        _openai_http = http_pool.httpx_client("openai")
+        _openai_client = OpenAI(
+            api_key=api_key,
+            http_client=_openai_http,
+            timeout=http_pool.READ_TIMEOUT_S,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        )
         _openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     except Exception:
         import openai
         openai.api_key = api_key
+        # legacy SDK: route its requests through a pooled session instead of per-call connections
+        openai.requestssession = http_pool.requests_session("openai", pool_size=http_pool.POOL_SIZE)
         _openai_client = openai
         _openai_model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     return "openai", _openai_model
@@ -103,142 +254,757 @@ def _init_gemini():
     return "gemini", model_name
 
 def _init_hf():
-    global _hf_pipe, _hf_model_name
-    candidates = [
-        ("text2text-generation", "google/flan-t5-base"),
-        ("text2text-generation", "google/flan-t5-small"),
-        ("text-generation", "gpt2"),
-    ]
-    last_err = None
-    for task, name in candidates:
-        try:
-            from transformers import pipeline
-            _hf_pipe = pipeline(task, model=name)
-            _hf_model_name = name
-            return "hf", name
-        except Exception as e:
-            last_err = e
-    raise RuntimeError(f"HF init failed: {last_err}")
+    global _hf_pipe, _hf_model_name, _hf_batcher
+    if HF_MODEL_SERVER:
+        # the model lives in model_server.py; this worker only holds a socket
+        from model_server import ModelClient
+        client = ModelClient(HF_MODEL_SERVER, spawn=HF_MODEL_SERVER_SPAWN)
+        health = client.wait_ready()
+        _hf_batcher, _hf_model_name = client, health["model"]
+        _startup["hf_backend"] = health.get("hf_backend")
+        return "hf", _hf_model_name
+    _hf_pipe, _hf_model_name, info = hf_backend.load_first(
+        HF_BACKEND, HF_ONNX_DIR, intra=HF_INTRA_OP_THREADS, inter=HF_INTER_OP_THREADS)
+    _startup.update(info)
+    _init_hf_batcher()
+    return "hf", _hf_model_name
+
+def _init_hf_batcher():
+    global _hf_batcher
+    if HF_BATCH_MAX <= 1:
+        return
+    hf_backend.prepare_for_batching(_hf_pipe)
+    _hf_batcher = MicroBatcher(_hf_run_batch, max_batch=HF_BATCH_MAX, window_ms=HF_BATCH_WINDOW_MS)
+    REGISTRY.register(metrics.Gauge(
+        "chatbot_hf_batch_queue_depth", "Prompts waiting for an HF batch.", lambda: _hf_batcher.stats()["queue_depth"]))
+
+def _init_fake():
+    # PROVIDER=fake: deterministic canned answers for benchmarks (see fake_provider.py)
+    global _fake
+    from fake_provider import FakeProvider
+    _fake = FakeProvider(
+        dist=os.getenv("FAKE_LATENCY_DIST", "lognormal"),
+        latency_ms=float(os.getenv("FAKE_LATENCY_MS", "200")),
+        spread_ms=float(os.getenv("FAKE_LATENCY_SPREAD_MS", "50")),
+        output_tokens=int(os.getenv("FAKE_OUTPUT_TOKENS", "120")),
+        seed=int(os.getenv("FAKE_SEED", "0")),
+    )
+    return "fake", _fake.model
+
+chain = None
+_chain_models = {}
+
+def _chain_timeout(name):
+    # a lone provider has nothing to fall back to, so it isn't cut off unless asked
+    default = "30" if len(PROVIDER_CHAIN) > 1 else "0"
+    return float(os.getenv(f"{name.upper()}_TIMEOUT_S", os.getenv("PROVIDER_TIMEOUT_S", default)))
 
 def _ensure_provider():
-    if PROVIDER == "openai":
-        return _init_openai()
-    elif PROVIDER == "gemini":
-        return _init_gemini()
-    else:
-        return _init_hf()
+    """Initializes every provider in PROVIDER_CHAIN; returns (name, model) of the first one that starts."""
+    global chain
+    inits = {"openai": _init_openai, "gemini": _init_gemini, "fake": _init_fake, "hf": _init_hf}
+    errors = {}
+    for name in dict.fromkeys(PROVIDER_CHAIN):
+        try:
+            _chain_models[name] = inits[name]()[1]
+        except Exception as e:
+            errors[name] = repr(e)
+            print(f"Provider {name} init failed:", repr(e))
+    _startup["provider_errors"] = errors
+    if not _chain_models:
+        raise RuntimeError(f"no provider in {PROVIDER_CHAIN} could start: {errors}")
+    chain = ProviderChain(
+        list(_chain_models),
+        timeouts={n: _chain_timeout(n) for n in _chain_models},
+        hedge=bool(int(os.getenv("PROVIDER_HEDGE", "0"))),
+        hedge_min_ms=float(os.getenv("HEDGE_MIN_MS", "50")),
+        min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+        failures=int(os.getenv("BREAKER_FAILURES", "5")),
+        cooldown_s=float(os.getenv("BREAKER_COOLDOWN_S", "30")),
+    )
+    primary = next(iter(_chain_models))
+    return primary, _chain_models[primary]
 
-def _generate_openai(user_query: str) -> tuple[str, str]:
+def _openai_messages(user_query: str) -> list[dict]:
     messages = [{"role": "user", "content": user_query}]
     if USE_SYSTEM_PROMPT:
         messages.insert(0, {"role": "system", "content": _system_prompt()})
+    return messages
+
+def _gemini_parts(user_query: str) -> list[str]:
+    return [_system_prompt(), user_query] if USE_SYSTEM_PROMPT else [user_query]
+
+def gemini_request_options() -> dict:
+    # the SDK talks gRPC over one long-lived HTTP/2 channel; only the deadline needs setting
+    return {"timeout": cancellation.current().cap(http_pool.READ_TIMEOUT_S)}
+
+def _gemini_model_name() -> str:
+    return os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+def _generate_openai(user_query: str) -> tuple[str, str]:
+    messages = _openai_messages(user_query)
+    timeout = cancellation.current().cap(http_pool.READ_TIMEOUT_S)
     try:
         resp = _openai_client.chat.completions.create(
-            model=_openai_model, temperature=0.3, max_tokens=300, messages=messages
+            model=_openai_model, temperature=0.3, max_tokens=300, messages=messages, timeout=timeout
         )
         text = resp.choices[0].message.content.strip()
     except Exception:
         resp = _openai_client.ChatCompletion.create(
-            model=_openai_model, temperature=0.3, max_tokens=300, messages=messages
+            model=_openai_model, temperature=0.3, max_tokens=300, messages=messages,
+            request_timeout=timeout,
         )
         text = resp["choices"][0]["message"]["content"].strip()
     return text, _openai_model
 
 def _generate_gemini(user_query: str) -> tuple[str, str]:
-    if USE_SYSTEM_PROMPT:
-        parts = [_system_prompt(), user_query]
-    else:
-        parts = [user_query]
-    result = _gemini_model.generate_content(parts)
+    result = _gemini_model.generate_content(_gemini_parts(user_query), request_options=gemini_request_options())
     text = (result.text or "").strip()
-    return text, os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    return text, _gemini_model_name()
+
+def _hf_prompt(user_query: str) -> str:
+    return f"{_system_prompt()}\n\nUser: {user_query}\nAssistant:" if USE_SYSTEM_PROMPT else user_query
+
+def _hf_run_batch(prompts: list[str], should_stop=None) -> list[str]:
+    return hf_backend.run_batch(_hf_pipe, prompts, should_stop)
 
 def _generate_hf(user_query: str) -> tuple[str, str]:
-    task = getattr(_hf_pipe, "task", "")
-    prompt = f"{_system_prompt()}\n\nUser: {user_query}\nAssistant:" if USE_SYSTEM_PROMPT else user_query
-    if task == "text2text-generation":
-        out = _hf_pipe(prompt, max_new_tokens=220)
-        text = out[0]["generated_text"].strip()
+    prompt = _hf_prompt(user_query)
+    deadline = cancellation.current()
+    if _hf_batcher is not None:
+        fut = _hf_batcher.submit(prompt, deadline=deadline)
+        try:
+            # the batch may keep going for other requests; this one stops waiting at its deadline
+            text = fut.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            deadline.check()
+            raise
+        metrics.record_stage("queue", fut.queue_wait_s)
     else:
-        out = _hf_pipe(
-            prompt,
-            max_new_tokens=220,
-            do_sample=False,
-            repetition_penalty=1.2,
-            no_repeat_ngram_size=3,
-            return_full_text=False,
-        )
-        text = out[0]["generated_text"].strip()
+        text = _hf_run_batch([prompt], should_stop=deadline.expired)[0]
+        deadline.check()  # generation was cut short: don't pass off a truncated answer
     return text, _hf_model_name
 
+def _generate_with(name: str, user_query: str) -> tuple[str, str]:
+    deadline = cancellation.current()
+    try:
+        if name == "openai":
+            return _generate_openai(user_query)
+        elif name == "gemini":
+            return _generate_gemini(user_query)
+        elif name == "fake":
+            return _fake.generate(user_query, deadline), _fake.model
+        return _generate_hf(user_query)
+    except Exception as e:
+        stop = cancellation.stopped(e, deadline)
+        if stop is None or stop is e:
+            raise
+        raise stop from e
+
+def _generate_provider(user_query: str) -> tuple[str, str, str]:
+    """(answer, model, provider that answered) via the fallback chain."""
+    return chain.call(user_query, _generate_with)
+
+# ------------------------------- Streaming -------------------------------------
+# Each _stream_* returns (iterator of text chunks, model name).
+# Chunks are checked against the request's deadline; stopping early closes the provider's stream.
+def _stream_openai(user_query: str):
+    deadline = cancellation.current()
+    kwargs = dict(model=_openai_model, temperature=0.3, max_tokens=300, messages=_openai_messages(user_query), stream=True)
+    timeout = deadline.cap(http_pool.READ_TIMEOUT_S)
+
+    def chunks():
+        try:
+            stream = _openai_client.chat.completions.create(**kwargs, timeout=timeout)
+        except AttributeError:
+            for chunk in _openai_client.ChatCompletion.create(**kwargs, request_timeout=timeout):
+                deadline.check()
+                piece = chunk["choices"][0]["delta"].get("content")
+                if piece:
+                    yield piece
+            return
+        try:
+            for chunk in stream:
+                deadline.check()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()  # drops the HTTP response; OpenAI stops generating
+
+    return chunks(), _openai_model
+
+def _stream_gemini(user_query: str):
+    deadline = cancellation.current()
+
+    def chunks():
+        for chunk in _gemini_model.generate_content(_gemini_parts(user_query), stream=True,
+                                                    request_options=gemini_request_options()):
+            deadline.check()
+            if chunk.text:
+                yield chunk.text
+
+    return chunks(), _gemini_model_name()
+
+def _stream_hf(user_query: str):
+    prompt = _hf_prompt(user_query)
+    deadline = cancellation.current()
+    if HF_MODEL_SERVER:
+        return _hf_batcher.stream(prompt, deadline), _hf_model_name
+
+    def chunks():
+        yield from hf_backend.stream(_hf_pipe, prompt, should_stop=deadline.expired)
+        deadline.check()
+
+    return chunks(), _hf_model_name
+
+def _stream_with(name: str, user_query: str):
+    if name == "openai":
+        return _stream_openai(user_query)
+    elif name == "gemini":
+        return _stream_gemini(user_query)
+    elif name == "fake":
+        return _fake.stream(user_query, cancellation.current()), _fake.model
+    return _stream_hf(user_query)
+
+def _stream_provider(user_query: str):
+    """(chunks, model, provider); falls back along the chain until one produces a token."""
+    return chain.stream(user_query, _stream_with)
+
+# ------------------------------- Startup ---------------------------------------
+# LAZY_STARTUP=1 binds the server right away and loads the provider on a background
+# thread; /health reports "warming" until a warm-up inference has run, and /query
+# answers 503 until then.
+LAZY_STARTUP = bool(int(os.getenv("LAZY_STARTUP", "0")))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "2000"))
+
+_startup = {"status": "starting", "import_ms": None, "provider_init_ms": None, "warmup_ms": None,
+            "ready_ms": None, "error": None, "provider_errors": {}}
+provider_name = PROVIDER_CHAIN[0]
+model_name = None
+
+def _warm_up():
+    # only the local model: a warm-up call to a remote API would cost money
+    if "hf" in _chain_models and not HF_MODEL_SERVER:  # the model server warms itself up
+        _hf_run_batch(["Hello"])
+    if "openai" in _chain_models and HTTP_PREWARM:
+        _prewarm_openai()
+
+def _prewarm_openai():
+    # open the TCP + TLS connection now so the first query doesn't pay for it;
+    # an unauthenticated GET is enough (the 401 is ignored, nothing is billed)
+    if _openai_http is None:
+        return
+    try:
+        _openai_http.get(str(_openai_client.base_url))
+    except Exception as e:
+        print("OpenAI prewarm error:", repr(e))
+
+def _start_provider():
+    global provider_name, model_name
+    t0 = time.perf_counter()
+    _startup["status"] = "warming"
+    try:
+        provider_name, model_name = _ensure_provider()
+        _startup["provider_init_ms"] = int((time.perf_counter() - t0) * 1000)
+        t1 = time.perf_counter()
+        _warm_up()
+        _startup["warmup_ms"] = int((time.perf_counter() - t1) * 1000)
+        _init_semantic_cache()
+    except Exception as e:
+        _startup["status"], _startup["error"] = "failed", repr(e)
+        print("Provider startup failed:", repr(e))
+        raise
+    _startup["ready_ms"] = int((time.perf_counter() - _IMPORT_T0) * 1000)
+    _startup["status"] = "ready"
+    print(f"[startup] {provider_name}/{model_name} ready after {_startup['ready_ms']} ms")
+
+def is_ready() -> bool:
+    return _startup["status"] == "ready"
+
+def not_ready_payload() -> dict:
+    return {"error": "Model is not ready yet", "status": _startup["status"], "detail": _startup["error"]}
+
 # ------------------------------- Flask app ------------------------------------
 app = Flask(__name__)
 CORS(app)
-provider_name, model_name = _ensure_provider()
 init_db()
+start_log_writer()
+start_maintenance()
 
-@app.route("/health", methods=["GET"])
-def health():
+# Exact-match answer cache (RESPONSE_CACHE_SIZE=0 disables; RESPONSE_CACHE_SQLITE=1 persists in DB_PATH)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_s=float(os.getenv("RESPONSE_CACHE_TTL_S", "3600")),
+    connect=DB.writer if bool(int(os.getenv("RESPONSE_CACHE_SQLITE", "0"))) else None,
+)
+
+# Opt-in semantic cache for near-duplicate questions (SEMANTIC_CACHE=1); matrix persists next to the DB
+semantic_cache = None
+
+def _init_semantic_cache():
+    # scoped to the model, so it's built once the provider has picked one
+    global semantic_cache
+    if not bool(int(os.getenv("SEMANTIC_CACHE", "0"))):
+        return
+    from semantic_cache import SemanticCache, make_embedder
+    semantic_cache = SemanticCache(
+        make_embedder(os.getenv("SEMANTIC_CACHE_MODEL"), dim=int(os.getenv("SEMANTIC_CACHE_DIM", "256"))),
+        scope=f"{provider_name}|{model_name}|{int(USE_SYSTEM_PROMPT)}",
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000")),
+        path=os.path.splitext(DB_PATH)[0] + ".semantic.npz",
+    )
+    atexit.register(semantic_cache.save)
+
+# Identical queries already in flight wait on that call instead of starting their own
+inflight = SingleFlight()
+
+# Admission control for provider work (cache hits skip it); 0 disables a limit.
+# A local model saturates the CPU long before a remote API does, so its default cap is lower.
+_default_concurrency = 2 * max(1, HF_BATCH_MAX) if PROVIDER_CHAIN[0] == "hf" else 256
+admission = Admission(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_REQUESTS", str(_default_concurrency))),
+    max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", str(4 * _default_concurrency))),
+    queue_timeout_s=float(os.getenv("QUEUE_TIMEOUT_S", "5")),
+    client_tokens_per_min=int(os.getenv("CLIENT_TOKENS_PER_MIN", "0")),
+    client_burst=int(os.getenv("CLIENT_TOKEN_BURST", "0")),
+    global_tokens_per_min=int(os.getenv("GLOBAL_TOKENS_PER_MIN", "0")),
+)
+# Only trust X-Forwarded-For behind a proxy that sets it; clients can forge it otherwise
+TRUST_PROXY = bool(int(os.getenv("TRUST_PROXY", "0")))
+# X-API-Key values that get their own token budget (comma-separated); any other key counts as its address
+API_KEYS = frozenset(k.strip() for k in os.getenv("API_KEYS", "").split(",") if k.strip())
+REJECTED_TOTAL = REGISTRY.register(metrics.Counter(
+    "chatbot_rejected_total", "Requests turned away by admission control.", ("reason",)))
+REGISTRY.register(metrics.Gauge(
+    "chatbot_admission_queue_depth", "Requests waiting for a provider slot.", lambda: admission.stats()["queue_depth"]))
+
+# Per-request deadline: the X-Request-Timeout header (seconds, capped at REQUEST_TIMEOUT_MAX_S),
+# else REQUEST_TIMEOUT_S; 0 = none. Providers stop generating once it passes (see cancellation.py).
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "60"))
+REQUEST_TIMEOUT_MAX_S = float(os.getenv("REQUEST_TIMEOUT_MAX_S", "300"))
+
+def request_timeout(req) -> float:
+    try:
+        asked = float(req.headers.get("X-Request-Timeout") or 0)
+    except ValueError:
+        asked = 0.0
+    if asked <= 0:
+        return REQUEST_TIMEOUT_S
+    return min(asked, REQUEST_TIMEOUT_MAX_S) if REQUEST_TIMEOUT_MAX_S > 0 else asked
+
+def stopped_answer(e: Cancelled) -> str:
+    return f"({e.status}) {e}"
+
+def request_client(req) -> str:
+    forwarded = req.headers.get("X-Forwarded-For") if TRUST_PROXY else None
+    # an unchecked key would let a caller rotate it for a fresh budget (and push real clients out of the LRU)
+    key = req.headers.get("X-API-Key")
+    return client_id(key if key in API_KEYS else None, req.remote_addr, forwarded)
+
+def request_cost(user_query) -> int:
+    # prompt estimate + the answer budget the providers are called with (max_new_tokens / max_tokens)
+    return estimate_tokens(user_query, 220 if provider_name == "hf" else 300)
+
+def overloaded(e: Overloaded):
+    """(payload, status, headers) for a rejected request."""
+    REJECTED_TOTAL.inc(e.reason)
+    return {"error": e.reason, "retry_after_s": e.retry_after_s}, e.status, {"Retry-After": str(e.retry_after_s)}
+
+def _cached_answer(user_query, key):
+    """Returns (answer, model, served_by) from the exact or semantic cache, else None."""
+    cached = response_cache.get(key)
+    if cached is not None:
+        # logged as "cache:<provider that answered>" so the dashboard can compare hit vs. miss latency;
+        # rows cached before answers were tagged have no provider and came from the primary
+        return cached[0], cached[1], f"cache:{cached[2] if len(cached) > 2 and cached[2] else provider_name}"
+    if semantic_cache is not None:
+        similar = semantic_cache.get(user_query)
+        if similar is not None:
+            return similar[0], similar[1], f"semantic:{provider_name}"
+    return None
+
+def _remember_answer(user_query, key, answer, mdl, served_by):
+    # tagged with the provider that answered, so a fallback's answer is never passed off as the primary's
+    response_cache.put(key, (answer, mdl, served_by))
+    # the semantic cache is scoped to the primary provider and model; a fallback's answers stay out of it
+    if semantic_cache is not None and served_by == provider_name:
+        semantic_cache.put(user_query, (answer, mdl))
+
+def _generate_and_remember(user_query, key):
+    # cache before the single-flight call completes so late arrivals hit the cache
+    answer, mdl, served_by = _generate_provider(user_query)
+    _remember_answer(user_query, key, answer, mdl, served_by)
+    return answer, mdl, served_by
+
+# Shared with the async entry point (app_async.py)
+def health_payload() -> dict:
     # show db path too for sanity
-    return jsonify({
+    return {
         "ok": True,
+        "status": _startup["status"],
+        "startup": dict(_startup),
         "provider": provider_name,
         "model": model_name,
         "use_system_prompt": USE_SYSTEM_PROMPT,
         "db_path": DB_PATH,
-    })
+        "db_pool": DB.stats(),
+        "hf_batching": _hf_batcher.stats() if _hf_batcher is not None and not HF_MODEL_SERVER else None,
+        "model_server": _hf_batcher.stats() if HF_MODEL_SERVER and _hf_batcher is not None else None,
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "log_writer": _log_writer.stats(),
+        "single_flight": inflight.stats(),
+        "admission": admission.stats(),
+        "http": http_pool.stats(),
+        "providers": chain.stats() if chain is not None else {"order": PROVIDER_CHAIN},
+        "maintenance": maintenance.stats(),
+        "profiler": sampler.stats(),
+        "slow_requests": slow_requests.stats(),
+    }
+
+def clear_interactions(wait=False):
+    """Queues a background clear of every row logged so far; `wait=True` blocks until it is done."""
+    _log_writer.flush(timeout=5)
+    done = maintenance.clear()
+    if wait:
+        done.wait()
+    return maintenance.stats()
+
+def count_interactions() -> int:
+    """Rows in interactions now (retention may have deleted older ones)."""
+    with DB.reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM interactions;").fetchone()[0]
+
+def interaction_stats(top=5) -> dict:
+    """All-time totals from the rollup tables, plus the rows still in interactions (`rows`)."""
+    import datetime as _dt
+    _log_writer.flush(timeout=5)
+    since = (_dt.datetime.now() - _dt.timedelta(hours=1)).isoformat(timespec="minutes")
+    with DB.reader() as conn:
+        stats = rollups.summary(conn, since_minute=since, top=top)
+    # one index scan; everything else here costs the same at any size
+    return {"rows": count_interactions(), **stats}
+
+def search_interactions(args) -> tuple:
+    """/admin/search?q=...&limit=20&offset=0&provider=&mode=all|any&sort=rank|recent&raw=0 -> (payload, status)."""
+    try:
+        with DB.reader() as conn:
+            return search.search(
+                conn, args.get("q", ""),
+                limit=int(args.get("limit", 20)), offset=int(args.get("offset", 0)),
+                provider=args.get("provider") or None, mode=args.get("mode", "all"),
+                raw=args.get("raw") in ("1", "true"), sort=args.get("sort", "rank"),
+            ), 200
+    except (ValueError, sqlite3.OperationalError) as e:
+        # bad paging numbers or invalid FTS5 syntax with raw=1
+        return {"error": str(e), "q": args.get("q", "")}, 400
+
+def export_interactions(args):
+    """Validates /admin/export params -> (fmt, chunk iterator) or raises ValueError.
+
+    The iterator borrows a pooled reader and returns it when the stream ends or the client goes away.
+    """
+    fmt = args.get("format", "ndjson")
+    if fmt not in export.CONTENT_TYPES:
+        raise ValueError(f"format must be one of {', '.join(export.CONTENT_TYPES)} (Parquet: python export.py --format parquet)")
+    batch = int(args.get("batch", 5000))
+    if batch < 1:
+        raise ValueError("batch must be a positive number of rows")
+    filters = dict(
+        batch=min(batch, 50000),
+        after_id=int(args.get("after_id", 0)),
+        since=export.to_epoch(args.get("since")),
+        until=export.to_epoch(args.get("until")),
+        provider=args.get("provider") or None,
+        model=args.get("model") or None,
+        limit=int(args["limit"]) if args.get("limit") else None,
+    )
+
+    def chunks():
+        with DB.reader() as conn:
+            yield from export.stream(conn, fmt, **filters)
+    return fmt, chunks()
+
+def run_profile(args) -> tuple:
+    """/admin/profile?seconds=10&interval_ms=10&idle=0&lines=0&target=worker|model_server -> (result, status).
+
+    Blocks for `seconds`. target=model_server profiles the shared model process (HF_MODEL_SERVER) instead.
+    """
+    try:
+        opts = dict(seconds=float(args.get("seconds", 10)), interval_ms=float(args.get("interval_ms", 10)),
+                    idle=args.get("idle") in ("1", "true"), lines=args.get("lines") in ("1", "true"))
+        target = args.get("target", "worker")
+        if target not in ("worker", "model_server"):
+            raise ValueError("target must be worker or model_server")
+        if target == "model_server" and not (HF_MODEL_SERVER and _hf_batcher is not None):
+            raise ValueError("no model server in use (HF_MODEL_SERVER is unset or not connected yet)")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        if target == "model_server":
+            return _hf_batcher.profile(**opts), 200
+        return sampler.profile(**opts), 200
+    except ProfilerBusy as e:
+        return {"error": str(e)}, 409
+    except Exception as e:
+        print("Profile error:", repr(e))
+        return {"error": repr(e)}, 502
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify(health_payload())
+
+def _not_ready():
+    return jsonify(not_ready_payload()), 503, {"Retry-After": "5"}
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/query", methods=["POST"])
 def query():
     import datetime as _dt
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return query_stream()
+    if not is_ready():
+        return _not_ready()
     start = time.perf_counter()
-    data = request.get_json(silent=True) or {}
-    user_query = (data.get("query") or "").strip()
+    timer = metrics.start_request()
+    deadline = cancellation.start(request_timeout(request))
+    with timer.stage("parse"):
+        data = request.get_json(silent=True) or {}
+        user_query = (data.get("query") or "").strip()
     if not user_query:
         return jsonify({"error": "No query provided"}), 400
 
-    try:
-        if provider_name == "openai":
-            answer, mdl = _generate_openai(user_query)
-        elif provider_name == "gemini":
-            answer, mdl = _generate_gemini(user_query)
+    with timer.stage("cache"):
+        key = cache_key(user_query, provider_name, model_name, USE_SYSTEM_PROMPT)
+        cached = _cached_answer(user_query, key)
+    coalesced = False
+    status = "ok"
+    if cached is not None:
+        answer, mdl, served_by = cached
+    else:
+        with timer.stage("provider"):
+            try:
+                ticket = admission.admit(request_client(request), request_cost(user_query),
+                                         max_wait_s=deadline.remaining())
+            except Overloaded as e:
+                payload, status, headers = overloaded(e)
+                return jsonify(payload), status, headers
+            timer.add("queue", ticket.waited_s)
+            with ticket:
+                try:
+                    # served_by is whichever provider in the chain actually answered. A leader stopped by its
+                    # own deadline hands the call to a waiting request with time left instead of failing it.
+                    (answer, mdl, served_by), coalesced = inflight.do(
+                        key, lambda: _generate_and_remember(user_query, key), timeout=deadline.remaining(),
+                        abandoned=lambda e: cancellation.stopped(e, deadline) is not None)
+                except Exception as e:
+                    # includes giving up on an identical in-flight request that outlived this deadline
+                    stop = cancellation.stopped(e, deadline)
+                    status = stop.status if stop is not None else "error"
+                    answer = stopped_answer(stop) if stop is not None else f"(provider_error) {e}"
+                    mdl, served_by = "n/a", provider_name
+        # admission and batch queue waits are recorded as "queue"; don't count them twice
+        timer.ms["provider"] -= timer.ms.get("queue", 0.0)
+
+    with timer.stage("post"):
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        ts = _dt.datetime.now().isoformat(timespec="seconds")
+        payload = {
+            "response": answer,
+            "latency_ms": latency_ms,
+            "timestamp": ts,
+            "provider": served_by,
+            "model": mdl,
+            "cached": cached is not None,
+            "coalesced": coalesced,
+            "status": status,
+            "use_system_prompt": USE_SYSTEM_PROMPT
+        }
+        body = jsonify(payload)
+    with timer.stage("log"):
+        try:
+            log_interaction(ts, user_query, answer, latency_ms, served_by, mdl, coalesced=coalesced, stages=timer.ms,
+                            status=status)
+        except Exception as e:
+            print("Logging error:", repr(e))
+    observe_request(timer, served_by, mdl, time.perf_counter() - start, route="/query", query=user_query,
+                    status=status, cached=cached is not None, coalesced=coalesced)
+    return body, 504 if status == "timeout" else 200
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# Same as /query, but relays the answer as Server-Sent Events while it is generated:
+#   event: token  data: {"text": "..."}   (repeated)
+#   event: done   data: {latency_ms, ttft_ms, timestamp, provider, model, cached, status}
+#   event: error  data: {"error": "...", "status"}  (provider failure or deadline; "done" still follows)
+# A client that disconnects mid-answer stops generation; the row is logged with status "cancelled".
+@app.route("/query/stream", methods=["POST"])
+def query_stream():
+    import datetime as _dt
+    if not is_ready():
+        return _not_ready()
+    start = time.perf_counter()
+    timer = metrics.start_request()
+    deadline = cancellation.start(request_timeout(request))
+    with timer.stage("parse"):
+        data = request.get_json(silent=True) or {}
+        user_query = (data.get("query") or "").strip()
+    if not user_query:
+        return jsonify({"error": "No query provided"}), 400
+
+    with timer.stage("cache"):
+        key = cache_key(user_query, provider_name, model_name, USE_SYSTEM_PROMPT)
+        cached = _cached_answer(user_query, key)
+    ticket = None
+    if cached is None:
+        try:
+            ticket = admission.admit(request_client(request), request_cost(user_query),
+                                     max_wait_s=deadline.remaining())
+        except Overloaded as e:
+            payload, status, headers = overloaded(e)
+            return jsonify(payload), status, headers
+        timer.add("queue", ticket.waited_s)
+
+    def finish(answer, served_by, mdl, ttft_ms, status):
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        ts = _dt.datetime.now().isoformat(timespec="seconds")
+        with timer.stage("log"):
+            try:
+                log_interaction(ts, user_query, answer, latency_ms, served_by, mdl, ttft_ms=ttft_ms, stages=timer.ms,
+                                status=status)
+            except Exception as e:
+                print("Logging error:", repr(e))
+        observe_request(timer, served_by, mdl, time.perf_counter() - start, route="/query/stream", query=user_query,
+                        status=status, cached=cached is not None, ttft_ms=ttft_ms)
+        return latency_ms, ts
+
+    def events():
+        cancellation.use(deadline)  # the body is generated after the view function has returned
+        ttft_ms = None
+        pieces = []
+        status = "ok"
+        if cached is not None:
+            answer, mdl, served_by = cached
+            ttft_ms = int((time.perf_counter() - start) * 1000)
+            yield _sse("token", {"text": answer})
         else:
-            answer, mdl = _generate_hf(user_query)
-    except Exception as e:
-        answer, mdl = f"(provider_error) {e}", "n/a"
+            served_by, mdl = provider_name, model_name
+            chunks = None
+            try:
+                # includes time the client takes to read each event
+                with timer.stage("provider"):
+                    try:
+                        chunks, mdl, served_by = _stream_provider(user_query)
+                        for piece in chunks:
+                            if ttft_ms is None:
+                                ttft_ms = int((time.perf_counter() - start) * 1000)
+                            pieces.append(piece)
+                            yield _sse("token", {"text": piece})
+                        answer = "".join(pieces).strip()
+                        _remember_answer(user_query, key, answer, mdl, served_by)
+                    except Cancelled as e:
+                        # the partial answer is logged, not cached
+                        status, answer = e.status, "".join(pieces).strip() or stopped_answer(e)
+                        yield _sse("error", {"error": stopped_answer(e), "status": status})
+                    except Exception as e:
+                        status = "error"
+                        answer, mdl = f"(provider_error) {e}", "n/a"
+                        yield _sse("error", {"error": answer, "status": status})
+                    finally:
+                        ticket.release()
+            except GeneratorExit:
+                # client disconnected mid-answer: stop the provider now rather than let it finish for nobody
+                deadline.cancel()
+                if chunks is not None:
+                    chunks.close()
+                finish("".join(pieces).strip() or "(cancelled) client went away", served_by, mdl, ttft_ms, "cancelled")
+                raise
 
-    latency_ms = int((time.perf_counter() - start) * 1000)
-    ts = _dt.datetime.now().isoformat(timespec="seconds")
-    try:
-        log_interaction(ts, user_query, answer, latency_ms, provider_name, mdl)
-    except Exception as e:
-        print("Logging error:", repr(e))
+        latency_ms, ts = finish(answer, served_by, mdl, ttft_ms, status)
+        yield _sse("done", {
+            "latency_ms": latency_ms,
+            "ttft_ms": ttft_ms,
+            "timestamp": ts,
+            "provider": served_by,
+            "model": mdl,
+            "cached": cached is not None,
+            "status": status,
+            "use_system_prompt": USE_SYSTEM_PROMPT,
+        })
 
-    return jsonify({
-        "response": answer,
-        "latency_ms": latency_ms,
-        "timestamp": ts,
-        "provider": provider_name,
-        "model": mdl,
-        "use_system_prompt": USE_SYSTEM_PROMPT
-    })
+    resp = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    if ticket is not None:
+        # a client that disconnects before the first event never runs the generator's finally
+        resp.call_on_close(ticket.release)
+    return resp
 
 # ---- Admin: clear all logs (used by dashboard "Clear all logs" button) -------
 @app.route("/admin/clear", methods=["POST"])
 def admin_clear():
-    with get_conn() as conn:
-        conn.execute("DELETE FROM interactions;")
-        conn.execute("VACUUM;")
-        conn.commit()
-    return jsonify({"cleared": True, "db_path": DB_PATH})
+    stats = clear_interactions()
+    return jsonify({"cleared": "queued", "maintenance": stats, "db_path": DB_PATH}), 202
+
+@app.route("/admin/search", methods=["GET"])
+def admin_search():
+    if not admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    payload, status = search_interactions(request.args)
+    return jsonify(payload), status
+
+@app.route("/admin/export", methods=["GET"])
+def admin_export():
+    if not admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    try:
+        fmt, chunks = export_interactions(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(
+        stream_with_context(chunks),
+        mimetype=export.CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=interactions.{fmt}"},
+    )
+
+# ---- Admin: profiling (ADMIN_TOKEN, or local callers only) -------
+#   /admin/profile?seconds=10     collapsed stacks (flamegraph.pl / speedscope); &format=json adds top frames
+#   /admin/slow?limit=50          newest traces of requests over SLOW_REQUEST_MS
+@app.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    if not admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    result, status = run_profile(request.args)
+    if status != 200 or request.args.get("format") == "json":
+        return jsonify(result), status
+    return Response(result["collapsed"] + "\n", mimetype="text/plain")
+
+@app.route("/admin/slow", methods=["GET"])
+def admin_slow():
+    if not admin_allowed(request):
+        return jsonify({"error": "admin only"}), 403
+    return jsonify({**slow_requests.stats(), "traces": slow_requests.recent(request.args.get("limit", 50, type=int))})
 
 # Quick stats
 @app.route("/admin/stats", methods=["GET"])
 def admin_stats():
-    with get_conn() as conn:
-        cur = conn.execute("SELECT COUNT(*) FROM interactions;")
-        (count,) = cur.fetchone()
-    return jsonify({"count": int(count), "db_path": DB_PATH})
+    return jsonify({**interaction_stats(), "db_path": DB_PATH})
+
+if LAZY_STARTUP:
+    threading.Thread(target=_start_provider, name="provider-startup", daemon=True).start()
+else:
+    _start_provider()
+
+_startup["import_ms"] = int((time.perf_counter() - _IMPORT_T0) * 1000)
+_over = " -- OVER BUDGET" if _startup["import_ms"] > STARTUP_BUDGET_MS else ""
+print(f"[startup] import took {_startup['import_ms']} ms (budget {STARTUP_BUDGET_MS:.0f} ms){_over}")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5000")), debug=True)
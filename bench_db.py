@@ -0,0 +1,218 @@
+"""Benchmark of logs.db answer storage: inline text (schema 7) vs. the `responses` table (schema 8).
+
+Builds a database the way the previous release stored it, measures it, then
+runs migration 8 on a copy and measures again: file size, migration time,
+insert throughput through each release's log-writer SQL, and the read paths
+that now decompress answers (dashboard recent rows, point lookups, full
+export, full-text search with snippets):
+
+    python bench_db.py --rows 100000 --unique 0.3
+    python bench_db.py --from-db old_logs.db          # measure a copy of a real log (schema < 8)
+
+Synthetic answers are filler text like fake_provider's; `--unique` is the share
+of rows whose answer appears only once, the rest repeat from a pool of common
+answers (cache hits, FAQ-style questions).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import datetime as _dt
+
+import export
+import migrations
+import responses
+import search
+from bench_load import SYNTHETIC_QUERIES
+from db import Database
+from fake_provider import FakeProvider
+
+V7_INSERT = ("INSERT INTO interactions (ts, query, response, latency_ms, provider, model, ts_epoch, status) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?, 'ok')")
+V8_INSERT = ("INSERT INTO interactions (ts, query, response, response_id, latency_ms, provider, model, ts_epoch, status) "
+             f"VALUES (?, ?, '', {responses.ID_SQL}, ?, ?, ?, ?, 'ok')")
+
+
+# --------- Synthetic log ----------
+def _answer(rng, words):
+    tokens = FakeProvider(output_tokens=words).tokens(str(rng.random()))
+    return " ".join(tokens).capitalize() + "."
+
+
+def synthetic_rows(n, unique, pool, words, seed=0, start_epoch=None):
+    """(ts, query, response, latency_ms, provider, model, ts_epoch) tuples."""
+    rng = random.Random(seed)
+    common = [_answer(rng, words) for _ in range(pool)]
+    epoch = start_epoch or int(time.time()) - n
+    for i in range(n):
+        if rng.random() < unique:
+            text = _answer(rng, max(8, int(rng.gauss(words, words / 4))))
+        else:
+            text = common[min(int(rng.expovariate(5.0 / pool)), pool - 1)]
+        ts = _dt.datetime.fromtimestamp(epoch + i).isoformat(timespec="seconds")
+        yield (ts, rng.choice(SYNTHETIC_QUERIES), text, rng.randint(50, 900), "fake", "fake-v1", epoch + i)
+
+
+def insert(conn, rows, v8, batch=100):
+    """Rows through one release's log-writer SQL, `batch` per transaction; returns rows/s."""
+    sql = V8_INSERT if v8 else V7_INSERT
+    start = time.perf_counter()
+    n, pending = 0, []
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= batch:
+            n += _insert_batch(conn, pending, sql, v8)
+            pending = []
+    if pending:
+        n += _insert_batch(conn, pending, sql, v8)
+    took = time.perf_counter() - start
+    return round(n / took, 1) if took else None
+
+
+def _insert_batch(conn, rows, sql, v8):
+    conn.execute("BEGIN IMMEDIATE")
+    if v8:
+        responses.store(conn, [r[2] for r in rows])
+    conn.executemany(sql, rows)
+    conn.commit()
+    return len(rows)
+
+
+# --------- Measurements ----------
+def compact(conn):
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.execute("VACUUM;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+
+def timed(fn, repeat):
+    """Median ms of `repeat` runs (after one warm-up run)."""
+    fn()
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t) * 1000.0)
+    return round(statistics.median(runs), 2)
+
+
+def measure(path, repeat, seed=0):
+    conn = Database(path).connect("reader")
+    schema = migrations.version(conn)
+    text = responses.TEXT_SQL if schema >= 8 else "response"
+    (max_id,) = conn.execute("SELECT MAX(id) FROM interactions;").fetchone()
+    ids = random.Random(seed).sample(range(1, max_id + 1), min(200, max_id))
+    names = [c for c, _ in export.columns(conn)]
+
+    def recent():
+        conn.execute(f"SELECT id, ts, query, substr({text}, 1, 500), latency_ms, provider, model "
+                     "FROM interactions ORDER BY id DESC LIMIT 200;").fetchall()
+
+    def point():
+        for i in ids:
+            conn.execute(f"SELECT {text} FROM interactions WHERE id = ?;", (i,)).fetchone()
+
+    def export_all():
+        for _ in export.ndjson_chunks(names, export.iter_batches(conn)):
+            pass
+
+    out = {
+        "schema": schema,
+        "rows": max_id,
+        "size_mb": round(os.path.getsize(path) / 1e6, 2),
+        "recent_200_ms": timed(recent, repeat),
+        "point_200_ms": timed(point, repeat),
+        "export_ms": timed(export_all, max(1, repeat // 3)),
+        "search_rank_ms": timed(lambda: search.search(conn, "restart the kernel"), repeat),
+        "search_recent_ms": timed(lambda: search.search(conn, "restart the kernel", sort="recent"), repeat),
+    }
+    if schema >= 8:
+        out["responses"] = responses.stats(conn)
+    conn.close()
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=50000, help="synthetic rows (ignored with --from-db)")
+    ap.add_argument("--unique", type=float, default=0.3, help="share of rows with a one-off answer")
+    ap.add_argument("--pool", type=int, default=500, help="distinct common answers the others repeat")
+    ap.add_argument("--words", type=int, default=120, help="mean answer length in words")
+    ap.add_argument("--from-db", help="benchmark a copy of this logs.db (schema 7 or older) instead")
+    ap.add_argument("--insert-rows", type=int, default=5000, help="rows appended to time each release's writes")
+    ap.add_argument("--repeat", type=int, default=5, help="runs per read measurement (median is reported)")
+    ap.add_argument("--keep", action="store_true", help="keep the two database files")
+    ap.add_argument("--out", help="report path (default bench_results/db-<time>.json)")
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="bench_db-")
+    before, after = os.path.join(work, "before.db"), os.path.join(work, "after.db")
+    report = {"started": _dt.datetime.now().isoformat(timespec="seconds"), "config": vars(args), "codec": responses.CODEC}
+    try:
+        if args.from_db:
+            src = sqlite3.connect(args.from_db)
+            if migrations.version(src) >= 8:
+                raise SystemExit(f"{args.from_db} already stores answers in `responses` (schema 8+)")
+            dst = sqlite3.connect(before)
+            src.backup(dst)  # consistent copy even while the API writes
+            dst.close()
+            src.close()
+        conn = Database(before).connect()
+        migrations.migrate(conn, target=7)
+        if not args.from_db:
+            print(f"[bench_db] writing {args.rows} rows ...", file=sys.stderr)
+            insert(conn, synthetic_rows(args.rows, args.unique, args.pool, args.words), False, batch=1000)
+        compact(conn)
+        conn.close()
+        shutil.copyfile(before, after)
+
+        print("[bench_db] measuring schema 7 ...", file=sys.stderr)
+        report["before"] = measure(before, args.repeat)
+
+        conn = Database(after).connect()
+        t = time.perf_counter()
+        migrations.migrate(conn)
+        report["migrate_s"] = round(time.perf_counter() - t, 2)
+        compact(conn)
+        conn.close()
+        print("[bench_db] measuring schema 8 ...", file=sys.stderr)
+        report["after"] = measure(after, args.repeat)
+
+        # appends go through each release's log-writer SQL, in its batch size
+        extra = list(synthetic_rows(args.insert_rows, args.unique, args.pool, args.words, seed=1))
+        for key, path, v8 in (("before", before, False), ("after", after, True)):
+            conn = Database(path).connect()
+            report[key]["insert_rows_per_s"] = insert(conn, extra, v8)
+            conn.close()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    b, a = report["before"], report["after"]
+    print(f"{'':<20}{'schema 7':>12}{'schema 8':>12}{'change':>10}")
+    for key in ("size_mb", "recent_200_ms", "point_200_ms", "export_ms", "search_rank_ms", "search_recent_ms",
+                "insert_rows_per_s"):
+        change = f"{a[key] / b[key]:.2f}x" if b[key] else "-"
+        print(f"{key:<20}{b[key]:>12}{a[key]:>12}{change:>10}")
+    r = a["responses"]
+    print(f"migration took {report['migrate_s']}s; {r['rows']} rows share {r['distinct']} distinct answers, "
+          f"{r['raw_bytes'] / 1e6:.1f} MB stored as {r['stored_bytes'] / 1e6:.1f} MB ({r['codec']}, {r['ratio']}x)")
+    if args.keep:
+        print("databases:", work)
+
+    out = args.out or os.path.join("bench_results", f"db-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("report:", out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Benchmark of the local HF inference backends (see hf_backend.py).
+
+Runs the same prompts through each backend, each in its own process so peak
+RSS is per backend, and reports load time, output tokens/sec, batch latency,
+peak RSS and how closely the answers match the first backend (normally the
+fp32 pytorch pipeline):
+
+    python bench_hf.py --model google/flan-t5-small --backends pytorch int8 onnx onnx-int8 --threads 4
+
+Decoding is greedy with the API's settings, so differences come from the
+backend's numerics alone. A backend whose mean similarity to the baseline
+falls below --min-similarity is flagged and the exit code is 1.
+"""
+import argparse
+import difflib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import datetime as _dt
+
+import hf_backend
+from bench_load import SYNTHETIC_QUERIES, load_queries, percentile
+
+
+# --------- One backend (runs in a child process) ----------
+def run_worker(args):
+    t0 = time.perf_counter()
+    pipe = hf_backend.load_pipeline(args.task, args.model, args.worker, args.onnx_dir,
+                                    intra=args.threads, inter=args.interop_threads)
+    load_s = time.perf_counter() - t0
+    hf_backend.prepare_for_batching(pipe)
+    kwargs = hf_backend.gen_kwargs(args.task, args.max_new_tokens)
+    prompts = _prompts(args)
+    pipe(prompts[:1], **kwargs)  # warm-up: first call pays for lazy init / graph optimization
+
+    outputs, batch_ms = [], []
+    start = time.perf_counter()
+    for i in range(0, len(prompts), args.batch):
+        chunk = prompts[i:i + args.batch]
+        t = time.perf_counter()
+        outputs += hf_backend.run_batch(pipe, chunk, **kwargs)
+        batch_ms.append((time.perf_counter() - t) * 1000.0)
+    wall = time.perf_counter() - start
+    tokens = sum(len(pipe.tokenizer(o, add_special_tokens=False)["input_ids"]) for o in outputs)
+    batch_ms.sort()
+    print(json.dumps({
+        "backend": args.worker,
+        "load_s": round(load_s, 2),
+        "wall_s": round(wall, 3),
+        "output_tokens": tokens,
+        "tokens_per_s": round(tokens / wall, 2) if wall else None,
+        "batch_latency_ms": {"p50": percentile(batch_ms, 50), "p95": percentile(batch_ms, 95)},
+        # Linux reports ru_maxrss in KiB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        "threads": hf_backend.configure_threads(),
+        "outputs": outputs,
+    }))
+
+
+def _prompts(args):
+    queries = load_queries(args.input) if args.input else list(SYNTHETIC_QUERIES)
+    return (queries * (args.n // len(queries) + 1))[:args.n]
+
+
+# --------- Comparison ----------
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+def run_backend(backend, argv):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", backend] + argv
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"backend": backend, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--model", default=hf_backend.CANDIDATES[1][1])
+    ap.add_argument("--task", help="pipeline task (default: looked up in hf_backend.CANDIDATES)")
+    ap.add_argument("--backends", nargs="+", default=list(hf_backend.BACKENDS), choices=hf_backend.BACKENDS)
+    ap.add_argument("--input", help="JSONL file of queries (default: bench_load's synthetic questions)")
+    ap.add_argument("-n", type=int, default=32, help="prompts per backend")
+    ap.add_argument("--batch", type=int, default=8, help="prompts per pipeline call (like HF_BATCH_MAX)")
+    ap.add_argument("--max-new-tokens", type=int, default=220)
+    ap.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = library default)")
+    ap.add_argument("--interop-threads", type=int, default=0)
+    ap.add_argument("--onnx-dir", default=hf_backend.DEFAULT_ONNX_DIR)
+    ap.add_argument("--min-similarity", type=float, default=0.9, help="mean word-level similarity to the baseline")
+    ap.add_argument("--out", help="report path (default bench_results/hf-<model>-<time>.json)")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    args.task = args.task or dict((m, t) for t, m in hf_backend.CANDIDATES).get(args.model, "text2text-generation")
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    passthrough = ["--model", args.model, "--task", args.task, "-n", str(args.n), "--batch", str(args.batch),
+                   "--max-new-tokens", str(args.max_new_tokens), "--threads", str(args.threads),
+                   "--interop-threads", str(args.interop_threads), "--onnx-dir", args.onnx_dir]
+    if args.input:
+        passthrough += ["--input", args.input]
+    results = []
+    for backend in args.backends:
+        print(f"[bench_hf] {backend} ...", file=sys.stderr)
+        results.append(run_backend(backend, passthrough))
+
+    ok = [r for r in results if "error" not in r]
+    baseline = ok[0] if ok else None
+    failed = False
+    for r in ok:
+        pairs = list(zip(baseline["outputs"], r["outputs"]))
+        r["exact_match"] = round(sum(a == b for a, b in pairs) / len(pairs), 3)
+        r["similarity"] = round(sum(similarity(a, b) for a, b in pairs) / len(pairs), 3)
+        r["within_tolerance"] = r["similarity"] >= args.min_similarity
+        r["speedup"] = round(r["tokens_per_s"] / baseline["tokens_per_s"], 2) if baseline["tokens_per_s"] else None
+        failed |= not r["within_tolerance"]
+
+    print(f"{'backend':<12}{'load_s':>8}{'tok/s':>10}{'speedup':>9}{'p50_ms':>10}{'rss_mb':>9}{'exact':>7}{'sim':>7}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<12} error: {r['error']}")
+            continue
+        print(f"{r['backend']:<12}{r['load_s']:>8}{str(r['tokens_per_s']):>10}{str(r['speedup']):>9}"
+              f"{str(r['batch_latency_ms']['p50']):>10}{r['peak_rss_mb']:>9}{r['exact_match']:>7}{r['similarity']:>7}"
+              + ("" if r["within_tolerance"] else "  <- below --min-similarity"))
+
+    report = {
+        "started": _dt.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "worker"},
+        "baseline": baseline["backend"] if baseline else None,
+        "results": results,
+    }
+    out = args.out or os.path.join("bench_results", f"hf-{args.model.replace('/', '--')}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("report:", out)
+    return 1 if failed or len(ok) < len(results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
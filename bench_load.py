@@ -0,0 +1,292 @@
+"""Load generator / benchmark for the chatbot API.
+
+Replays a JSONL file of queries (or a synthetic mix) against /query at a fixed
+request rate (open loop) or a fixed concurrency (closed loop), then writes a
+JSON report with p50/p95/p99 latency, throughput and error rate.
+
+Run against the deterministic fake provider so no network or model is needed:
+
+    PROVIDER=fake python app_logging_autodetect.py                # Flask dev server
+    python bench_load.py --concurrency 16 --duration 30 --label flask-dev
+
+or let the script start and stop the server itself:
+
+    python bench_load.py --label gunicorn-4w --rps 50 --duration 30 \\
+        --server "gunicorn -w 4 -b 127.0.0.1:5055 app_logging_autodetect:app" \\
+        --env PROVIDER=fake --env RESPONSE_CACHE_SIZE=0
+
+Compare saved runs with:  python bench_load.py --compare a.json b.json
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import datetime as _dt
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SYNTHETIC_QUERIES = [
+    "how do I fix ModuleNotFoundError numpy",
+    "why does Node.js throw EADDRINUSE and how do I fix it",
+    "what is a pointer in C",
+    "what is kotlin",
+    "write a Python function that returns the nth Fibonacci number iteratively",
+    "how do I resolve a git merge conflict",
+    "explain CORS errors in the browser",
+    "difference between a list and a tuple in python",
+    "how do I set up a python virtual environment",
+    "why is my docker container exiting immediately",
+]
+
+
+# --------- Workload ----------
+def load_queries(path):
+    """Reads queries from JSONL: uses "query", falling back to "body" / "title"."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            text = row.get("query") or row.get("body") or row.get("title")
+            if text:
+                queries.append(text)
+    return queries
+
+
+def synthetic_queries(n, repeat_ratio, seed):
+    """`repeat_ratio` of the requests reuse a popular question (exercises caching/coalescing)."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        if rng.random() < repeat_ratio:
+            # skewed towards the first few questions, like real support traffic
+            out.append(SYNTHETIC_QUERIES[min(int(rng.expovariate(0.7)), len(SYNTHETIC_QUERIES) - 1)])
+        else:
+            out.append(f"{rng.choice(SYNTHETIC_QUERIES)} (variant {seed}-{i})")
+    return out
+
+
+# --------- Stats ----------
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return round(sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo), 2)
+
+
+def summarize(samples, wall_s):
+    ok = [s for s in samples if s["ok"]]
+    lat = sorted(s["latency_ms"] for s in ok)
+    server = sorted(s["server_ms"] for s in ok if s.get("server_ms") is not None)
+    by_provider = {}
+    for s in ok:
+        by_provider[s.get("provider") or "?"] = by_provider.get(s.get("provider") or "?", 0) + 1
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "latency_ms": {
+            "mean": round(sum(lat) / len(lat), 2) if lat else None,
+            "p50": percentile(lat, 50),
+            "p95": percentile(lat, 95),
+            "p99": percentile(lat, 99),
+            "max": round(lat[-1], 2) if lat else None,
+        },
+        "server_latency_ms": {"p50": percentile(server, 50), "p95": percentile(server, 95), "p99": percentile(server, 99)},
+        "served_by": by_provider,
+    }
+
+
+# --------- Load generation ----------
+class Runner:
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def one(self, query, scheduled=None):
+        # open-loop runs measure from the scheduled send time, so server stalls aren't hidden
+        start = scheduled if scheduled is not None else time.perf_counter()
+        sample = {"ok": False}
+        try:
+            r = self._session().post(self.url, json={"query": query}, timeout=self.timeout)
+            sample["status"] = r.status_code
+            if r.status_code == 200:
+                j = r.json()
+                sample["ok"] = not str(j.get("response", "")).startswith("(provider_error)")
+                sample["server_ms"] = j.get("latency_ms")
+                sample["provider"] = j.get("provider")
+        except Exception as e:
+            sample["error"] = repr(e)
+        sample["latency_ms"] = (time.perf_counter() - start) * 1000.0
+        with self._lock:
+            self.samples.append(sample)
+
+    def run_concurrency(self, queries, concurrency, duration):
+        stop_at = time.perf_counter() + duration if duration else None
+        counter = iter(range(10**12))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    i = next(counter)
+                if stop_at is not None and time.perf_counter() >= stop_at:
+                    return
+                if stop_at is None and i >= len(queries):
+                    return
+                self.one(queries[i % len(queries)])
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run_rps(self, queries, rps, duration, max_in_flight):
+        total = int(rps * duration) if duration else len(queries)
+        interval = 1.0 / rps
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for i in range(total):
+                scheduled = t0 + i * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.one, queries[i % len(queries)], scheduled)
+
+
+# --------- Server lifecycle (optional) ----------
+def start_server(cmd, env_pairs, health_url, wait_s):
+    env = dict(os.environ)
+    for pair in env_pairs:
+        k, _, v = pair.partition("=")
+        env[k] = v
+    proc = subprocess.Popen(shlex.split(cmd), env=env)
+    deadline = time.time() + wait_s
+    status = None
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited early with code {proc.returncode}")
+        try:
+            r = requests.get(health_url, timeout=1)
+            # with LAZY_STARTUP the server answers /health while the model still loads ("warming");
+            # starting then would time the model load as request latency
+            status = r.json().get("status", "ready") if r.status_code == 200 else None
+        except Exception:
+            status = None
+        if status == "ready":
+            return proc
+        if status == "failed":
+            proc.terminate()
+            raise SystemExit(f"server failed to start its provider: {health_url}")
+        time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit(f"server not ready after {wait_s}s (last status: {status}): {health_url}")
+
+
+def compare(paths):
+    rows = []
+    for p in paths:
+        with open(p, encoding="utf-8") as f:
+            rep = json.load(f)
+        s, lat = rep["summary"], rep["summary"]["latency_ms"]
+        rows.append((rep.get("label") or os.path.basename(p), s["throughput_rps"], lat["p50"], lat["p95"], lat["p99"], s["error_rate"]))
+    print(f"{'run':<28}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'err':>8}")
+    for r in rows:
+        print(f"{r[0]:<28}{r[1]:>10}{str(r[2]):>10}{str(r[3]):>10}{str(r[4]):>10}{r[5]:>8}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default=os.environ.get("CHATBOT_API", "http://127.0.0.1:5000/query"))
+    ap.add_argument("--input", help="JSONL file of queries (default: synthetic mix)")
+    ap.add_argument("--synthetic", type=int, default=500, help="number of synthetic queries")
+    ap.add_argument("--repeat-ratio", type=float, default=0.3, help="share of repeated questions in the synthetic mix")
+    ap.add_argument("--seed", type=int, default=0)
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, help="closed loop: N clients back to back")
+    mode.add_argument("--rps", type=float, help="open loop: fixed arrival rate")
+    ap.add_argument("--duration", type=float, default=0, help="seconds (0 = one pass over the queries)")
+    ap.add_argument("--max-in-flight", type=int, default=512, help="open loop client thread cap")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--label", default="")
+    ap.add_argument("--out", help="report path (default bench_results/<label>-<time>.json)")
+    ap.add_argument("--server", help="command that starts the API; run is bracketed by start/stop")
+    ap.add_argument("--env", action="append", default=[], help="KEY=VALUE for --server (repeatable)")
+    ap.add_argument("--server-wait", type=float, default=120)
+    ap.add_argument("--compare", nargs="+", metavar="REPORT")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    queries = load_queries(args.input) if args.input else synthetic_queries(args.synthetic, args.repeat_ratio, args.seed)
+    if not queries:
+        raise SystemExit("no queries to send")
+    base = args.url.rsplit("/query", 1)[0]
+
+    proc = start_server(args.server, args.env, base + "/health", args.server_wait) if args.server else None
+    try:
+        runner = Runner(args.url, args.timeout)
+        t0 = time.perf_counter()
+        if args.rps:
+            runner.run_rps(queries, args.rps, args.duration, args.max_in_flight)
+        else:
+            runner.run_concurrency(queries, args.concurrency or 8, args.duration)
+        wall = time.perf_counter() - t0
+        try:
+            health = requests.get(base + "/health", timeout=5).json()
+        except Exception as e:
+            health = {"error": repr(e)}
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    report = {
+        "label": args.label,
+        "started": _dt.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "url": args.url,
+            "input": args.input or f"synthetic:{args.synthetic}@{args.repeat_ratio}",
+            "mode": f"rps={args.rps}" if args.rps else f"concurrency={args.concurrency or 8}",
+            "duration_s": args.duration,
+            "server": args.server,
+            "env": args.env,
+        },
+        "summary": summarize(runner.samples, wall),
+        "health": health,
+    }
+    out = args.out or os.path.join("bench_results", f"{args.label or 'run'}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    s = report["summary"]
+    print(json.dumps({k: s[k] for k in ("requests", "error_rate", "throughput_rps", "latency_ms")}, indent=2))
+    print("report:", out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
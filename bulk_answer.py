@@ -0,0 +1,209 @@
+"""Answers a JSONL file of queries offline, through the API's provider layer, without HTTP.
+
+    python bulk_answer.py faq.jsonl --out faq.answers.jsonl
+    python bulk_answer.py faq.jsonl --out faq.answers.jsonl            # after a crash: resumes where it stopped
+    PROVIDER=hf HF_BATCH_MAX=16 python bulk_answer.py regress.jsonl --out run.jsonl --batch 16
+
+Each input line needs "query" (or "body" / "title", like bench_load.py). Output
+lines come back in input order with the input's "id" / "request_id", the
+answer, provider, model and latency. Both files are streamed, and at most
+--window queries are in memory at once.
+
+Resuming: the output file is the checkpoint. Answers are written in input
+order, so on restart the complete lines already in --out tell how many input
+lines to skip, and a torn last line is cut off. --restart starts over.
+
+The local HF model is called with whole batches (--batch prompts per forward
+pass). Remote providers go through the fallback chain on a bounded thread pool
+(--concurrency). Answers are also logged to `interactions` through the batched
+log writer, and fill the response cache, unless --no-log is given.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import datetime as _dt
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _query_of(row):
+    return (row.get("query") or row.get("body") or row.get("title") or "").strip()
+
+
+def read_input(path, skip):
+    """Yields (line number, row) for non-empty lines after the first `skip`."""
+    with open(path, encoding="utf-8") as f:
+        n = 0
+        for line in f:
+            if not line.strip():
+                continue
+            n += 1
+            if n > skip:
+                yield n, json.loads(line)
+
+
+def count_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def resume_point(out_path):
+    """Complete lines already in `out_path`, after truncating a partially written last line."""
+    if not os.path.exists(out_path):
+        return 0
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    return data[:end].count(b"\n")
+
+
+# --------- Answering ----------
+def _answer_one(core, line, row, log):
+    query = _query_of(row)
+    out = {"line": line, "id": row.get("id", row.get("request_id")), "query": query}
+    if not query:
+        return {**out, "error": "empty query"}
+    t0 = time.perf_counter()
+    try:
+        key = core.cache_key(query, core.provider_name, core.model_name, core.USE_SYSTEM_PROMPT)
+        if log:
+            answer, mdl, served_by = core._generate_and_remember(query, key)
+        else:
+            answer, mdl, served_by = core._generate_provider(query)
+    except Exception as e:
+        return {**out, "error": repr(e), "latency_ms": int((time.perf_counter() - t0) * 1000)}
+    return {**out, "response": answer, "provider": served_by, "model": mdl,
+            "latency_ms": int((time.perf_counter() - t0) * 1000)}
+
+
+def _answer_hf_batch(core, items, log):
+    # one forward pass for the whole batch, straight into the in-process pipeline
+    queries = [_query_of(row) for _, row in items]
+    t0 = time.perf_counter()
+    try:
+        texts = core._hf_run_batch([core._hf_prompt(q) for q in queries])
+        error = None
+    except Exception as e:
+        texts, error = [None] * len(items), repr(e)
+    per_ms = int((time.perf_counter() - t0) * 1000 / max(1, len(items)))
+    out = []
+    for (line, row), q, text in zip(items, queries, texts):
+        r = {"line": line, "id": row.get("id", row.get("request_id")), "query": q}
+        if error is not None:
+            out.append({**r, "error": error})
+            continue
+        if log:
+            core._remember_answer(q, core.cache_key(q, core.provider_name, core.model_name, core.USE_SYSTEM_PROMPT),
+                                  text, core._hf_model_name, "hf")
+        out.append({**r, "response": text, "provider": "hf", "model": core._hf_model_name, "latency_ms": per_ms})
+    return out
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def answer_stream(core, rows, concurrency, batch, window, log):
+    """Yields result dicts in input order with at most `window` queries outstanding."""
+    hf_inline = core.provider_name == "hf" and len(core.chain.names) == 1 and core._hf_pipe is not None
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool:
+        pending = deque()
+        if hf_inline:
+            # batches run one at a time; the pipeline already uses every core
+            for items in _batches(rows, batch):
+                yield from _answer_hf_batch(core, items, log)
+            return
+        for line, row in rows:
+            pending.append(pool.submit(_answer_one, core, line, row, log))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# --------- Progress ----------
+class Progress:
+    def __init__(self, total, done, every_s):
+        self.total, self.start_done, self.done = total, done, done
+        self.errors = 0
+        self.every_s = every_s
+        self.t0 = self.last = time.perf_counter()
+
+    def add(self, result):
+        self.done += 1
+        self.errors += "error" in result
+        now = time.perf_counter()
+        if now - self.last >= self.every_s:
+            self.last = now
+            self.report()
+
+    def report(self, final=False):
+        took = time.perf_counter() - self.t0
+        rate = (self.done - self.start_done) / took if took else 0.0
+        left = self.total - self.done
+        eta = f", eta {left / rate:.0f}s" if rate and left and not final else ""
+        print(f"[bulk] {self.done}/{self.total} answered, {self.errors} errors, {rate:.1f} q/s{eta}",
+              file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("input", help="JSONL with query / body / title per line")
+    ap.add_argument("--out", required=True, help="output JSONL (also the resume checkpoint)")
+    ap.add_argument("--concurrency", type=int, default=16, help="parallel calls to remote providers")
+    ap.add_argument("--batch", type=int, default=int(os.environ.get("HF_BATCH_MAX", "8")),
+                    help="prompts per forward pass for the local HF model")
+    ap.add_argument("--window", type=int, default=0, help="max queries in flight (default 4 x concurrency)")
+    ap.add_argument("--restart", action="store_true", help="ignore existing output and start over")
+    ap.add_argument("--no-log", action="store_true", help="don't write interactions or fill the response cache")
+    ap.add_argument("--progress-s", type=float, default=5.0, help="seconds between progress lines")
+    args = ap.parse_args(argv)
+
+    if args.restart and os.path.exists(args.out):
+        os.remove(args.out)
+    done = resume_point(args.out)
+    total = count_lines(args.input)
+    if done:
+        print(f"[bulk] resuming after {done} answered lines", file=sys.stderr)
+    if done >= total:
+        print("[bulk] nothing left to do", file=sys.stderr)
+        return 0
+
+    # importing the API module sets up the provider chain, caches and log writer (no server is started)
+    import app_logging_autodetect as core
+    while core._startup["status"] in ("starting", "warming"):  # LAZY_STARTUP loads in the background
+        time.sleep(0.2)
+    if not core.is_ready():
+        raise SystemExit(f"provider failed to start: {core._startup['error']}")
+
+    log = not args.no_log
+    progress = Progress(total, done, args.progress_s)
+    window = args.window or 4 * max(1, args.concurrency)
+    with open(args.out, "a", encoding="utf-8") as out:
+        for result in answer_stream(core, read_input(args.input, done), max(1, args.concurrency),
+                                    max(1, args.batch), window, log):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()  # a crash loses at most the answers still in flight
+            if log and "error" not in result:
+                core.log_interaction(_dt.datetime.now().isoformat(timespec="seconds"), result["query"],
+                                     result["response"], result["latency_ms"], result["provider"], result["model"])
+            progress.add(result)
+    if log:
+        core._log_writer.flush(timeout=60)
+    progress.report(final=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
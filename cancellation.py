@@ -0,0 +1,115 @@
+import contextvars
+import threading
+import time
+
+
+# --------- Request deadlines and cancellation ----------
+class Cancelled(Exception):
+    """Work stopped early: the request ran out of time ("timeout") or its client went away ("cancelled")."""
+
+    def __init__(self, status, detail=None):
+        super().__init__(detail or f"request {status}")
+        self.status = status
+
+
+class Deadline:
+    """When a request's answer stops being useful, plus a flag for clients that disconnect.
+
+    Providers poll `expired()` between tokens (HF StoppingCriteria, stream
+    loops) and shorten their own network timeouts with `cap()`. `cancel()` is
+    thread-safe and runs the `on_cancel` callbacks, e.g. to tell the model
+    server to stop. timeout_s <= 0 means no time limit.
+    """
+
+    def __init__(self, timeout_s=0):
+        self.timeout_s = float(timeout_s or 0)
+        self.expires_at = time.monotonic() + self.timeout_s if self.timeout_s > 0 else None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def expired(self) -> bool:
+        return self._cancelled.is_set() or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    @property
+    def status(self):
+        """"cancelled", "timeout", or None while there is still time."""
+        if self._cancelled.is_set():
+            return "cancelled"
+        return "timeout" if self.expired() else None
+
+    def remaining(self):
+        """Seconds left; None without a time limit, 0 once expired or cancelled."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cap(self, timeout_s):
+        """A provider's own timeout, shortened to what is left of the deadline (0 = none)."""
+        left = self.remaining()
+        if left is None:
+            return timeout_s
+        return min(timeout_s, left) if timeout_s else left
+
+    def error(self) -> Cancelled:
+        if self.status == "cancelled":
+            return Cancelled("cancelled", "client went away")
+        return Cancelled("timeout", f"no answer within {self.timeout_s:g}s")
+
+    def check(self):
+        if self.expired():
+            raise self.error()
+
+    def wait(self, seconds) -> bool:
+        """Sleeps up to `seconds`, returning early (True) if the deadline passes or the request is cancelled."""
+        left = self.remaining()
+        self._cancelled.wait(seconds if left is None else min(seconds, left))
+        return self.expired()
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print("Cancel callback error:", repr(e))
+
+    def on_cancel(self, fn):
+        """Calls fn() when the request is cancelled (right away if it already was)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def start(timeout_s) -> Deadline:
+    """New deadline for the current request; providers find it with current()."""
+    deadline = Deadline(timeout_s)
+    _current.set(deadline)
+    return deadline
+
+
+def use(deadline):
+    _current.set(deadline)
+
+
+def current() -> Deadline:
+    # outside a request (warm-up, bulk_answer.py) there is no limit
+    return _current.get() or Deadline()
+
+
+def stopped(e, deadline):
+    """`e` as Cancelled if the deadline is what ended the call (e.g. an SDK timeout cut short by cap()), else None."""
+    if isinstance(e, Cancelled):
+        return e
+    return deadline.error() if deadline.expired() else None
@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 import datetime
-import requests
+
+import dashboard_data
 
 # Simulated data storage (replace with a real database in production)
 data = {
@@ -21,7 +22,7 @@ def log_query(query, response):
 # Simulated Chatbot API call
 def chatbot_api_simulation(query):
     url = "http://127.0.0.1:5000/query"
-    response = requests.post(url, json={"query": query})
+    response = dashboard_data.http().post(url, json={"query": query}, timeout=30, headers={"X-Request-Timeout": "30"})
     if response.status_code == 200:
         return response.json().get("response", "No response")
     else:
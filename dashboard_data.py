@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import datetime as _dt
+
+import pandas as pd
+import streamlit as st
+
+import http_pool
+import responses
+import rollups
+import search
+from db import Database
+
+# --------- Read-only analytics over the API's rollup tables (see rollups.py) ----------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("CHATBOT_DB", os.path.join(BASE_DIR, "logs.db"))
+RECENT_ROWS = int(os.environ.get("DASHBOARD_RECENT_ROWS", "2000"))
+
+
+@st.cache_resource
+def _db():
+    # pooled read-only connections shared by every session in this dashboard process;
+    # WAL lets them read while the API writes
+    return Database(DB_PATH, pool_size=4)
+
+
+@st.cache_resource
+def http():
+    # one keep-alive session for every browser session, so a click reuses the open API connection
+    return http_pool.requests_session("dashboard", pool_size=int(os.environ.get("DASHBOARD_HTTP_POOL", "10")))
+
+
+# --------- Chatbot API calls (shared by the dashboards) ----------
+def chatbot_api_call(url, query, timeout_s=30):
+    """(answer, latency_ms) from POST /query; errors come back as the answer text."""
+    start = time.perf_counter()
+    try:
+        # X-Request-Timeout: the server gives up when we do
+        r = http().post(url, json={"query": query}, timeout=timeout_s, headers={"X-Request-Timeout": str(timeout_s)})
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        if r.status_code == 200:
+            # Try common response shapes
+            j = r.json()
+            resp = j.get("response") or j.get("answer") or str(j)
+            return resp, latency_ms
+        else:
+            return f"API error: {r.status_code}", latency_ms
+    except Exception as e:
+        # Still return a latency estimate
+        return f"Error connecting to chatbot API: {e}", int((time.perf_counter() - start) * 1000)
+
+
+def chatbot_api_stream(url, query, result, timeout_s=30):
+    """Yields answer chunks as they arrive (SSE from /query/stream); the "done" event's fields go into `result`."""
+    start = time.perf_counter()
+    try:
+        with http().post(url, json={"query": query}, stream=True, timeout=timeout_s,
+                         headers={"X-Request-Timeout": str(timeout_s)}) as r:
+            if r.status_code != 200:
+                yield f"API error: {r.status_code}"
+                return
+            event = None
+            for line in r.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    payload = json.loads(line[len("data:"):])
+                    if event == "token":
+                        yield payload.get("text", "")
+                    elif event == "error":
+                        yield payload.get("error", "")
+                    elif event == "done":
+                        result.update(payload)
+    except Exception as e:
+        yield f"Error connecting to chatbot API: {e}"
+    finally:
+        result["latency_ms"] = int((time.perf_counter() - start) * 1000)
+
+
+def _read(sql, params=()):
+    if not os.path.exists(DB_PATH):
+        return pd.DataFrame()
+    try:
+        with _db().reader() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+    except Exception as e:
+        # table missing (API never started) or DB replaced underneath us
+        print("Dashboard query error:", repr(e))
+        return pd.DataFrame()
+
+
+def _since(minutes):
+    return (_dt.datetime.now() - _dt.timedelta(minutes=minutes)).isoformat(timespec="seconds")
+
+
+@st.cache_data(ttl=5)
+def total_count():
+    df = _read("SELECT COALESCE(SUM(count), 0) AS n FROM rollup_model;")
+    return int(df["n"].iloc[0]) if not df.empty else 0
+
+
+@st.cache_data(ttl=5)
+def per_minute(window_min):
+    # long windows read the hourly rollup so the chart stays a few hundred bars
+    if window_min > 1440:
+        return _read(
+            "SELECT hour AS minute, SUM(count) AS count FROM rollup_hour WHERE hour >= ? GROUP BY hour ORDER BY hour;",
+            (_since(window_min)[:13],),
+        )
+    return _read(
+        "SELECT minute, count FROM rollup_minute WHERE minute >= ? ORDER BY minute;",
+        (_since(window_min)[:16],),
+    )
+
+
+@st.cache_data(ttl=5)
+def latency_percentiles(window_min):
+    """Per-minute p50/p95 latency, estimated from the rollup histogram buckets."""
+    df = _read(
+        "SELECT minute, bucket, count FROM rollup_latency WHERE minute >= ? ORDER BY minute;",
+        (_since(window_min)[:16],),
+    )
+    if df.empty:
+        return df
+    rows = []
+    for minute, g in df.groupby("minute", sort=True):
+        pct = rollups.percentiles(dict(zip(g["bucket"], g["count"])))
+        rows.append({"minute": minute, "p50": pct[50], "p95": pct[95]})
+    return pd.DataFrame(rows)
+
+
+@st.cache_data(ttl=5)
+def top_queries(limit=10):
+    return _read("SELECT query AS Query, count AS Count FROM query_freq ORDER BY count DESC LIMIT ?;", (limit,))
+
+
+@st.cache_data(ttl=5)
+def stage_breakdown(window_min):
+    """Average ms per request stage and provider, from the hourly rollup."""
+    avgs = ", ".join(f"SUM({s}_sum) / SUM(staged) AS {s}" for s in rollups.STAGES)
+    return _read(
+        f"SELECT provider, {avgs} FROM rollup_hour WHERE hour >= ? GROUP BY provider HAVING SUM(staged) > 0;",
+        (_since(window_min)[:13],),
+    )
+
+
+def recent_interactions(state, limit=RECENT_ROWS):
+    """Newest `limit` rows, fetched incrementally: each call only reads ids above the last one seen.
+
+    `state` is a dict-like (st.session_state) that keeps the frame between reruns.
+    """
+    sql_cols = f"id, ts, query, substr({responses.TEXT_SQL}, 1, 500) AS response, latency_ms, provider, model"
+    frame = state.get("log_frame")
+    last_id = state.get("log_last_id", 0)
+    max_id = _read("SELECT MAX(id) AS m FROM interactions;")
+    max_id = int(max_id["m"].iloc[0]) if not max_id.empty and pd.notna(max_id["m"].iloc[0]) else 0
+    if frame is None or max_id < last_id:
+        # first load, or the log was cleared: start from the newest rows
+        frame = _read(f"SELECT {sql_cols} FROM interactions ORDER BY id DESC LIMIT ?;", (limit,))
+        frame = frame.iloc[::-1].reset_index(drop=True) if not frame.empty else frame
+    elif max_id > last_id:
+        new = _read(f"SELECT {sql_cols} FROM interactions WHERE id > ? ORDER BY id LIMIT ?;", (last_id, limit))
+        frame = pd.concat([frame, new], ignore_index=True).tail(limit).reset_index(drop=True)
+    state["log_frame"] = frame
+    state["log_last_id"] = int(frame["id"].iloc[-1]) if not frame.empty else 0
+    return frame
+
+
+def reset_recent(state):
+    state.pop("log_frame", None)
+    state.pop("log_last_id", None)
+
+
+def search_log(text, limit=20, offset=0, mode="all", sort="rank"):
+    if not text.strip() or not os.path.exists(DB_PATH):
+        return {"results": [], "next_offset": None}
+    try:
+        with _db().reader() as conn:
+            return search.search(conn, text, limit=limit, offset=offset, mode=mode, sort=sort)
+    except Exception as e:
+        # older logs.db without the FTS table (API not restarted since the upgrade)
+        print("Dashboard search error:", repr(e))
+        return {"results": [], "next_offset": None, "error": repr(e)}
+
+
+def render_search(state, page_size=20):
+    """Search box over queries and answers (FTS5), ranked, with a "more" button for the next page."""
+    c1, c2, c3 = st.columns([4, 1, 1])
+    with c1:
+        text = st.text_input("Search the log", placeholder="e.g. CORS error", key="search_text")
+    with c2:
+        mode = st.selectbox("Match", ["all", "any"], key="search_mode", help="all words, or any of them")
+    with c3:
+        sort = st.selectbox("Sort", ["rank", "recent"], key="search_sort")
+    if (text, mode, sort) != state.get("search_key"):
+        state["search_key"] = (text, mode, sort)
+        state["search_pages"] = 1
+    if not text.strip():
+        return
+    res = search_log(text, limit=page_size * state["search_pages"], mode=mode, sort=sort)
+    if res.get("error"):
+        st.warning("Search index not available yet; restart the API to run the schema upgrade.")
+        return
+    rows = res["results"]
+    took = f" in {res['took_ms']} ms" if "took_ms" in res else ""
+    st.caption(f"{len(rows)}{'+' if res['next_offset'] else ''} matches{took}")
+    if rows:
+        st.dataframe(
+            pd.DataFrame(rows)[["ts", "query", "response", "provider", "latency_ms", "score"]],
+            use_container_width=True, hide_index=True,
+        )
+    if res["next_offset"] and st.button("More results"):
+        state["search_pages"] += 1
+        st.rerun()
+
+
+def render_analytics(window_min):
+    """Analytics section shared by both dashboards."""
+    total = total_count()
+    st.metric("Total Queries", total)
+    if total == 0:
+        st.write("No data to display.")
+        return
+
+    per_min = per_minute(window_min)
+    if not per_min.empty:
+        st.write("**Queries per hour**" if window_min > 1440 else "**Queries per minute**")
+        st.bar_chart(per_min.set_index("minute")["count"])
+
+    lat = latency_percentiles(window_min)
+    if not lat.empty:
+        st.write("**Latency over time (ms, p50 / p95 per minute)**")
+        st.line_chart(lat.set_index("minute")[["p50", "p95"]])
+
+    stages = stage_breakdown(window_min)
+    if not stages.empty:
+        st.write("**Where the time goes (avg ms per stage)**")
+        st.bar_chart(stages.set_index("provider"))
+
+    st.write("**Top repeated queries (all time)**")
+    st.dataframe(top_queries(), use_container_width=True)
+
+
+# --------- Slow requests and profiles (from the API's /admin endpoints, not the DB) ----------
+def _admin_get(url, timeout=10, **params):
+    """(json, None) or (None, error text). Sends ADMIN_TOKEN if this dashboard has one."""
+    token = os.environ.get("ADMIN_TOKEN")
+    try:
+        r = http().get(url, params=params, timeout=timeout, headers={"X-Admin-Token": token} if token else None)
+        body = r.json()
+        return (body, None) if r.status_code == 200 else (None, body.get("error", f"HTTP {r.status_code}"))
+    except Exception as e:
+        return None, repr(e)
+
+
+def render_slow_requests(admin_url, limit=50):
+    """Per-stage traces of the API's slow requests, plus a button that profiles the API for a few seconds."""
+    data, err = _admin_get(admin_url + "/slow", limit=limit)
+    if err:
+        st.info(f"Slow-request traces unavailable: {err}")
+        return
+    st.caption(f"Requests over {data['threshold_ms']:.0f} ms (SLOW_REQUEST_MS); {data['captured']} captured by the "
+               f"worker that answered, newest {data['held']} kept")
+    traces = data["traces"]
+    if traces:
+        rows = [{"ts": t["ts"], "total_ms": t["total_ms"], "route": t.get("route"), "provider": t.get("provider"),
+                 "status": t.get("status"), "slowest stage": max(t["stages"], key=t["stages"].get, default=None),
+                 "query": t["query"], **{f"{k}_ms": v for k, v in t["stages"].items()}} for t in traces]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True, height=220)
+        pick = st.selectbox("Trace", range(len(traces)), key="slow_pick",
+                            format_func=lambda i: f"{traces[i]['ts']}  {traces[i]['total_ms']:.0f} ms  "
+                                                  f"{traces[i]['query'][:60]}")
+        spans = pd.DataFrame(traces[pick]["spans"])
+        if not spans.empty:
+            st.bar_chart(spans.groupby("stage", sort=False)["ms"].sum())
+            st.dataframe(spans, use_container_width=True, hide_index=True)
+    else:
+        st.write("No slow requests captured yet.")
+
+    c1, c2 = st.columns([1, 3])
+    with c1:
+        seconds = st.number_input("Profile seconds", min_value=1, max_value=60, value=10, key="profile_s")
+    with c2:
+        st.write("")
+        run = st.button("Profile the API")
+    if run:
+        with st.spinner(f"Sampling every thread for {seconds} s ..."):
+            result, err = _admin_get(admin_url + "/profile", timeout=seconds + 30, seconds=seconds, format="json")
+        if err:
+            st.warning(f"Profile failed: {err}")
+        else:
+            st.caption(f"{result['samples']} samples in {result['seconds']} s "
+                       f"(sampler overhead {result['overhead_pct']}%)")
+            st.dataframe(pd.DataFrame(result["top"]), use_container_width=True, hide_index=True)
+            st.download_button("Collapsed stacks (flamegraph.pl / speedscope)", result["collapsed"] + "\n",
+                               file_name="api.collapsed.txt")
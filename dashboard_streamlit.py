@@ -1,102 +1,59 @@
 import os
-import time
-import datetime
-import pandas as pd
 import streamlit as st
-import requests
+
+import dashboard_data
 
 # === Config ===
 API_URL = os.environ.get("CHATBOT_API", "http://127.0.0.1:5000/query")
+API_STREAM_URL = os.environ.get("CHATBOT_STREAM", API_URL.rstrip("/") + "/stream")
+CLEAR_URL = os.environ.get("CHATBOT_CLEAR", API_URL.rsplit("/query", 1)[0] + "/admin/clear")
+ADMIN_URL = os.environ.get("CHATBOT_ADMIN", API_URL.rsplit("/query", 1)[0] + "/admin")
 
 st.title("Developer Support Chatbot Dashboard")
 
-# === Persistent storage (prevents reset on each rerun) ===
-if "data" not in st.session_state:
-    st.session_state.data = {
-        "Timestamp": [],
-        "Query": [],
-        "Response": [],
-        "Latency_ms": [],  # NEW: track response time
-    }
-
-# Function to log query and response
-def log_query(query, response, latency_ms):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.data["Timestamp"].append(timestamp)
-    st.session_state.data["Query"].append(query)
-    st.session_state.data["Response"].append(response)
-    st.session_state.data["Latency_ms"].append(latency_ms)
-
-# Chatbot API call with latency measurement
-def chatbot_api_call(query):
-    try:
-        start = time.perf_counter()
-        r = requests.post(API_URL, json={"query": query}, timeout=30)
-        latency_ms = int((time.perf_counter() - start) * 1000)
-        if r.status_code == 200:
-            # Try common response shapes
-            j = r.json()
-            resp = j.get("response") or j.get("answer") or str(j)
-            return resp, latency_ms
-        else:
-            return f"API error: {r.status_code}", latency_ms
-    except Exception as e:
-        # Still return a latency estimate
-        latency_ms = int((time.perf_counter() - start) * 1000) if "start" in locals() else 0
-        return f"Error connecting to chatbot API: {e}", latency_ms
+# The API logs every interaction to CHATBOT_DB; the log and analytics below read from there.
 
 # ================= UI =================
 
 # Input Section
 st.header("Interact with Chatbot")
 query = st.text_input("Enter your query:", key="query_input_box")
+stream = st.checkbox("Stream tokens as they arrive", value=True)
 col1, col2 = st.columns([1, 1])
 with col1:
     if st.button("Submit"):
-        response, latency = chatbot_api_call(query)
-        log_query(query, response, latency)
-        st.success(f"Chatbot Response: {response}")
+        if stream:
+            st.write("**Chatbot Response:**")
+            st.write_stream(dashboard_data.chatbot_api_stream(API_STREAM_URL, query, {}))
+        else:
+            response, latency = dashboard_data.chatbot_api_call(API_URL, query)
+            st.success(f"Chatbot Response: {response}")
 with col2:
     if st.button("Clear Analytics / History"):
-        st.session_state.data = {"Timestamp": [], "Query": [], "Response": [], "Latency_ms": []}
-        st.info("Cleared.")
-
-# Log Display Section
+        try:
+            dashboard_data.http().post(CLEAR_URL, timeout=30)
+            st.info("Clear queued; the log empties in the background.")
+        except Exception as e:
+            st.error(f"Clear failed: {e}")
+        dashboard_data.reset_recent(st.session_state)
+        st.cache_data.clear()
+
+# Log Display Section (newest rows from the DB, fetched incrementally)
 st.header("Query Log")
-if st.session_state.data["Timestamp"]:
-    df = pd.DataFrame(st.session_state.data)
-    st.dataframe(df, use_container_width=True, height=260)
+log_df = dashboard_data.recent_interactions(st.session_state)
+if not log_df.empty:
+    st.dataframe(log_df.iloc[::-1], use_container_width=True, height=260, hide_index=True)
 else:
     st.write("No queries logged yet.")
 
-# Analytics Section
-st.header("Analytics")
-if st.session_state.data["Timestamp"]:
-    df = pd.DataFrame(st.session_state.data)
-
-    # Top-level metrics
-    total = df["Query"].count()
-    st.metric("Total Queries", total)
-
-    # Parse timestamps and build time buckets
-    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-    df["Latency_ms"] = pd.to_numeric(df["Latency_ms"], errors="coerce")
-    df = df.dropna(subset=["Timestamp"])  # keep good rows
+# Full-text search over everything logged
+dashboard_data.render_search(st.session_state)
 
-    # Queries per minute (fixes the “always 1” issue from value_counts of unique strings)
-    df["bucket_min"] = df["Timestamp"].dt.floor("min")
-    per_min = df.groupby("bucket_min").size().rename("count").reset_index()
-    st.write("**Queries per minute**")
-    st.bar_chart(per_min.set_index("bucket_min")["count"])
-
-    # Latency over time (ms)
-    if df["Latency_ms"].notna().any():
-        st.write("**Latency over time (ms)**")
-        st.line_chart(df.set_index("Timestamp")["Latency_ms"])
+# Analytics Section (aggregated in SQL)
+st.header("Analytics")
+window = st.selectbox("Window", [60, 360, 1440, 10080], index=2, format_func=lambda m: f"last {m // 60} h")
+dashboard_data.render_analytics(window)
 
-    # (Optional) Top repeated queries — keep this if you repeat prompts often
-    st.write("**Top repeated queries**")
-    topq = df.groupby("Query").size().sort_values(ascending=False).head(10).rename("Count").reset_index()
-    st.dataframe(topq, use_container_width=True)
-else:
-    st.write("No data to display.")
+# Slow requests (per-stage traces kept by the API) and on-demand profiling
+st.header("Slow Requests")
+dashboard_data.render_slow_requests(ADMIN_URL)
@@ -0,0 +1,150 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import responses
+
+
+# --------- Shared SQLite access (pooled connections, PRAGMAs set once) ----------
+class Database:
+    """Connection pools for one SQLite file in WAL mode.
+
+    Two roles, matching how WAL works:
+      * `writer()`: read/write connections (WAL, synchronous=NORMAL, busy_timeout).
+      * `reader()`: `mode=ro` + `query_only` connections; any number can read while
+        one writer commits.
+    Both lend a connection from a small pool and take it back afterwards, so
+    PRAGMAs run once per connection and each connection's prepared-statement
+    cache (`cached_statements`) stays warm across requests. When a pool is empty
+    and at `pool_size`, an extra connection is opened and closed after use rather
+    than blocking the caller.
+
+    Threads that own a connection for their whole life (log writer, maintenance,
+    migrations) use `connect()` instead. Every connection gets the answer-storage
+    SQL functions from responses.py. Pools are dropped after a fork (e.g.
+    gunicorn --preload), since SQLite connections must not cross processes.
+    """
+
+    def __init__(self, path, pool_size=8, busy_timeout_ms=3000, cached_statements=256):
+        self.path = path
+        self.pool_size = max(1, int(pool_size))
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.cached_statements = int(cached_statements)
+        self._pools = {"writer": queue.LifoQueue(), "reader": queue.LifoQueue()}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._opened = {"writer": 0, "reader": 0}
+        self._pooled = {"writer": 0, "reader": 0}
+        self._lends = {"writer": 0, "reader": 0}
+        self._overflow = {"writer": 0, "reader": 0}
+
+    def connect(self, role="writer"):
+        """A new connection in autocommit mode (BEGIN/commit are explicit); caller closes it."""
+        if role == "reader":
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                                   isolation_level=None, cached_statements=self.cached_statements)
+            conn.execute("PRAGMA query_only=ON;")
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                   cached_statements=self.cached_statements)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL;")
+                conn.execute("PRAGMA synchronous=NORMAL;")
+            except Exception:
+                pass
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms};")
+        responses.register(conn)
+        with self._lock:
+            self._opened[role] += 1
+        return conn
+
+    def writer(self):
+        return self._lend("writer")
+
+    def reader(self):
+        return self._lend("reader")
+
+    @contextmanager
+    def transaction(self):
+        """Pooled writer inside BEGIN IMMEDIATE ... COMMIT (rolled back on error)."""
+        with self.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextmanager
+    def _lend(self, role):
+        if os.getpid() != self._pid:
+            self._after_fork()
+        pool = self._pools[role]
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = None
+        with self._lock:
+            self._lends[role] += 1
+            if conn is None:
+                keep = self._pooled[role] < self.pool_size
+                if keep:
+                    self._pooled[role] += 1
+                else:
+                    self._overflow[role] += 1
+            else:
+                keep = True
+        if conn is None:
+            try:
+                conn = self.connect(role)
+            except Exception:
+                if keep:
+                    with self._lock:
+                        self._pooled[role] -= 1
+                raise
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # a caller bailed out mid-transaction; don't hand the open transaction to the next one
+                conn.rollback()
+            if keep:
+                pool.put(conn)
+            else:
+                conn.close()
+
+    def _after_fork(self):
+        with self._lock:
+            if os.getpid() == self._pid:
+                return
+            # the parent still owns these connections; forget them without closing
+            self._pid = os.getpid()
+            self._pools = {"writer": queue.LifoQueue(), "reader": queue.LifoQueue()}
+            self._pooled = {"writer": 0, "reader": 0}
+
+    def close(self):
+        for role, pool in self._pools.items():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._pooled[role] = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                role: {
+                    "pool_size": self.pool_size,
+                    "pooled": self._pooled[role],
+                    "idle": self._pools[role].qsize(),
+                    "opened": self._opened[role],
+                    "lends": self._lends[role],
+                    "overflow": self._overflow[role],
+                }
+                for role in ("writer", "reader")
+            }
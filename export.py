@@ -0,0 +1,196 @@
+"""Streams the interactions log out of logs.db in constant memory.
+
+Rows are read with keyset pagination on `id` (one short query per batch, so the
+API's writer and WAL checkpoints never wait on the export) and written as
+NDJSON, CSV or, with pyarrow installed, Parquet (one row group per batch).
+Answers stored in the `responses` table (migration 8) come out as plain text
+in the `response` column.
+
+    python export.py --format ndjson --out interactions.ndjson
+    python export.py --format parquet --out part.parquet --since 2024-06-01 --provider gemini
+    python export.py --format csv --after-id 1200000 > tail.csv      # resume after a known id
+"""
+import argparse
+import csv
+import datetime as _dt
+import io
+import json
+import os
+import sys
+import time
+
+import responses
+from db import Database
+
+FORMATS = ("ndjson", "csv", "parquet")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def to_epoch(value):
+    """Accepts epoch seconds or an ISO date/datetime (local time, like `ts`)."""
+    if value in (None, ""):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(_dt.datetime.fromisoformat(str(value)).timestamp())
+
+
+def columns(conn):
+    """(name, declared type) of every exported interactions column, in table order.
+
+    `response_id` is storage detail: its answer is exported as `response`.
+    """
+    return [(row[1], (row[2] or "").upper()) for row in conn.execute("PRAGMA table_info(interactions);")
+            if row[1] != "response_id"]
+
+
+def _select_list(conn, names):
+    if not any(row[1] == "response_id" for row in conn.execute("PRAGMA table_info(interactions);")):
+        return names  # database from before migration 8
+    return [f"{responses.TEXT_SQL} AS response" if n == "response" else n for n in names]
+
+
+def iter_batches(conn, batch=5000, after_id=0, since=None, until=None, provider=None, model=None, limit=None):
+    """Yields lists of row tuples in id order; filters are pushed into the WHERE clause.
+
+    The id range is fixed up front (rows logged during the export are left for
+    the next run) and each page walks the primary key from the last id seen, so
+    a page costs the same at row 10 as at row 10 million.
+    """
+    names = [c for c, _ in columns(conn)]
+    where, params = [], []
+    if since is not None:
+        where.append("ts_epoch >= ?")
+        params.append(to_epoch(since))
+    if until is not None:
+        where.append("ts_epoch < ?")
+        params.append(to_epoch(until))
+    # time filters narrow the id range through the ts_epoch index
+    lo, hi = conn.execute(
+        f"SELECT MIN(id), MAX(id) FROM interactions {'WHERE ' + ' AND '.join(where) if where else ''};", params
+    ).fetchone()
+    if lo is None:
+        return
+    if provider:
+        where.append("provider = ?")
+        params.append(provider)
+    if model:
+        where.append("model = ?")
+        params.append(model)
+    sql = (
+        f"SELECT {', '.join(_select_list(conn, names))} FROM interactions NOT INDEXED "
+        f"WHERE {' AND '.join(['id > ?', 'id <= ?'] + where)} ORDER BY id LIMIT ?;"
+    )
+    id_pos = names.index("id")
+    last, remaining = max(int(after_id or 0), lo - 1), limit
+    while remaining is None or remaining > 0:
+        n = batch if remaining is None else min(batch, remaining)
+        rows = conn.execute(sql, [last, hi] + params + [n]).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][id_pos]
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < n:
+            return
+
+
+# --------- Encoders (each yields bytes per batch) ----------
+def ndjson_chunks(names, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(names, r)), ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+
+def csv_chunks(names, batches):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(names)
+    for rows in batches:
+        w.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def stream(conn, fmt, counter=None, **filters):
+    """Bytes for `fmt` (ndjson / csv); Parquet needs a file, see `write_parquet`.
+
+    `counter`, if given, is a dict whose "rows" entry is bumped per batch.
+    """
+    names = [c for c, _ in columns(conn)]
+    batches = _counted(iter_batches(conn, **filters), counter)
+    return ndjson_chunks(names, batches) if fmt == "ndjson" else csv_chunks(names, batches)
+
+
+def _counted(batches, counter):
+    for rows in batches:
+        if counter is not None:
+            counter["rows"] = counter.get("rows", 0) + len(rows)
+        yield rows
+
+
+def write_parquet(conn, path, **filters):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+    kinds = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    cols = columns(conn)
+    schema = pa.schema([(name, kinds.get(decl.split()[0] if decl else "", pa.string())) for name, decl in cols])
+    rows_out = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in iter_batches(conn, **filters):
+            arrays = [pa.array(col, type=schema.field(i).type) for i, col in enumerate(zip(*rows))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows_out += len(rows)
+    return rows_out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export the interactions log.")
+    ap.add_argument("--db", default=os.environ.get(
+        "CHATBOT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.db")))
+    ap.add_argument("--format", choices=FORMATS, default="ndjson")
+    ap.add_argument("--out", default="-", help="file path, or - for stdout (not for parquet)")
+    ap.add_argument("--since", help="epoch seconds or ISO date/time (inclusive)")
+    ap.add_argument("--until", help="epoch seconds or ISO date/time (exclusive)")
+    ap.add_argument("--provider")
+    ap.add_argument("--model")
+    ap.add_argument("--after-id", type=int, default=0, help="resume after this id")
+    ap.add_argument("--limit", type=int, help="stop after this many rows")
+    ap.add_argument("--batch", type=int, default=5000, help="rows per query (and per Parquet row group)")
+    args = ap.parse_args(argv)
+
+    conn = Database(args.db).connect("reader")
+    filters = dict(batch=args.batch, after_id=args.after_id, since=args.since, until=args.until,
+                   provider=args.provider, model=args.model, limit=args.limit)
+    start = time.perf_counter()
+    if args.format == "parquet":
+        if args.out == "-":
+            raise SystemExit("--out is required for parquet")
+        rows, size = write_parquet(conn, args.out, **filters), os.path.getsize(args.out)
+    else:
+        out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+        size, counter = 0, {"rows": 0}
+        try:
+            for chunk in stream(conn, args.format, counter=counter, **filters):
+                out.write(chunk)
+                size += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        rows = counter["rows"]
+    conn.close()
+    took = time.perf_counter() - start
+    print(f"exported {rows} rows, {size / 1e6:.1f} MB in {took:.1f}s ({rows / took if took else 0:.0f} rows/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
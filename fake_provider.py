@@ -0,0 +1,74 @@
+import asyncio
+import math
+import random
+import zlib
+
+from cancellation import Deadline
+
+_WORDS = (
+    "check the import path install the package with pip restart the kernel set the environment variable "
+    "verify the version pin the dependency read the stack trace run the tests clear the cache rebuild the "
+    "project update the lockfile use a virtual env enable debug logging inspect the config"
+).split()
+
+
+# --------- Deterministic fake provider for benchmarks (no network, no model) ----------
+class FakeProvider:
+    """Answers every query after a simulated delay with filler text.
+
+    Latency and output are seeded from the query text (plus `seed`), so a replayed
+    workload sees the same latency distribution on every run. `dist` is one of
+    fixed | uniform | normal | lognormal, shaped by `latency_ms` and `spread_ms`.
+    """
+
+    model = "fake-v1"
+
+    def __init__(self, dist="lognormal", latency_ms=200.0, spread_ms=50.0, output_tokens=120, seed=0):
+        if dist not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"unknown FAKE_LATENCY_DIST {dist!r}")
+        self.dist = dist
+        self.latency_ms = float(latency_ms)
+        self.spread_ms = float(spread_ms)
+        self.output_tokens = int(output_tokens)
+        self.seed = int(seed)
+
+    def _rng(self, query: str) -> random.Random:
+        return random.Random(zlib.crc32(query.encode("utf-8")) ^ self.seed)
+
+    def latency_s(self, query: str) -> float:
+        rng = self._rng(query)
+        mean, spread = self.latency_ms, self.spread_ms
+        if self.dist == "fixed":
+            ms = mean
+        elif self.dist == "uniform":
+            ms = rng.uniform(mean - spread, mean + spread)
+        elif self.dist == "normal":
+            ms = rng.gauss(mean, spread)
+        else:
+            # lognormal with the requested mean/stddev: long right tail like real providers
+            sigma2 = math.log(1.0 + (spread / mean) ** 2) if mean > 0 else 0.0
+            ms = rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2)) if mean > 0 else 0.0
+        return max(0.0, ms) / 1000.0
+
+    def tokens(self, query: str) -> list[str]:
+        rng = self._rng(query)
+        return [rng.choice(_WORDS) for _ in range(self.output_tokens)]
+
+    def generate(self, query: str, deadline=None) -> str:
+        # waits on the deadline instead of sleeping, so a timed-out or cancelled call ends right away
+        if (deadline or Deadline()).wait(self.latency_s(query)):
+            deadline.check()
+        return " ".join(self.tokens(query))
+
+    async def agenerate(self, query: str) -> str:
+        await asyncio.sleep(self.latency_s(query))
+        return " ".join(self.tokens(query))
+
+    def stream(self, query: str, deadline=None):
+        deadline = deadline or Deadline()
+        toks = self.tokens(query)
+        per_token = self.latency_s(query) / max(1, len(toks))
+        for i, tok in enumerate(toks):
+            if deadline.wait(per_token):
+                deadline.check()
+            yield tok if i == 0 else " " + tok
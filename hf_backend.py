@@ -0,0 +1,214 @@
+"""Optimized CPU backends for the local HF models.
+
+    HF_BACKEND=pytorch    plain fp32 transformers pipeline (default)
+    HF_BACKEND=int8       torch dynamic int8 quantization of the Linear layers (no extra deps)
+    HF_BACKEND=onnx       ONNX Runtime via optimum; exported once and cached under HF_ONNX_DIR
+    HF_BACKEND=onnx-int8  the ONNX export with dynamically quantized int8 weights
+
+Every backend returns a regular `transformers.pipeline`, so batching, the
+generation kwargs and TextIteratorStreamer work unchanged. Compare them with
+`python bench_hf.py`.
+"""
+import os
+import shutil
+import threading
+
+BACKENDS = ("pytorch", "int8", "onnx", "onnx-int8")
+# (task, model) tried in order by the API's HF provider
+CANDIDATES = [
+    ("text2text-generation", "google/flan-t5-base"),
+    ("text2text-generation", "google/flan-t5-small"),
+    ("text-generation", "gpt2"),
+]
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_cache")
+
+
+def gen_kwargs(task, max_new_tokens=220) -> dict:
+    """Decoding settings shared by the API and bench_hf.py (greedy, so backends are comparable)."""
+    if task == "text2text-generation":
+        return {"max_new_tokens": max_new_tokens}
+    return {
+        "max_new_tokens": max_new_tokens,
+        "do_sample": False,
+        "repetition_penalty": 1.2,
+        "no_repeat_ngram_size": 3,
+        "return_full_text": False,
+    }
+
+
+def configure_threads(intra=0, inter=0):
+    """Pins torch's intra-/inter-op thread pools (0 = leave the library default)."""
+    try:
+        import torch
+    except ImportError:
+        return {}
+    if intra:
+        torch.set_num_threads(int(intra))
+    if inter:
+        try:
+            torch.set_num_interop_threads(int(inter))
+        except RuntimeError:
+            pass  # only settable before the first parallel op; keep what is there
+    return {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+
+
+def _ort_class(task):
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForSeq2SeqLM
+    return ORTModelForSeq2SeqLM if task == "text2text-generation" else ORTModelForCausalLM
+
+
+def _session_options(intra, inter):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra:
+        opts.intra_op_num_threads = int(intra)
+    if inter:
+        opts.inter_op_num_threads = int(inter)
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return opts
+
+
+def onnx_export(task, name, cache_dir, quantize=False):
+    """Path of the cached ONNX export of `name`, creating it on first use."""
+    base = os.path.join(cache_dir, name.replace("/", "--"))
+    fp32_dir = os.path.join(base, "fp32")
+    if not os.path.exists(os.path.join(fp32_dir, "config.json")):
+        from transformers import AutoTokenizer
+        tmp = fp32_dir + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        model = _ort_class(task).from_pretrained(name, export=True)
+        model.save_pretrained(tmp)
+        AutoTokenizer.from_pretrained(name).save_pretrained(tmp)
+        os.replace(tmp, fp32_dir)  # a half-written export is never picked up
+    if not quantize:
+        return fp32_dir
+    int8_dir = os.path.join(base, "int8")
+    if not os.path.exists(os.path.join(int8_dir, "config.json")):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = int8_dir + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for f in os.listdir(fp32_dir):
+            src, dst = os.path.join(fp32_dir, f), os.path.join(tmp, f)
+            if f.endswith(".onnx"):
+                quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+            elif os.path.isfile(src):
+                shutil.copy2(src, dst)
+        os.replace(tmp, int8_dir)
+    return int8_dir
+
+
+def load_pipeline(task, name, backend="pytorch", onnx_dir=DEFAULT_ONNX_DIR, intra=0, inter=0):
+    """A transformers pipeline for `name` running on `backend`."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown HF_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    from transformers import AutoTokenizer, pipeline
+    configure_threads(intra, inter)
+    if backend == "pytorch":
+        return pipeline(task, model=name)
+    if backend == "int8":
+        import torch
+        pipe = pipeline(task, model=name)
+        # weights stored as int8, activations quantized on the fly; the usual CPU win for Linear-heavy models
+        pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipe
+    path = onnx_export(task, name, onnx_dir, quantize=(backend == "onnx-int8"))
+    model = _ort_class(task).from_pretrained(
+        path, provider="CPUExecutionProvider", session_options=_session_options(intra, inter))
+    return pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(path))
+
+
+def is_cached(name) -> bool:
+    # cheap probe: looks in the local HF cache only, no download or model load
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        return isinstance(try_to_load_from_cache(name, "config.json"), str)
+    except Exception:
+        return False
+
+
+def load_first(backend="pytorch", onnx_dir=DEFAULT_ONNX_DIR, intra=0, inter=0):
+    """Loads the first CANDIDATES entry that works; returns (pipe, model label, info).
+
+    Locally cached models are tried first so a missing one doesn't cost a full
+    load attempt. If `backend` fails for a model (e.g. optimum not installed)
+    that model is loaded with plain pytorch instead. Optimized backends answer
+    slightly differently, so their label is "<model>+<backend>".
+    """
+    cached = [c for c in CANDIDATES if is_cached(c[1])]
+    info = {"hf_cached_candidates": [name for _, name in cached]}
+    last_err = None
+    for task, name in cached + [c for c in CANDIDATES if c not in cached]:
+        try:
+            used = backend
+            if backend != "pytorch":
+                try:
+                    pipe = load_pipeline(task, name, backend, onnx_dir, intra, inter)
+                except Exception as e:
+                    print(f"HF backend {backend} failed for {name}, using pytorch:", repr(e))
+                    used = "pytorch"
+            if used == "pytorch":
+                pipe = load_pipeline(task, name, "pytorch", intra=intra, inter=inter)
+            info.update(hf_backend=used, hf_threads=configure_threads())
+            return pipe, (name if used == "pytorch" else f"{name}+{used}"), info
+        except Exception as e:
+            last_err = e
+    raise RuntimeError(f"HF init failed: {last_err}")
+
+
+def prepare_for_batching(pipe):
+    tok = getattr(pipe, "tokenizer", None)
+    if tok is not None and getattr(pipe, "task", "") == "text-generation":
+        # decoder-only models need a pad token and left padding to batch prompts
+        if tok.pad_token is None:
+            tok.pad_token = tok.eos_token
+        tok.padding_side = "left"
+
+
+def stopping_criteria(should_stop):
+    """Ends generate() at the next token once `should_stop()` is true (deadline passed, client gone)."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _StopWhen(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return bool(should_stop())
+
+    return StoppingCriteriaList([_StopWhen()])
+
+
+def run_batch(pipe, prompts, should_stop=None, **kwargs):
+    """Generated text per prompt for one batched pipeline call."""
+    kwargs = kwargs or gen_kwargs(getattr(pipe, "task", ""))
+    if should_stop is not None:
+        kwargs["stopping_criteria"] = stopping_criteria(should_stop)
+    outs = pipe(prompts, batch_size=len(prompts), **kwargs)
+    # pipelines return one dict (or a one-element list of dicts) per prompt
+    return [(o[0] if isinstance(o, list) else o)["generated_text"].strip() for o in outs]
+
+
+def stream(pipe, prompt, should_stop=None):
+    """Yields text pieces as `pipe` generates them (generation runs on its own thread).
+
+    Closing the iterator early doesn't stop that thread; pass `should_stop` for that.
+    """
+    from transformers import TextIteratorStreamer
+    streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    kwargs = gen_kwargs(getattr(pipe, "task", ""))
+    if should_stop is not None:
+        kwargs["stopping_criteria"] = stopping_criteria(should_stop)
+    errors = []
+
+    def run():
+        try:
+            pipe(prompt, streamer=streamer, **kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    threading.Thread(target=run, name="hf-stream", daemon=True).start()
+    for piece in streamer:
+        if piece:
+            yield piece
+    if errors:
+        raise errors[0]
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from cancellation import Cancelled
+
+
+# --------- Micro-batching scheduler (collects concurrent prompts) ----------
+class MicroBatcher:
+    """Groups concurrent submissions into one call of `batch_fn(list, should_stop) -> list`.
+
+    A batch is dispatched when `max_batch` items are waiting or `window_ms`
+    has passed since the first item of the batch arrived, whichever is first.
+    Each returned Future carries `queue_wait_s` (time spent waiting for its
+    batch to start) once it completes.
+
+    Items submitted with a deadline (see cancellation.py) whose request has
+    timed out or gone away before their batch starts are dropped, as are
+    cancelled Futures. `should_stop()` turns true once every item in the
+    running batch has expired, so batch_fn can end generation early.
+    Expired items fail with Cancelled instead of getting a truncated answer.
+    """
+
+    def __init__(self, batch_fn, max_batch=8, window_ms=10, name="hf-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.window_s = max(0.0, float(window_ms) / 1000.0)
+        self.name = name
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        self._last_size = 0
+        self._errors = 0
+        self._cancelled = 0
+
+    def submit(self, item, deadline=None) -> Future:
+        self._start()
+        fut = Future()
+        fut.enqueued = time.perf_counter()
+        fut.queue_wait_s = 0.0
+        fut.deadline = deadline
+        self._q.put((item, fut))
+        return fut
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._q.qsize(),
+                "max_batch": self.max_batch,
+                "window_ms": int(self.window_s * 1000),
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_seen": self._max_seen,
+                "last_batch_size": self._last_size,
+                "errors": self._errors,
+                "cancelled": self._cancelled,
+            }
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._q.get_nowait())
+                else:
+                    batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _expire(self, fut):
+        with self._lock:
+            self._cancelled += 1
+        fut.set_exception(Cancelled(fut.deadline.status))
+
+    def _live(self, fut):
+        if not fut.set_running_or_notify_cancel():
+            with self._lock:
+                self._cancelled += 1
+            return False
+        if fut.deadline is not None and fut.deadline.expired():
+            self._expire(fut)  # nobody is waiting for this one any more; don't spend a forward pass on it
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            batch = [(item, fut) for item, fut in self._collect() if self._live(fut)]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            deadlines = [fut.deadline for _, fut in batch]
+            started = time.perf_counter()
+            for _, fut in batch:
+                fut.queue_wait_s = started - fut.enqueued
+            try:
+                results = self.batch_fn(items, lambda: all(d is not None and d.expired() for d in deadlines))
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            with self._lock:
+                self._batches += 1
+                self._items += len(items)
+                self._last_size = len(items)
+                self._max_seen = max(self._max_seen, len(items))
+            for (_, fut), res in zip(batch, results):
+                if fut.deadline is not None and fut.deadline.expired():
+                    self._expire(fut)
+                else:
+                    fut.set_result(res)
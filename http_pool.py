@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+# --------- Pooled keep-alive HTTP clients (provider SDKs + dashboards) ----------
+# One long-lived client per caller, so TCP and TLS setup happens once per
+# connection instead of once per query. httpx closes idle connections after 5 s
+# by default, which means a new handshake on almost every query at low traffic;
+# HTTP_KEEPALIVE_S keeps them around much longer.
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+KEEPALIVE_S = float(os.getenv("HTTP_KEEPALIVE_S", "120"))
+CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "5"))
+READ_TIMEOUT_S = float(os.getenv("HTTP_READ_TIMEOUT_S", "60"))
+HTTP2 = bool(int(os.getenv("HTTP2", "1")))
+
+_clients = {}  # name -> (client, counters)
+_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+        return True
+    except Exception:
+        return False
+
+
+def _register(name, client, counters):
+    with _lock:
+        _clients[name] = (client, counters)
+    return client
+
+
+def _on_trace(c, event, started):
+    # httpcore trace events; connection setup only shows up on a pool miss
+    step, _, phase = event.rpartition(".")
+    if step not in ("connection.connect_tcp", "connection.start_tls"):
+        return
+    if phase == "started":
+        started[step] = time.perf_counter()
+    elif phase == "complete":
+        t0 = started.pop(step, None)
+        with _lock:
+            c["tcp_connects" if step.endswith("tcp") else "tls_handshakes"] += 1
+            if t0 is not None:
+                c["connect_ms"] += (time.perf_counter() - t0) * 1000
+
+
+def httpx_client(name, asynchronous=False):
+    """Keep-alive httpx client (HTTP/2 when `h2` is installed) for SDKs that accept `http_client=`."""
+    import httpx
+    client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+    counters = {"requests": 0, "tcp_connects": 0, "tls_handshakes": 0, "connect_ms": 0.0}
+
+    if asynchronous:
+        async def on_request(request):
+            started = {}
+
+            async def trace(event, info):
+                _on_trace(counters, event, started)
+            request.extensions["trace"] = trace
+            with _lock:
+                counters["requests"] += 1
+    else:
+        def on_request(request):
+            started = {}
+            request.extensions["trace"] = lambda event, info: _on_trace(counters, event, started)
+            with _lock:
+                counters["requests"] += 1
+
+    client = client_cls(
+        http2=HTTP2 and http2_available(),
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                            keepalive_expiry=KEEPALIVE_S),
+        timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+        event_hooks={"request": [on_request]},
+    )
+    return _register(name, client, counters)
+
+
+def requests_session(name, pool_size=10, retries=0):
+    """`requests.Session` whose adapter keeps up to `pool_size` connections per host alive."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # urllib3 keeps its own request / new-connection counts per pool, read in stats()
+    return _register(name, session, {})
+
+
+def _httpx_pool(client):
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    conns = list(getattr(pool, "connections", []) or [])
+    out = {"open": len(conns), "idle": sum(1 for c in conns if c.is_idle()), "http2": 0}
+    for c in conns:
+        if "HTTP/2" in c.info():
+            out["http2"] += 1
+    out["active"] = out["open"] - out["idle"]
+    return out
+
+
+def _requests_pool(session):
+    out = {"requests": 0, "tcp_connects": 0, "idle": 0, "active": 0}
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # the queue starts as `maxsize` empty slots; checked-out connections are missing from it
+            queued = list(pool.pool.queue)
+            out["idle"] += sum(1 for conn in queued if conn is not None)
+            out["active"] += pool.pool.maxsize - len(queued)
+            out["requests"] += pool.num_requests
+            out["tcp_connects"] += pool.num_connections
+    return out
+
+
+def stats() -> dict:
+    """Per-client pool utilization and how often a query paid for connection setup."""
+    with _lock:
+        items = list(_clients.items())
+    out = {}
+    for name, (client, counters) in items:
+        try:
+            if hasattr(client, "adapters"):
+                s = {**dict(counters), **_requests_pool(client)}
+            else:
+                s = {**dict(counters), **_httpx_pool(client)}
+        except Exception as e:
+            s = {"error": repr(e)}
+        n = s.get("requests") or 0
+        s["reuse_ratio"] = round(1 - s.get("tcp_connects", 0) / n, 3) if n else None
+        if "connect_ms" in s:
+            s["connect_ms"] = round(s["connect_ms"], 1)
+        out[name] = s
+    return {"pool_size": POOL_SIZE, "keepalive_s": KEEPALIVE_S, "http2": HTTP2 and http2_available(), "clients": out}
@@ -0,0 +1,185 @@
+import json
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+# --------- Background batched writer for the interactions log ----------
+class BatchedLogWriter:
+    """Moves SQLite inserts off the request path.
+
+    `write(row)` only enqueues. A daemon thread owns one connection and inserts
+    queued rows with `executemany` in a single transaction every `max_batch`
+    rows or `flush_ms` milliseconds. When the queue is full, `on_full` decides:
+    "block" waits for room, "drop" discards the row, "spill" appends it to
+    `spill_path` as JSON (replayed into the DB the next time the writer starts).
+    `before_insert(conn, rows)` and `after_insert(conn, rows)` run inside the
+    insert transaction (e.g. to store answer bodies the rows refer to, or keep
+    rollup tables in step); `on_batch(seconds, rows)` is called after each
+    committed batch.
+    """
+
+    def __init__(self, connect, insert_sql, max_batch=100, flush_ms=200, queue_size=10000,
+                 on_full="block", spill_path=None, on_batch=None, after_insert=None, before_insert=None):
+        if on_full not in ("block", "drop", "spill"):
+            raise ValueError(f"on_full must be block, drop or spill (got {on_full!r})")
+        if on_full == "spill" and not spill_path:
+            raise ValueError("spill_path is required when on_full='spill'")
+        self.connect = connect
+        self.insert_sql = insert_sql
+        self.max_batch = max(1, int(max_batch))
+        self.flush_s = max(0.001, float(flush_ms) / 1000.0)
+        self.on_full = on_full
+        self.spill_path = spill_path
+        self.on_batch = on_batch
+        self.after_insert = after_insert
+        self.before_insert = before_insert
+        self._q = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._closed = False
+        self._written = 0
+        self._batches = 0
+        self._dropped = 0
+        self._spilled = 0
+        self._errors = 0
+        self._thread.start()
+
+    def write(self, row):
+        if self._closed:
+            raise RuntimeError("log writer is closed")
+        if self.on_full == "block":
+            self._q.put(row)
+            return
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            if self.on_full == "spill":
+                self._spill([row])
+            else:
+                with self._lock:
+                    self._dropped += 1
+
+    def flush(self, timeout=None):
+        """Blocks until every row enqueued so far has been written (or failed)."""
+        done = threading.Event()
+        self._q.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._q.qsize(),
+                "queue_size": self._q.maxsize,
+                "on_full": self.on_full,
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "spilled": self._spilled,
+                "errors": self._errors,
+            }
+
+    def _spill(self, rows):
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(list(row)) + "\n")
+        with self._lock:
+            self._spilled += len(rows)
+
+    def _insert(self, conn, rows):
+        start = time.perf_counter()
+        try:
+            # take the write lock up front: a deferred BEGIN that reads first (before_insert) can't
+            # upgrade to a writer once another connection has committed, and fails "database is locked"
+            conn.execute("BEGIN IMMEDIATE")
+            if self.before_insert is not None:
+                self.before_insert(conn, rows)
+            conn.executemany(self.insert_sql, rows)
+            if self.after_insert is not None:
+                self.after_insert(conn, rows)
+            conn.commit()
+        except Exception as e:
+            print("Logging error:", repr(e))
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            if self.spill_path:
+                self._spill(rows)
+            with self._lock:
+                self._errors += 1
+            return
+        with self._lock:
+            self._written += len(rows)
+            self._batches += 1
+        if self.on_batch is not None:
+            self.on_batch(time.perf_counter() - start, len(rows))
+
+    def _replay_spill(self, conn):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            replay = self.spill_path + ".replay"
+            os.replace(self.spill_path, replay)
+        with open(replay, encoding="utf-8") as f:
+            rows = [tuple(json.loads(line)) for line in f if line.strip()]
+        if rows:
+            self._insert(conn, rows)
+        os.remove(replay)
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            self._replay_spill(conn)
+        except Exception as e:
+            print("Log spill replay error:", repr(e))
+        stop = False
+        while not stop:
+            pending, waiters = [], []
+            item = self._q.get()  # idle until the first row of the next batch
+            deadline = time.monotonic() + self.flush_s
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                pending.append(item)
+                if len(pending) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+            if pending:
+                self._insert(conn, pending)
+            for ev in waiters:
+                ev.set()
+        # drain anything enqueued behind the stop marker
+        pending = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                pending.append(item)
+        if pending:
+            self._insert(conn, pending)
+        conn.close()
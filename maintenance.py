@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+
+import responses
+import rollups
+
+
+# --------- Background clear / retention for the interactions log ----------
+class Maintenance:
+    """Runs destructive cleanups on its own thread and connection, in small transactions.
+
+    Deletes go `chunk` rows at a time with a `pause_ms` gap between chunks, so
+    the log writer and dashboard readers only ever wait on one short
+    transaction. Freed pages are returned with `PRAGMA incremental_vacuum`
+    (see migration 5) instead of a full VACUUM. When `retention_days` > 0,
+    rows older than that are removed every `interval_s` seconds. Per-minute
+    rollups are pruned with them; the hourly, per-model and query-frequency
+    rollups keep the long-term history. Stored answers (see responses.py) that
+    no remaining row refers to are then deleted the same way.
+    """
+
+    def __init__(self, connect, retention_days=0, interval_s=3600, chunk=1000, pause_ms=20, vacuum_pages=256):
+        self.connect = connect
+        self.retention_days = float(retention_days)
+        self.interval_s = max(1.0, float(interval_s))
+        self.chunk = max(1, int(chunk))
+        self.pause_s = max(0.0, float(pause_ms) / 1000.0)
+        self.vacuum_pages = max(1, int(vacuum_pages))
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._current = None
+        self._last = {}
+        self._runs = {"clear": 0, "retention": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def clear(self) -> threading.Event:
+        """Queues deletion of every row logged so far; returns an Event set when it finishes."""
+        return self._submit("clear")
+
+    def retention(self) -> threading.Event:
+        return self._submit("retention")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "retention_days": self.retention_days,
+                "interval_s": self.interval_s,
+                "pending": self._q.qsize(),
+                "running": dict(self._current) if self._current else None,
+                "last": {k: dict(v) for k, v in self._last.items()},
+                "runs": dict(self._runs),
+            }
+
+    def _submit(self, kind):
+        self.start()
+        done = threading.Event()
+        self._q.put((kind, done))
+        return done
+
+    def _run(self):
+        conn = self.connect()
+        # first retention pass shortly after startup, then every interval_s
+        next_retention = time.monotonic() + 5.0 if self.retention_days > 0 else None
+        while True:
+            timeout = None if next_retention is None else max(0.0, next_retention - time.monotonic())
+            try:
+                kind, done = self._q.get(timeout=timeout)
+            except queue.Empty:
+                kind, done = "retention", None
+            if kind == "retention" and next_retention is not None:
+                next_retention = time.monotonic() + self.interval_s
+            try:
+                self._job(conn, kind)
+            except Exception as e:
+                print("Maintenance error:", repr(e))
+                if conn.in_transaction:
+                    conn.rollback()
+                with self._lock:
+                    self._last[kind] = {"error": repr(e), "finished": time.time()}
+                    self._current = None
+            if done is not None:
+                done.set()
+
+    def _job(self, conn, kind):
+        start = time.perf_counter()
+        with self._lock:
+            self._current = {"job": kind, "started": time.time(), "deleted": 0}
+        if kind == "clear":
+            # fix the upper bound first: rows logged after this point are kept (and counted by the rollups)
+            conn.execute("BEGIN IMMEDIATE")
+            (max_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM interactions;").fetchone()
+            rollups.clear(conn)
+            conn.commit()
+            where, params = "id <= ?", (max_id,)
+        else:
+            if self.retention_days <= 0:
+                with self._lock:
+                    self._current = None
+                return
+            cutoff = time.time() - self.retention_days * 86400
+            conn.execute("BEGIN IMMEDIATE")
+            rollups.prune_minutes(conn, cutoff)
+            conn.commit()
+            where, params = "ts_epoch < ?", (int(cutoff),)
+        deleted = self._delete_chunks(conn, where, params)
+        orphans = self._prune_responses(conn) if deleted else 0
+        pages = self._incremental_vacuum(conn)
+        with self._lock:
+            self._runs[kind] += 1
+            self._last[kind] = {
+                "deleted": deleted,
+                "responses_deleted": orphans,
+                "vacuumed_pages": pages,
+                "ms": int((time.perf_counter() - start) * 1000),
+                "finished": time.time(),
+            }
+            self._current = None
+
+    def _delete_chunks(self, conn, where, params):
+        deleted = 0
+        sql = f"DELETE FROM interactions WHERE id IN (SELECT id FROM interactions WHERE {where} LIMIT ?);"
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            n = conn.execute(sql, params + (self.chunk,)).rowcount
+            conn.commit()
+            deleted += n
+            with self._lock:
+                self._current["deleted"] = deleted
+            if n < self.chunk:
+                return deleted
+            time.sleep(self.pause_s)
+
+    def _prune_responses(self, conn):
+        deleted, last = 0, 0
+        while last is not None:
+            conn.execute("BEGIN IMMEDIATE")
+            last, n = responses.prune_orphans(conn, last, self.chunk)
+            conn.commit()
+            deleted += n
+            time.sleep(self.pause_s)
+        return deleted
+
+    def _incremental_vacuum(self, conn):
+        total = 0
+        while True:
+            (free,) = conn.execute("PRAGMA freelist_count;").fetchone()
+            if not free:
+                return total
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({min(free, self.vacuum_pages)});")
+            (after,) = conn.execute("PRAGMA freelist_count;").fetchone()
+            if after >= free:  # auto_vacuum not enabled on this file
+                return total
+            total += free - after
+            time.sleep(self.pause_s)
@@ -0,0 +1,158 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Fixed buckets (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_num(v):
+    return "+Inf" if v == float("inf") else repr(float(v))
+
+
+# --------- Prometheus-style metric types (text exposition format) ----------
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, s in sorted(series.items()):
+            cumulative = 0
+            for le, n in zip(self.buckets, s):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, {'le': _fmt_num(le)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, {'le': '+Inf'})} {s[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {_fmt_num(s[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {s[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, v in sorted(values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_num(v)}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from `fn() -> number` (or {label tuple: number})."""
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in sorted(items):
+            if v is not None:
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_num(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+# --------- Per-request stage timing ----------
+class StageTimer:
+    """Accumulates wall time per named stage (milliseconds) for one request.
+
+    `spans` keeps each (stage, start offset s, seconds) as well, for slow-request traces.
+    """
+
+    def __init__(self):
+        self.ms = {}
+        self.spans = []
+        self.t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start)
+
+    def add(self, name, seconds, start=None):
+        """`start` defaults to `seconds` before now (time that was measured elsewhere, e.g. a queue wait)."""
+        self.ms[name] = self.ms.get(name, 0.0) + seconds * 1000.0
+        if start is None:
+            start = time.perf_counter() - seconds
+        self.spans.append((name, start - self.t0, seconds))
+
+
+_current = contextvars.ContextVar("stage_timer", default=None)
+
+
+def start_request() -> StageTimer:
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def record_stage(name, seconds):
+    """Adds time to the current request's timer, if any (e.g. queue wait seen deep in a provider)."""
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, seconds)
@@ -0,0 +1,255 @@
+"""Versioned schema migrations for logs.db.
+
+`PRAGMA user_version` records the last applied step. Every step is idempotent
+(IF NOT EXISTS / column checks), so databases created before versioning, which
+report version 0, upgrade cleanly.
+
+Several processes may migrate at once (gunicorn workers starting together):
+they take turns on a `<db>.migrate.lock` file lock and re-read the version
+under SQLite's write lock, so each step runs once and the rest wait for it.
+"""
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, and no multi-process servers to race either
+    fcntl = None
+
+import responses
+import rollups
+
+# Per-request stages stored as <stage>_ms columns (same list as rollups.STAGES)
+STAGES = rollups.STAGES
+# How long a process waits for another one's migration (a first VACUUM of a big log takes minutes);
+# only while migrating, the connection's own busy_timeout is put back afterwards
+MIGRATE_BUSY_TIMEOUT_MS = 10 * 60 * 1000
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table});")}
+
+
+def _add_columns(conn, table, decls):
+    cols = _columns(conn, table)
+    for name, decl in decls:
+        if name not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl};")
+
+
+def _v1_interactions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS interactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            query TEXT NOT NULL,
+            response TEXT NOT NULL,
+            latency_ms INTEGER NOT NULL,
+            provider TEXT,
+            model TEXT
+        );
+    """)
+    _add_columns(conn, "interactions", [("provider", "TEXT"), ("model", "TEXT")])
+
+
+def _v2_timing_columns(conn):
+    _add_columns(
+        conn, "interactions",
+        [("ttft_ms", "INTEGER"), ("coalesced", "INTEGER NOT NULL DEFAULT 0")]
+        + [(f"{stage}_ms", "REAL") for stage in STAGES],
+    )
+
+
+def _v3_rollups(conn):
+    rollups.init(conn)
+    conn.commit()  # backfill runs its own chunked transactions
+    n = rollups.backfill(conn)
+    if n:
+        print(f"[migrate] built rollups from {n} existing rows")
+    conn.execute("BEGIN")
+
+
+def _v4_epoch_and_indexes(conn):
+    _add_columns(conn, "interactions", [("ts_epoch", "INTEGER")])
+    # ts is local time without an offset; the 'utc' modifier converts it like datetime.timestamp() does
+    conn.execute("""
+        UPDATE interactions SET ts_epoch = CAST(strftime('%s', ts, 'utc') AS INTEGER)
+        WHERE ts_epoch IS NULL;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_ts_epoch ON interactions(ts_epoch);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_provider_model ON interactions(provider, model);")
+
+
+def _v5_incremental_vacuum(conn):
+    # auto_vacuum only takes effect after a full VACUUM; done once here so later
+    # cleanups can hand pages back with cheap `PRAGMA incremental_vacuum` steps
+    (mode,) = conn.execute("PRAGMA auto_vacuum;").fetchone()
+    if mode != 2:
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+        conn.execute("BEGIN")
+
+
+def _v6_fts(conn):
+    # external-content FTS5 index: text lives once in interactions, triggers keep the index in step
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5(
+            query, response, content='interactions', content_rowid='id', tokenize='porter unicode61'
+        );
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_ai AFTER INSERT ON interactions BEGIN
+            INSERT INTO interactions_fts(rowid, query, response) VALUES (new.id, new.query, new.response);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_ad AFTER DELETE ON interactions BEGIN
+            INSERT INTO interactions_fts(interactions_fts, rowid, query, response)
+            VALUES ('delete', old.id, old.query, old.response);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_au AFTER UPDATE OF query, response ON interactions BEGIN
+            INSERT INTO interactions_fts(interactions_fts, rowid, query, response)
+            VALUES ('delete', old.id, old.query, old.response);
+            INSERT INTO interactions_fts(rowid, query, response) VALUES (new.id, new.query, new.response);
+        END;
+    """)
+    # default ORDER BY rank: bm25 with a hit in the question worth double a hit in the answer
+    conn.execute("INSERT INTO interactions_fts(interactions_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)');")
+    conn.execute("INSERT INTO interactions_fts(interactions_fts) VALUES ('rebuild');")
+
+
+def _v7_status(conn):
+    # ok | error | timeout | cancelled; rows from before this step were all answered
+    _add_columns(conn, "interactions", [("status", "TEXT NOT NULL DEFAULT 'ok'")])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_not_ok ON interactions(status) WHERE status != 'ok';")
+
+
+def _v8_responses(conn):
+    # each distinct answer stored once, compressed; interactions.response_id points at it
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL
+        );
+    """)
+    _add_columns(conn, "interactions", [("response_id", "INTEGER")])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_response_id ON interactions(response_id);")
+    # the answer text doesn't change when it moves, so the FTS triggers are off while it does
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS interactions_fts_{suffix};")
+    moved = responses.backfill(conn)
+    if moved:
+        print(f"[migrate] moved {moved} answers into responses")
+    # FTS content now comes from a view that decompresses answers; rebuilt once against it
+    conn.execute("DROP TABLE IF EXISTS interactions_fts;")
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS interactions_text AS
+        SELECT id, query, {responses.TEXT_SQL} AS response FROM interactions;
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE interactions_fts USING fts5(
+            query, response, content='interactions_text', content_rowid='id', tokenize='porter unicode61'
+        );
+    """)
+    new_text, old_text = responses.text_sql("new."), responses.text_sql("old.")
+    conn.execute(f"""
+        CREATE TRIGGER interactions_fts_ai AFTER INSERT ON interactions BEGIN
+            INSERT INTO interactions_fts(rowid, query, response) VALUES (new.id, new.query, {new_text});
+        END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER interactions_fts_ad AFTER DELETE ON interactions BEGIN
+            INSERT INTO interactions_fts(interactions_fts, rowid, query, response)
+            VALUES ('delete', old.id, old.query, {old_text});
+        END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER interactions_fts_au AFTER UPDATE OF query, response, response_id ON interactions BEGIN
+            INSERT INTO interactions_fts(interactions_fts, rowid, query, response)
+            VALUES ('delete', old.id, old.query, {old_text});
+            INSERT INTO interactions_fts(rowid, query, response) VALUES (new.id, new.query, {new_text});
+        END;
+    """)
+    conn.execute("INSERT INTO interactions_fts(interactions_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)');")
+    conn.execute("INSERT INTO interactions_fts(interactions_fts) VALUES ('rebuild');")
+    if moved:
+        # answers shrank in place; one full VACUUM hands the space back (like step 5)
+        conn.commit()
+        conn.execute("VACUUM;")
+        conn.execute("BEGIN")
+
+
+# (version, description, step). Append only: never edit or reorder a shipped step.
+MIGRATIONS = [
+    (1, "interactions table", _v1_interactions),
+    (2, "ttft / coalesced / per-stage timing columns", _v2_timing_columns),
+    (3, "rollup tables", _v3_rollups),
+    (4, "ts_epoch column and indexes", _v4_epoch_and_indexes),
+    (5, "incremental auto-vacuum", _v5_incremental_vacuum),
+    (6, "full-text index", _v6_fts),
+    (7, "request status column", _v7_status),
+    (8, "deduplicated, compressed answer storage", _v8_responses),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def version(conn) -> int:
+    (v,) = conn.execute("PRAGMA user_version;").fetchone()
+    return int(v)
+
+
+@contextmanager
+def _process_lock(conn):
+    # steps 3, 5 and 8 commit part-way (chunked backfill, VACUUM), so SQLite's write lock alone
+    # would let another process start the same step in between
+    path = next((row[2] for row in conn.execute("PRAGMA database_list;") if row[1] == "main"), "")
+    if fcntl is None or not path:
+        yield
+        return
+    with open(path + ".migrate.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def migrate(conn, target=None, busy_timeout_ms=MIGRATE_BUSY_TIMEOUT_MS) -> int:
+    """Applies pending steps, each in its own transaction; returns the resulting version.
+
+    `conn` must be in autocommit mode (isolation_level=None). `target` stops at
+    that version (bench_db.py uses it to build a database as an older release had it).
+    """
+    last = LATEST if target is None else min(target, LATEST)
+    current = version(conn)
+    if current >= last:
+        return current
+    (saved,) = conn.execute("PRAGMA busy_timeout;").fetchone()
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)};")
+    try:
+        with _process_lock(conn):
+            for v, desc, step in MIGRATIONS:
+                if v > last:
+                    break
+                if v <= current:
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                # read under the write lock: another process may have applied this step while we waited
+                current = version(conn)
+                if v <= current:
+                    conn.rollback()
+                    continue
+                try:
+                    step(conn)
+                    conn.execute(f"PRAGMA user_version={v};")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"[migrate] {v}: {desc}")
+                current = v
+    finally:
+        conn.execute(f"PRAGMA busy_timeout={int(saved)};")
+    return current
@@ -0,0 +1,490 @@
+"""One process that owns the local HF model, shared by every web worker.
+
+With gunicorn each worker would otherwise load its own copy of the model and
+run inference on top of the others. Instead, set HF_MODEL_SERVER to a socket
+path: workers send prompts here over a Unix socket, and prompts from all
+workers are batched together by one MicroBatcher.
+
+    python model_server.py --socket /tmp/chatbot-model.sock      # or let the first worker spawn it
+    HF_MODEL_SERVER=/tmp/chatbot-model.sock gunicorn -w 4 app_logging_autodetect:app
+
+Framing: a 4-byte big-endian length, then a compact JSON object. Requests
+carry an id, so one connection per worker process multiplexes any number of
+concurrent calls:
+    {"id": 7, "op": "generate", "prompt": "..."}  -> {"id": 7, "text": "...", "queue_wait_s": 0.01}
+    {"id": 8, "op": "stream", "prompt": "..."}    -> {"id": 8, "chunk": "..."} ... {"id": 8, "done": true}
+    {"id": 9, "op": "health"}                     -> {"id": 9, "health": {...}}
+    {"id": 10, "op": "cancel", "target": 8}       -> (no reply; call 8 ends with status "cancelled")
+    {"id": 11, "op": "profile", "seconds": 10}    -> {"id": 11, "profile": {...}}  (see profiler.py)
+Failures come back as {"id": ..., "error": "..."}. generate and stream take an
+optional "timeout_s" (what is left of the request's deadline); work that runs
+out of time or is cancelled stops at the next token and fails with
+{"id": ..., "error": "...", "status": "timeout" | "cancelled"}. Calls still
+running when a worker's connection drops are cancelled too.
+"""
+import argparse
+import fcntl
+import json
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import hf_backend
+from cancellation import Cancelled, Deadline
+from hf_batcher import MicroBatcher
+from profiler import SamplingProfiler
+
+_HEADER = struct.Struct("!I")
+
+
+def send_msg(sock, obj, lock):
+    data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    with lock:
+        sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_msg(f):
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    (n,) = _HEADER.unpack(header)
+    data = f.read(n)
+    if len(data) < n:
+        return None
+    return json.loads(data)
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except Exception:
+        return None
+
+
+# --------- Server ----------
+class ModelServer:
+    """Listens right away (health says "loading"); generate calls wait until the model is ready."""
+
+    def __init__(self, path, backend="pytorch", onnx_dir=hf_backend.DEFAULT_ONNX_DIR, intra=0, inter=0,
+                 max_batch=8, window_ms=10):
+        self.path = path
+        self.backend, self.onnx_dir, self.intra, self.inter = backend, onnx_dir, intra, inter
+        self.max_batch, self.window_ms = max(1, int(max_batch)), window_ms
+        self.pipe = None
+        self.model = None
+        self.info = {}
+        self.status = "loading"
+        self.error = None
+        self._ready = threading.Event()
+        self._batcher = None
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._served = {"generate": 0, "stream": 0, "errors": 0, "cancelled": 0}
+        self._started = time.time()
+        self.sampler = SamplingProfiler(max_seconds=float(os.environ.get("PROFILE_MAX_S", "60")))
+
+    def serve_forever(self):
+        sock = self._listen()
+        threading.Thread(target=self._accept, args=(sock,), name="model-accept", daemon=True).start()
+        t0 = time.perf_counter()
+        try:
+            self.pipe, self.model, self.info = hf_backend.load_first(self.backend, self.onnx_dir, self.intra, self.inter)
+            hf_backend.prepare_for_batching(self.pipe)
+            self._batcher = MicroBatcher(lambda prompts, stop: hf_backend.run_batch(self.pipe, prompts, stop),
+                                         max_batch=self.max_batch, window_ms=self.window_ms, name="model-batcher")
+            self._batcher("Hello")  # warm-up
+            self.info["load_ms"] = int((time.perf_counter() - t0) * 1000)
+            self.status = "ready"
+            print(f"[model-server] {self.model} ready on {self.path} after {self.info['load_ms']} ms", flush=True)
+        except Exception as e:
+            self.status, self.error = "failed", repr(e)
+            print("Model server error:", repr(e), flush=True)
+        self._ready.set()
+        while True:
+            time.sleep(3600)
+
+    def _listen(self):
+        if os.path.exists(self.path):
+            # a leftover socket file from a dead server; a live one would accept the probe
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise SystemExit(f"a model server is already listening on {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o660)
+        sock.listen(128)
+        return sock
+
+    def _accept(self, sock):
+        while True:
+            conn, _ = sock.accept()
+            threading.Thread(target=self._connection, args=(conn,), name="model-conn", daemon=True).start()
+
+    def health(self) -> dict:
+        with self._lock:
+            served, conns = dict(self._served), self._connections
+        return {
+            "status": self.status,
+            "error": self.error,
+            "model": self.model,
+            "pid": os.getpid(),
+            "rss_mb": _rss_mb(),
+            "uptime_s": int(time.time() - self._started),
+            "connections": conns,
+            "served": served,
+            "batching": self._batcher.stats() if self._batcher is not None else None,
+            "profiler": self.sampler.stats(),
+            **self.info,
+        }
+
+    def _connection(self, conn):
+        with self._lock:
+            self._connections += 1
+        lock = threading.Lock()
+        calls = {}  # id -> Deadline of this worker's generate/stream calls still running
+        f = conn.makefile("rb")
+        try:
+            while True:
+                msg = recv_msg(f)
+                if msg is None:
+                    return
+                self._dispatch(conn, lock, calls, msg)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections -= 1
+            conn.close()
+            # the worker is gone (restart, crash): nobody will read these answers
+            for deadline in list(calls.values()):
+                deadline.cancel()
+
+    def _dispatch(self, conn, lock, calls, msg):
+        rid, op = msg.get("id"), msg.get("op")
+        if op == "health":
+            send_msg(conn, {"id": rid, "health": self.health()}, lock)
+            return
+        if op == "cancel":
+            deadline = calls.get(msg.get("target"))
+            if deadline is not None:
+                deadline.cancel()
+            return
+        if op == "profile":
+            # samples on its own thread; this connection keeps serving generate calls meanwhile
+            threading.Thread(target=self._profile, args=(conn, lock, msg), name="model-profile", daemon=True).start()
+            return
+        if op not in ("generate", "stream"):
+            send_msg(conn, {"id": rid, "error": f"unknown op {op!r}"}, lock)
+            return
+        if rid not in calls:
+            calls[rid] = Deadline(msg.get("timeout_s") or 0)
+        if not self._ready.is_set() or self.status != "ready":
+            # don't block the connection's reader while the model loads
+            threading.Thread(target=self._when_ready, args=(conn, lock, calls, msg), daemon=True).start()
+            return
+        if op == "generate":
+            fut = self._batcher.submit(msg["prompt"], deadline=calls[rid])
+            fut.add_done_callback(lambda f: self._reply(conn, lock, calls, rid, f))
+        else:
+            threading.Thread(target=self._stream, args=(conn, lock, calls, rid, msg["prompt"]),
+                             name="model-stream", daemon=True).start()
+
+    def _when_ready(self, conn, lock, calls, msg):
+        self._ready.wait()
+        if self.status != "ready":
+            calls.pop(msg.get("id"), None)
+            self._send_quietly(conn, lock, {"id": msg.get("id"), "error": f"model server {self.status}: {self.error}"})
+            return
+        self._dispatch(conn, lock, calls, msg)
+
+    def _reply(self, conn, lock, calls, rid, fut):
+        calls.pop(rid, None)
+        try:
+            out = {"id": rid, "text": fut.result(), "queue_wait_s": round(fut.queue_wait_s, 6)}
+            self._count("generate")
+        except Cancelled as e:
+            out = {"id": rid, "error": str(e), "status": e.status}
+            self._count("cancelled")
+        except Exception as e:
+            out = {"id": rid, "error": repr(e)}
+            self._count("errors")
+        self._send_quietly(conn, lock, out)
+
+    def _stream(self, conn, lock, calls, rid, prompt):
+        deadline = calls[rid]
+        try:
+            for piece in hf_backend.stream(self.pipe, prompt, should_stop=deadline.expired):
+                send_msg(conn, {"id": rid, "chunk": piece}, lock)
+            deadline.check()
+            out = {"id": rid, "done": True}
+            self._count("stream")
+        except OSError:
+            deadline.cancel()  # the worker went away mid-stream
+            return
+        except Cancelled as e:
+            out = {"id": rid, "error": str(e), "status": e.status}
+            self._count("cancelled")
+        except Exception as e:
+            out = {"id": rid, "error": repr(e)}
+            self._count("errors")
+        finally:
+            calls.pop(rid, None)
+        self._send_quietly(conn, lock, out)
+
+    def _profile(self, conn, lock, msg):
+        try:
+            out = {"id": msg.get("id"), "profile": self.sampler.profile(
+                msg.get("seconds", 10), msg.get("interval_ms", 10), msg.get("idle", False), msg.get("lines", False))}
+        except Exception as e:
+            out = {"id": msg.get("id"), "error": str(e)}
+        self._send_quietly(conn, lock, out)
+
+    def _send_quietly(self, conn, lock, obj):
+        try:
+            send_msg(conn, obj, lock)
+        except OSError:
+            pass
+
+    def _count(self, key):
+        with self._lock:
+            self._served[key] += 1
+
+
+
+# --------- Client (one per web worker process) ----------
+class ModelClient:
+    """Talks to a ModelServer; `submit()` matches MicroBatcher's, so callers can't tell the difference.
+
+    Calls share one connection per process (reopened after a fork or a broken
+    connection). With `spawn=True`, the first worker that finds no server
+    starts one, guarded by a lock file so concurrent workers start only one.
+    """
+
+    def __init__(self, path, spawn=False, connect_timeout_s=30.0, request_timeout_s=300.0):
+        self.path = path
+        self.spawn = spawn
+        self.connect_timeout_s = float(connect_timeout_s)
+        self.request_timeout_s = float(request_timeout_s)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sock = None
+        self._pid = None
+        self._next_id = 0
+        self._pending = {}  # id -> Future (generate/health) or Queue (stream)
+        self._health = {}
+
+    # ----- connection -----
+    def _conn(self):
+        with self._lock:
+            if self._sock is not None and self._pid == os.getpid():
+                return self._sock
+            # never reuse a socket inherited across fork: replies would go to the wrong process
+            self._sock, self._pending = None, {}
+            sock = self._connect()
+            self._sock, self._pid = sock, os.getpid()
+            threading.Thread(target=self._read, args=(sock,), name="model-client", daemon=True).start()
+            return sock
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout_s
+        spawned = False
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                sock.close()
+                if self.spawn and not spawned:
+                    self._spawn()
+                    spawned = True
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"model server not reachable at {self.path}: {e!r}")
+                time.sleep(0.1)
+
+    def _spawn(self):
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                return  # another worker got there first
+            except OSError:
+                pass
+            finally:
+                probe.close()
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--socket", self.path],
+                             start_new_session=True)
+            # hold the lock until the socket exists so the next worker connects instead of spawning
+            deadline = time.monotonic() + 30
+            while not os.path.exists(self.path) and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+    def _read(self, sock):
+        f = sock.makefile("rb")
+        try:
+            while True:
+                msg = recv_msg(f)
+                if msg is None:
+                    break
+                with self._lock:
+                    waiter = self._pending.get(msg.get("id"))
+                    if waiter is not None and not isinstance(waiter, queue.Queue):
+                        self._pending.pop(msg["id"], None)
+                if isinstance(waiter, queue.Queue):
+                    waiter.put(msg)
+                elif waiter is not None:
+                    self._resolve(waiter, msg)
+        except OSError:
+            pass
+        with self._lock:
+            pending = self._pending if self._sock is sock else {}
+            if self._sock is sock:
+                self._sock, self._pending = None, {}
+        for waiter in pending.values():
+            lost = {"error": "model server connection lost"}
+            waiter.put(lost) if isinstance(waiter, queue.Queue) else self._resolve(waiter, lost)
+
+    @staticmethod
+    def _error(msg):
+        return Cancelled(msg["status"], msg["error"]) if msg.get("status") else RuntimeError(msg["error"])
+
+    def _resolve(self, fut, msg):
+        if fut.done():
+            return  # cancelled by the caller (e.g. an asyncio request that went away)
+        fut.queue_wait_s = msg.get("queue_wait_s", 0.0)
+        if "error" in msg:
+            fut.set_exception(self._error(msg))
+        else:
+            fut.set_result(msg["text"] if "text" in msg else msg.get("health", msg.get("profile")))
+
+    def _call(self, op, waiter, **fields):
+        sock = self._conn()
+        with self._lock:
+            self._next_id += 1
+            rid = self._next_id
+            self._pending[rid] = waiter
+        try:
+            send_msg(sock, {"id": rid, "op": op, **fields}, self._send_lock)
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(rid, None)
+                if self._sock is sock:
+                    self._sock = None
+            raise ConnectionError(f"model server connection lost: {e!r}")
+        return rid
+
+    def _cancel(self, rid):
+        # best effort: the reply (status "cancelled") still resolves the caller's Future or stream
+        with self._lock:
+            sock = self._sock if self._pid == os.getpid() and rid in self._pending else None
+        if sock is not None:
+            try:
+                send_msg(sock, {"id": 0, "op": "cancel", "target": rid}, self._send_lock)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _deadline_fields(deadline):
+        left = deadline.remaining() if deadline is not None else None
+        return {} if left is None else {"timeout_s": round(max(left, 0.001), 3)}
+
+    # ----- API -----
+    def submit(self, prompt, deadline=None) -> Future:
+        fut = Future()
+        fut.queue_wait_s = 0.0
+        rid = self._call("generate", fut, prompt=prompt, **self._deadline_fields(deadline))
+        if deadline is not None:
+            deadline.on_cancel(lambda: self._cancel(rid))
+        fut.add_done_callback(lambda f: f.cancelled() and self._cancel(rid))
+        return fut
+
+    def __call__(self, prompt, timeout=None):
+        return self.submit(prompt).result(timeout=timeout or self.request_timeout_s)
+
+    def stream(self, prompt, deadline=None):
+        q = queue.Queue()
+        rid = self._call("stream", q, prompt=prompt, **self._deadline_fields(deadline))
+        if deadline is not None:
+            deadline.on_cancel(lambda: self._cancel(rid))
+        finished = False
+        try:
+            while True:
+                msg = q.get(timeout=self.request_timeout_s)
+                if "chunk" in msg:
+                    yield msg["chunk"]
+                elif "error" in msg:
+                    finished = True
+                    raise self._error(msg)
+                else:
+                    finished = True
+                    return
+        finally:
+            if not finished:
+                self._cancel(rid)  # closed early: stop generating for nobody
+            with self._lock:
+                self._pending.pop(rid, None)
+
+    def health(self, timeout=1.0) -> dict:
+        fut = Future()
+        self._call("health", fut)
+        return fut.result(timeout=timeout)
+
+    def profile(self, seconds=10.0, interval_ms=10.0, idle=False, lines=False) -> dict:
+        """Samples the server process's threads (the forward passes run there); see SamplingProfiler."""
+        fut = Future()
+        self._call("profile", fut, seconds=seconds, interval_ms=interval_ms, idle=idle, lines=lines)
+        return fut.result(timeout=float(seconds) + 30.0)
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the server has loaded its model; returns its health."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            h = self.health(timeout=5.0)
+            if h["status"] == "ready":
+                return h
+            if h["status"] == "failed":
+                raise RuntimeError(f"model server failed to load: {h.get('error')}")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("model server still loading")
+            time.sleep(0.5)
+
+    def stats(self) -> dict:
+        """The server's own view (readiness, batch queue, RSS), as /health shows it."""
+        try:
+            self._health = {"reachable": True, **self.health()}
+        except Exception as e:
+            self._health = {**self._health, "reachable": False, "error": repr(e)}
+        with self._lock:
+            self._health["pending_here"] = len(self._pending)
+        return self._health
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve the local HF model to the API's workers over a Unix socket.")
+    ap.add_argument("--socket", default=os.environ.get("HF_MODEL_SERVER") or "/tmp/chatbot-model.sock")
+    ap.add_argument("--backend", default=os.environ.get("HF_BACKEND", "pytorch"))
+    ap.add_argument("--onnx-dir", default=os.environ.get("HF_ONNX_DIR", hf_backend.DEFAULT_ONNX_DIR))
+    ap.add_argument("--threads", type=int, default=int(os.environ.get("HF_INTRA_OP_THREADS", "0")))
+    ap.add_argument("--interop-threads", type=int, default=int(os.environ.get("HF_INTER_OP_THREADS", "0")))
+    ap.add_argument("--max-batch", type=int, default=int(os.environ.get("HF_BATCH_MAX", "8")))
+    ap.add_argument("--window-ms", type=float, default=float(os.environ.get("HF_BATCH_WINDOW_MS", "10")))
+    args = ap.parse_args(argv)
+    ModelServer(args.socket, args.backend, args.onnx_dir, args.threads, args.interop_threads,
+                args.max_batch, args.window_ms).serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""On-demand sampling profiler and slow-request traces (admin debugging).
+
+    GET /admin/profile?seconds=10      collapsed stacks of every thread in the worker, for flamegraphs
+    GET /admin/slow                    per-stage traces of recent requests slower than SLOW_REQUEST_MS
+
+Nothing runs between profiles: `SamplingProfiler.profile()` samples on the
+calling thread for the requested time and then returns. Output is the
+"collapsed" format read by flamegraph.pl, speedscope and inferno: one line per
+distinct stack, frames root first separated by ";", then the sample count.
+"""
+import collections
+import re
+import sys
+import threading
+import time
+import datetime as _dt
+
+# a thread whose innermost Python frame is in one of these is parked on a lock, queue or socket, not working
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socket.py", "socketserver.py", "ssl.py")
+# ...or in C code called from one of these: executor threads in SimpleQueue.get, the model server's main thread asleep
+_IDLE_FUNCS = {("thread.py", "_worker"), ("model_server.py", "serve_forever")}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _is_idle(code):
+    name = code.co_filename.rsplit("/", 1)[-1]
+    return name in _IDLE_FILES or (name, code.co_name) in _IDLE_FUNCS
+
+
+class SamplingProfiler:
+    """Samples the Python stack of every other thread in the process every `interval_ms`.
+
+    One profile runs at a time (ProfilerBusy otherwise); `max_seconds` caps how
+    long a caller can keep it going. Frame labels are "module:qualname", plus the
+    line number with `lines=True`. Idle threads are left out unless `idle=True`.
+    """
+
+    def __init__(self, max_seconds=60.0, min_interval_ms=1.0):
+        self.max_seconds = float(max_seconds)
+        self.min_interval_ms = float(min_interval_ms)
+        self._busy = threading.Lock()
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._last = None
+
+    def profile(self, seconds=10.0, interval_ms=10.0, idle=False, lines=False) -> dict:
+        seconds = min(max(float(seconds), 0.1), self.max_seconds)
+        interval = max(float(interval_ms), self.min_interval_ms) / 1000.0
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy("a profile is already running in this process")
+        try:
+            return self._sample(seconds, interval, idle, lines)
+        finally:
+            self._busy.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"running": self._busy.locked(), "runs": self._runs, "last": dict(self._last or {})}
+
+    def _label(self, frame, lines):
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get("__name__") or code.co_filename.rsplit("/", 1)[-1]
+            label = f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(";", ":")
+            self._labels[code] = label
+        return f"{label}:{frame.f_lineno}" if lines else label
+
+    def _sample(self, seconds, interval, idle, lines):
+        me = threading.get_ident()
+        stacks = collections.Counter()
+        leaves = collections.Counter()
+        ticks = skipped = 0
+        spent = 0.0
+        start = next_tick = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            t = time.perf_counter()
+            # pool threads differ only by number; "Thread-N (worker)" keeps one flame per kind
+            names = {th.ident: re.sub(r"\d+", "N", th.name) for th in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not idle and _is_idle(frame.f_code):
+                    skipped += 1
+                    continue
+                labels = []
+                while frame is not None and len(labels) < 256:
+                    labels.append(self._label(frame, lines))
+                    frame = frame.f_back
+                labels.append(names.get(ident, "thread"))
+                labels.reverse()
+                stacks[";".join(labels)] += 1
+                leaves[labels[-1]] += 1
+            ticks += 1
+            spent += time.perf_counter() - t
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+        samples = sum(stacks.values())
+        result = {
+            "started": _dt.datetime.now().isoformat(timespec="seconds"),
+            "seconds": round(elapsed, 3),
+            "interval_ms": round(interval * 1000.0, 3),
+            "ticks": ticks,
+            "samples": samples,
+            "idle_skipped": skipped,
+            # GIL time the sampler itself held, as a share of the wall time profiled
+            "overhead_pct": round(100.0 * spent / elapsed, 2) if elapsed else 0.0,
+            "top": [{"frame": f, "samples": n, "pct": round(100.0 * n / samples, 1)}
+                    for f, n in leaves.most_common(20)],
+            "collapsed": "\n".join(f"{s} {n}" for s, n in stacks.most_common()),
+        }
+        with self._lock:
+            self._runs += 1
+            self._last = {k: v for k, v in result.items() if k not in ("top", "collapsed")}
+        return result
+
+
+class SlowRequests:
+    """Bounded ring of per-stage traces for requests that took at least `threshold_ms` (0 = off).
+
+    Requests under the threshold cost one comparison; only slow ones build a trace.
+    """
+
+    def __init__(self, threshold_ms=0, size=200):
+        self.threshold_s = max(0.0, float(threshold_ms)) / 1000.0
+        self._ring = collections.deque(maxlen=max(1, int(size)))
+        self._lock = threading.Lock()
+        self._captured = 0
+
+    def wants(self, total_s) -> bool:
+        return self.threshold_s > 0 and total_s >= self.threshold_s
+
+    def add(self, timer, total_s, query="", **fields):
+        trace = {
+            "ts": _dt.datetime.now().isoformat(timespec="milliseconds"),
+            "total_ms": round(total_s * 1000.0, 2),
+            "query": query[:300],
+            **fields,
+            "stages": {k: round(v, 2) for k, v in timer.ms.items()},
+            # every stage in the order it finished, with its start offset: nested ones overlap (provider ⊃ queue)
+            "spans": [{"stage": name, "start_ms": round(at * 1000.0, 2), "ms": round(s * 1000.0, 2)}
+                      for name, at, s in timer.spans],
+        }
+        with self._lock:
+            self._captured += 1
+            trace["n"] = self._captured
+            self._ring.append(trace)
+
+    def recent(self, limit=50) -> list:
+        with self._lock:
+            items = list(self._ring)
+        return items[::-1][:max(0, int(limit))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": round(self.threshold_s * 1000.0, 1),
+                "size": self._ring.maxlen,
+                "held": len(self._ring),
+                "captured": self._captured,
+            }
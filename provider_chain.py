@@ -0,0 +1,383 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cancellation
+from cancellation import Cancelled
+
+
+# --------- Circuit breaker per provider ----------
+class CircuitBreaker:
+    """Opens after `failures` consecutive errors; after `cooldown_s` one probe call is let through.
+
+    closed -> open (skip the provider) -> half-open (one trial) -> closed on success / open again on failure
+    """
+
+    def __init__(self, failures=5, cooldown_s=30.0):
+        self.failures = max(1, int(failures))
+        self.cooldown_s = float(cooldown_s)
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.cooldown_s else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_s or self._probing:
+                return False
+            self._probing = True  # let exactly one request test the provider
+            return True
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def abandon(self):
+        """The probe call was cancelled before it could tell us anything; let another one try."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                if self._opened_at is None or self._probing:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyWindow:
+    """Latencies (seconds) of the last `size` successful calls."""
+
+    def __init__(self, size=200):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p, min_samples=1):
+        with self._lock:
+            values = sorted(self._values)
+        if len(values) < max(1, min_samples):
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+# --------- Ordered fallback chain with optional hedging ----------
+class ProviderChain:
+    """Tries providers in order: skip the ones whose breaker is open, fall back on error or timeout.
+
+    With `hedge=True`, if the provider being tried has not answered by its observed
+    p95 (once `min_samples` answers are known), the next provider is started as
+    well and the first answer wins. Sync calls run on a thread pool so timeouts
+    and hedges can be enforced; a call that is abandoned keeps running in its
+    thread (provider SDKs can't be interrupted) but its result is ignored.
+    Async calls cancel the losing task.
+
+    The request's deadline (cancellation.current()) bounds the whole call.
+    When it passes, Cancelled is raised right away and no fallback is tried.
+    Abandoned provider calls see the same deadline and stop on their own.
+    Cancelled work doesn't count against a provider's breaker.
+    """
+
+    def __init__(self, names, timeouts=None, hedge=False, hedge_min_ms=50, min_samples=20,
+                 failures=5, cooldown_s=30.0, max_workers=32):
+        if not names:
+            raise ValueError("provider chain is empty")
+        self.names = list(names)
+        self.timeouts = {n: float((timeouts or {}).get(n) or 0) for n in self.names}
+        self.hedge = bool(hedge)
+        self.hedge_min_s = float(hedge_min_ms) / 1000.0
+        self.min_samples = int(min_samples)
+        self.breakers = {n: CircuitBreaker(failures, cooldown_s) for n in self.names}
+        self.latency = {n: LatencyWindow() for n in self.names}
+        self._lock = threading.Lock()
+        self._counts = {n: {"calls": 0, "wins": 0, "errors": 0, "timeouts": 0, "hedged": 0} for n in self.names}
+        self._pool = None
+        self._max_workers = int(max_workers)
+
+    # ----- bookkeeping -----
+    def _next_allowed(self, queue_):
+        # breakers are asked only when a provider is about to be called, so a
+        # half-open probe slot isn't claimed by a provider that never runs
+        while queue_:
+            name = queue_.popleft()
+            if self.breakers[name].allow():
+                return name
+        return None
+
+    def _unavailable(self):
+        return RuntimeError("all providers are unavailable (circuit open): " + ", ".join(self.names))
+
+    def hedge_after(self, name):
+        if not self.hedge:
+            return None
+        p95 = self.latency[name].percentile(95, self.min_samples)
+        return None if p95 is None else max(p95, self.hedge_min_s)
+
+    def _bump(self, name, key):
+        with self._lock:
+            self._counts[name][key] += 1
+
+    def record(self, name, ok, seconds=None, timed_out=False):
+        self._bump(name, "calls")
+        if ok:
+            self.breakers[name].success()
+            self.latency[name].add(seconds)
+        else:
+            self.breakers[name].failure()
+            self._bump(name, "timeouts" if timed_out else "errors")
+
+    def _record_late(self, name, fut, started):
+        try:
+            fut.result()
+        except Cancelled:
+            self.breakers[name].abandon()
+            return
+        except Exception:
+            self.record(name, False)
+            return
+        self.record(name, True, time.monotonic() - started)
+
+    def _won(self, name, hedged):
+        self._bump(name, "wins")
+        if hedged:
+            self._bump(name, "hedged")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {n: dict(c) for n, c in self._counts.items()}
+        out = {}
+        for n in self.names:
+            p50 = self.latency[n].percentile(50)
+            p95 = self.latency[n].percentile(95)
+            out[n] = {
+                **counts[n],
+                "breaker": self.breakers[n].state,
+                "trips": self.breakers[n].trips,
+                "timeout_s": self.timeouts[n] or None,
+                "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "hedge_after_ms": None if self.hedge_after(n) is None else round(self.hedge_after(n) * 1000, 1),
+            }
+        return {"order": self.names, "hedge": self.hedge, "providers": out}
+
+    # ----- sync -----
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="provider")
+        return self._pool
+
+    def call(self, query, generate):
+        """`generate(name, query) -> (text, model)`; returns (text, model, name) of the first success."""
+        deadline = cancellation.current()
+        deadline.check()
+        if len(self.names) == 1 and not self.timeouts[self.names[0]]:
+            # nothing to fall back to or time out: call inline (no thread hop)
+            name, t0 = self.names[0], time.perf_counter()
+            if not self.breakers[name].allow():
+                raise self._unavailable()
+            try:
+                text, model = generate(name, query)
+            except Cancelled:
+                self.breakers[name].abandon()
+                raise
+            except Exception:
+                self.record(name, False)
+                raise
+            self.record(name, True, time.perf_counter() - t0)
+            self._won(name, False)
+            return text, model, name
+
+        queue_ = deque(self.names)
+        running = {}  # future -> (name, started, deadline, hedge_at, hedged)
+        last_error = None
+
+        def launch(hedged=False):
+            name = self._next_allowed(queue_)
+            if name is None:
+                return
+            # copy the context so stage timings recorded inside the provider reach this request
+            ctx = contextvars.copy_context()
+            started = time.monotonic()
+            fut = self._executor().submit(ctx.run, generate, name, query)
+            timeout = self.timeouts[name]
+            hedge = self.hedge_after(name) if queue_ else None
+            running[fut] = (name, started, started + timeout if timeout else None,
+                            started + hedge if hedge is not None else None, hedged)
+
+        launch()
+        if not running:
+            raise self._unavailable()
+        while running:
+            now = time.monotonic()
+            marks = [m for _, _, d, h, _ in running.values() for m in (d, h) if m is not None]
+            if deadline.expires_at is not None:
+                marks.append(deadline.expires_at)
+            done, _ = wait(list(running), timeout=max(0.0, min(marks) - now) if marks else None,
+                           return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, started, _, _, hedged = running.pop(fut)
+                try:
+                    text, model = fut.result()
+                except Cancelled:
+                    self._abandon(running)
+                    self.breakers[name].abandon()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    self.record(name, False)
+                    continue
+                self.record(name, True, time.monotonic() - started)
+                self._won(name, hedged)
+                for other, (other_name, other_started, *_) in running.items():
+                    # the loser still finishes in its thread; its outcome keeps breaker and p95 honest
+                    other.add_done_callback(lambda f, n=other_name, t=other_started: self._record_late(n, f, t))
+                return text, model, name
+            if deadline.expired():
+                self._abandon(running)
+                deadline.check()
+            now = time.monotonic()
+            for fut, (name, started, timeout_at, hedge_at, hedged) in list(running.items()):
+                if timeout_at is not None and now >= timeout_at:
+                    running.pop(fut)
+                    last_error = TimeoutError(f"{name} did not answer within {self.timeouts[name]:g}s")
+                    self.record(name, False, timed_out=True)
+                elif hedge_at is not None and now >= hedge_at and queue_:
+                    running[fut] = (name, started, timeout_at, None, hedged)
+                    launch(hedged=True)
+            if not running and queue_:
+                launch()
+        raise last_error or self._unavailable()
+
+    def _abandon(self, running):
+        # the request is over; calls still running see its deadline and stop themselves
+        for name, *_ in running.values():
+            self.breakers[name].abandon()
+        running.clear()
+
+    # ----- streaming -----
+    def stream(self, query, open_stream):
+        """`open_stream(name, query) -> (chunks, model)`; returns (chunks, model, name).
+
+        Falls back until a provider produces its first chunk. After that the answer
+        is committed to that provider (no hedging once tokens are flowing).
+        """
+        last_error = None
+        queue_ = deque(self.names)
+        while True:
+            name = self._next_allowed(queue_)
+            if name is None:
+                raise last_error or self._unavailable()
+            started = time.perf_counter()
+            try:
+                chunks, model = open_stream(name, query)
+                chunks = iter(chunks)
+                first = next(chunks, None)
+            except Cancelled:
+                self.breakers[name].abandon()
+                raise
+            except Exception as e:
+                last_error = e
+                self.record(name, False)
+                continue
+            return self._relay(name, started, first, chunks), model, name
+
+    def _relay(self, name, started, first, chunks):
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except (Cancelled, GeneratorExit):
+            # the request ended (deadline, disconnect); says nothing about the provider
+            self.breakers[name].abandon()
+            raise
+        except Exception:
+            self.record(name, False)
+            raise
+        self.record(name, True, time.perf_counter() - started)
+        self._won(name, False)
+
+    # ----- async -----
+    async def acall(self, query, agenerate):
+        """Async twin of `call`: `agenerate(name, query)` is a coroutine; losers are cancelled."""
+        deadline = cancellation.current()
+        deadline.check()
+        queue_ = deque(self.names)
+        running = {}  # task -> (name, started, deadline, hedge_at, hedged)
+        last_error = None
+
+        def launch(hedged=False):
+            name = self._next_allowed(queue_)
+            if name is None:
+                return
+            started = time.monotonic()
+            task = asyncio.ensure_future(agenerate(name, query))
+            timeout = self.timeouts[name]
+            hedge = self.hedge_after(name) if queue_ else None
+            running[task] = (name, started, started + timeout if timeout else None,
+                             started + hedge if hedge is not None else None, hedged)
+
+        launch()
+        if not running:
+            raise self._unavailable()
+        try:
+            while running:
+                now = time.monotonic()
+                marks = [m for _, _, d, h, _ in running.values() for m in (d, h) if m is not None]
+                if deadline.expires_at is not None:
+                    marks.append(deadline.expires_at)
+                done, _ = await asyncio.wait(list(running), timeout=max(0.0, min(marks) - now) if marks else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name, started, _, _, hedged = running.pop(task)
+                    try:
+                        text, model = task.result()
+                    except Cancelled:
+                        self.breakers[name].abandon()
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        self.record(name, False)
+                        continue
+                    self.record(name, True, time.monotonic() - started)
+                    self._won(name, hedged)
+                    return text, model, name
+                deadline.check()  # the finally below cancels whatever is still running
+                now = time.monotonic()
+                for task, (name, started, timeout_at, hedge_at, hedged) in list(running.items()):
+                    if timeout_at is not None and now >= timeout_at:
+                        running.pop(task)
+                        task.cancel()
+                        last_error = TimeoutError(f"{name} did not answer within {self.timeouts[name]:g}s")
+                        self.record(name, False, timed_out=True)
+                    elif hedge_at is not None and now >= hedge_at and queue_:
+                        running[task] = (name, started, timeout_at, None, hedged)
+                        launch(hedged=True)
+                if not running and queue_:
+                    launch()
+        finally:
+            for task, (name, *_) in running.items():
+                task.cancel()
+                self.breakers[name].abandon()
+        raise last_error or self._unavailable()
@@ -0,0 +1,162 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WS.sub(" ", (text or "").strip().lower())
+
+
+def cache_key(query: str, provider: str, model: str, use_system_prompt: bool) -> str:
+    raw = "\x1f".join([normalize_query(query), provider or "", model or "", "1" if use_system_prompt else "0"])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --------- Exact-match response cache (LRU + TTL, optional SQLite tier) ----------
+class ResponseCache:
+    """In-process LRU/TTL cache of (response, model, provider that answered) keyed by `cache_key()`.
+
+    When `connect` is given (a callable returning a context manager that lends a
+    connection, e.g. `Database.writer`), entries are also written to a
+    `response_cache` table so they survive restarts and are shared between
+    worker processes.
+    """
+
+    def __init__(self, max_entries=1024, ttl_s=3600, connect=None):
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self.connect = connect
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._sqlite_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._puts = 0
+        if self.connect is not None:
+            self._init_table()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl_s:
+                    self._mem.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._mem[key]
+                self._expirations += 1
+        value = self._sqlite_get(key, now)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._sqlite_hits += 1
+            self._store(key, value[1], value[0])
+            return value[1]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            self._puts += 1
+            prune = self._puts % 256 == 0
+        self._sqlite_put(key, value, now, prune)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        if self.connect is not None:
+            with self.connect() as conn:
+                conn.execute("DELETE FROM response_cache;")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "sqlite_tier": self.connect is not None,
+                "size": len(self._mem),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self._hits,
+                "sqlite_hits": self._sqlite_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    # caller holds self._lock
+    def _store(self, key, value, created):
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._evictions += 1
+
+    def _init_table(self):
+        with self.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    model TEXT,
+                    created REAL NOT NULL,
+                    provider TEXT
+                );
+            """)
+            if "provider" not in {row[1] for row in conn.execute("PRAGMA table_info(response_cache);")}:
+                try:
+                    conn.execute("ALTER TABLE response_cache ADD COLUMN provider TEXT;")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+
+    def _sqlite_get(self, key, now):
+        if self.connect is None:
+            return None
+        try:
+            with self.connect() as conn:
+                row = conn.execute(
+                    "SELECT created, response, model, provider FROM response_cache WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl_s),
+                ).fetchone()
+        except Exception as e:
+            print("Response cache read error:", repr(e))
+            return None
+        if row is None:
+            return None
+        return row[0], (row[1], row[2], row[3])
+
+    def _sqlite_put(self, key, value, now, prune):
+        if self.connect is None:
+            return
+        response, model, *rest = value
+        try:
+            with self.connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, response, model, created, provider) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, response, model, now, rest[0] if rest else None),
+                )
+                if prune:
+                    conn.execute("DELETE FROM response_cache WHERE created < ?", (now - self.ttl_s,))
+        except Exception as e:
+            print("Response cache write error:", repr(e))
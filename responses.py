@@ -0,0 +1,149 @@
+"""Compressed, deduplicated storage for answer text in logs.db (migration 8).
+
+Each distinct answer is stored once in `responses`, keyed by a hash of its
+text and compressed with zstd when the `zstandard` package is installed, zlib
+otherwise (RESPONSE_CODEC picks one explicitly). `interactions.response_id`
+points at it and `interactions.response` is left empty; rows written before the
+migration, or by tools that don't know about it, may still carry inline text,
+so readers go through TEXT_SQL, which handles both.
+
+Every `db.Database` connection gets the SQL functions `response_text(codec, body)`
+and `response_hash(text)` (see `register`). The FTS triggers call them, so
+anything that writes to `interactions` needs them too.
+"""
+import functools
+import hashlib
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC = os.getenv("RESPONSE_CODEC", "zstd" if zstandard is not None else "zlib").strip().lower()
+LEVEL = int(os.getenv("RESPONSE_CODEC_LEVEL", "6"))
+if CODEC == "zstd" and zstandard is None:
+    print("RESPONSE_CODEC=zstd needs the zstandard package; using zlib")
+    CODEC = "zlib"
+if CODEC not in ("zstd", "zlib", "raw"):
+    raise ValueError(f"RESPONSE_CODEC must be zstd, zlib or raw (got {CODEC!r})")
+
+
+def text_sql(row=""):
+    """SQL for a row's answer text, stored in `responses` or inline; `row` qualifies the columns ("new.")."""
+    return f"COALESCE((SELECT response_text(codec, body) FROM responses WHERE id = {row}response_id), {row}response)"
+
+
+TEXT_SQL = text_sql()
+# Id of an answer already passed to store(); the parameter is its text
+ID_SQL = "(SELECT id FROM responses WHERE hash = response_hash(?))"
+
+
+def digest(text) -> bytes:
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).digest()
+
+
+def compress(data: bytes):
+    """(codec, body); short answers that don't shrink are kept as they are."""
+    if CODEC == "zstd":
+        body = zstandard.ZstdCompressor(level=LEVEL).compress(data)
+    elif CODEC == "zlib":
+        body = zlib.compress(data, LEVEL)
+    else:
+        return "raw", data
+    return (CODEC, body) if len(body) < len(data) else ("raw", data)
+
+
+@functools.lru_cache(maxsize=512)
+def decompress(codec, body):
+    # cached: repeated answers are what this table is for, and the FTS insert trigger reads back each new one
+    if body is None:
+        return None
+    if codec == "zlib":
+        return zlib.decompress(body).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("this answer is zstd-compressed; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    return bytes(body).decode("utf-8")
+
+
+def register(conn):
+    """Adds response_text() and response_hash() to a SQLite connection."""
+    conn.create_function("response_text", 2, decompress, deterministic=True)
+    conn.create_function("response_hash", 1, digest, deterministic=True)
+
+
+def store(conn, texts):
+    """Adds the answers in `texts` that aren't stored yet; returns how many were new.
+
+    Only answers whose hash is missing get compressed, so a batch of repeated
+    answers costs one indexed lookup each.
+    """
+    by_hash = {digest(t): t for t in texts}
+    if not by_hash:
+        return 0
+    hashes = list(by_hash)
+    known = set()
+    for i in range(0, len(hashes), 500):  # stay under SQLite's bound-parameter limit
+        part = hashes[i:i + 500]
+        known.update(h for (h,) in conn.execute(
+            f"SELECT hash FROM responses WHERE hash IN ({', '.join('?' * len(part))});", part))
+    new = []
+    for h, text in by_hash.items():
+        if h not in known:
+            data = (text or "").encode("utf-8")
+            new.append((h, *compress(data), len(data)))
+    conn.executemany("INSERT OR IGNORE INTO responses (hash, codec, body, size) VALUES (?, ?, ?, ?);", new)
+    return len(new)
+
+
+def backfill(conn, chunk=2000):
+    """Moves answers stored inline in interactions into `responses`; returns rows moved.
+
+    Runs inside the caller's transaction (migration 8).
+    """
+    moved, last = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, response FROM interactions NOT INDEXED WHERE id > ? AND response_id IS NULL "
+            "ORDER BY id LIMIT ?;", (last, chunk)).fetchall()
+        if not rows:
+            return moved
+        store(conn, [text for _, text in rows])
+        conn.executemany(f"UPDATE interactions SET response = '', response_id = {ID_SQL} WHERE id = ?;",
+                         [(text, id_) for id_, text in rows])
+        moved += len(rows)
+        last = rows[-1][0]
+
+
+def prune_orphans(conn, after_id, chunk):
+    """Deletes answers no interaction points at among the next `chunk` ids; returns (last id seen, deleted).
+
+    Walks `responses` by id so each call is one short statement; last id is None when done.
+    """
+    ids = [i for (i,) in conn.execute(
+        "SELECT id FROM responses WHERE id > ? ORDER BY id LIMIT ?;", (after_id, chunk))]
+    if not ids:
+        return None, 0
+    n = conn.execute(
+        "DELETE FROM responses WHERE id >= ? AND id <= ? "
+        "AND NOT EXISTS (SELECT 1 FROM interactions i WHERE i.response_id = responses.id);",
+        (ids[0], ids[-1])).rowcount
+    return ids[-1], n
+
+
+def stats(conn) -> dict:
+    """Distinct answers stored, their raw and stored bytes, and how many rows share them."""
+    n, raw, stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(body)), 0) FROM responses;").fetchone()
+    (rows,) = conn.execute("SELECT COUNT(*) FROM interactions WHERE response_id IS NOT NULL;").fetchone()
+    return {
+        "codec": CODEC,
+        "distinct": n,
+        "rows": rows,
+        "raw_bytes": raw,
+        "stored_bytes": stored,
+        "ratio": round(raw / stored, 2) if stored else None,
+    }
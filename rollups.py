@@ -0,0 +1,287 @@
+"""Pre-aggregated rollups of the interactions log.
+
+The log writer calls `apply(conn, rows)` inside the same transaction as the
+row inserts, so analytics read a handful of buckets instead of scanning
+`interactions`. Rebuild them from existing rows with:
+
+    python rollups.py backfill            # uses CHATBOT_DB (or logs.db next to this file)
+    python rollups.py backfill --db /abs/path/logs.db
+"""
+import argparse
+import bisect
+import datetime as _dt
+import hashlib
+import os
+import sys
+
+from db import Database
+from response_cache import normalize_query
+
+# Same per-request stages the API stores as <stage>_ms columns
+STAGES = ("parse", "cache", "queue", "provider", "post")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (
+    5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 400, 500, 750, 1000, 1500,
+    2000, 3000, 4000, 5000, 7500, 10000, 15000, 20000, 30000, 60000,
+)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS rollup_minute (
+        minute TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        latency_sum REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_hour (
+        hour TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        latency_sum REAL NOT NULL,
+        staged INTEGER NOT NULL,
+        """ + ",\n        ".join(f"{s}_sum REAL NOT NULL" for s in STAGES) + """,
+        PRIMARY KEY (hour, provider, model)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_model (
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        latency_sum REAL NOT NULL,
+        last_ts TEXT,
+        PRIMARY KEY (provider, model)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_latency (
+        minute TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (minute, bucket)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS query_freq (
+        qhash TEXT PRIMARY KEY,
+        query TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        last_ts TEXT
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_query_freq_count ON query_freq(count DESC);",
+]
+TABLES = ("rollup_minute", "rollup_hour", "rollup_model", "rollup_latency", "query_freq")
+
+
+def init(conn) -> bool:
+    """Creates the rollup tables; returns True when they did not exist yet (needs a backfill)."""
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    return "rollup_minute" not in existing
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def bucket_index(latency_ms) -> int:
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms or 0)
+
+
+# --------- Incremental update (runs inside the writer's transaction) ----------
+def apply(conn, rows):
+    """Folds `rows` of (ts, query, latency_ms, provider, model, stage_ms_tuple) into the rollups.
+
+    Rows are aggregated in Python first so one batch costs one UPSERT per
+    touched bucket, not one per row.
+    """
+    minutes, hours, models, latency, queries = {}, {}, {}, {}, {}
+    for ts, query, latency_ms, provider, model, stage_ms in rows:
+        latency_ms = float(latency_ms or 0)
+        minute, hour = ts[:16], ts[:13]
+        provider, model = provider or "", model or ""
+
+        m = minutes.setdefault(minute, [0, 0.0])
+        m[0] += 1
+        m[1] += latency_ms
+
+        h = hours.setdefault((hour, provider, model), [0, 0.0, 0] + [0.0] * len(STAGES))
+        h[0] += 1
+        h[1] += latency_ms
+        if stage_ms and any(v is not None for v in stage_ms):
+            h[2] += 1
+            for i, v in enumerate(stage_ms[:len(STAGES)]):
+                h[3 + i] += v or 0.0
+
+        md = models.setdefault((provider, model), [0, 0.0, ts])
+        md[0] += 1
+        md[1] += latency_ms
+        md[2] = max(md[2], ts)
+
+        b = (minute, bucket_index(latency_ms))
+        latency[b] = latency.get(b, 0) + 1
+
+        q = queries.setdefault(query_hash(query), [query, 0, ts])
+        q[1] += 1
+        q[2] = max(q[2], ts)
+
+    conn.executemany(
+        """
+        INSERT INTO rollup_minute (minute, count, latency_sum) VALUES (?, ?, ?)
+        ON CONFLICT(minute) DO UPDATE SET count = count + excluded.count,
+                                          latency_sum = latency_sum + excluded.latency_sum;
+        """,
+        [(k, v[0], v[1]) for k, v in minutes.items()],
+    )
+    stage_cols = [f"{s}_sum" for s in STAGES]
+    conn.executemany(
+        "INSERT INTO rollup_hour (hour, provider, model, count, latency_sum, staged, " + ", ".join(stage_cols) + ") "
+        "VALUES (" + ", ".join("?" * (6 + len(STAGES))) + ") "
+        "ON CONFLICT(hour, provider, model) DO UPDATE SET count = count + excluded.count, "
+        "latency_sum = latency_sum + excluded.latency_sum, staged = staged + excluded.staged, "
+        + ", ".join(f"{c} = {c} + excluded.{c}" for c in stage_cols) + ";",
+        [k + tuple(v) for k, v in hours.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO rollup_model (provider, model, count, latency_sum, last_ts) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(provider, model) DO UPDATE SET count = count + excluded.count,
+                                                   latency_sum = latency_sum + excluded.latency_sum,
+                                                   last_ts = max(last_ts, excluded.last_ts);
+        """,
+        [k + tuple(v) for k, v in models.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO rollup_latency (minute, bucket, count) VALUES (?, ?, ?)
+        ON CONFLICT(minute, bucket) DO UPDATE SET count = count + excluded.count;
+        """,
+        [k + (v,) for k, v in latency.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO query_freq (qhash, query, count, last_ts) VALUES (?, ?, ?, ?)
+        ON CONFLICT(qhash) DO UPDATE SET count = count + excluded.count,
+                                         last_ts = max(last_ts, excluded.last_ts);
+        """,
+        [(k,) + tuple(v) for k, v in queries.items()],
+    )
+
+
+def clear(conn):
+    for table in TABLES:
+        conn.execute(f"DELETE FROM {table};")
+
+
+def prune_minutes(conn, before_epoch):
+    """Drops per-minute rollups older than `before_epoch` (hourly and all-time rollups are kept)."""
+    minute = _dt.datetime.fromtimestamp(before_epoch).isoformat(timespec="minutes")
+    conn.execute("DELETE FROM rollup_minute WHERE minute < ?;", (minute,))
+    conn.execute("DELETE FROM rollup_latency WHERE minute < ?;", (minute,))
+
+
+def backfill(conn, chunk=5000) -> int:
+    """Rebuilds every rollup from `interactions` in id order, `chunk` rows per transaction."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(interactions);")}
+    pick = lambda c: c if c in cols else "NULL"
+    select = (
+        f"SELECT id, ts, query, latency_ms, {pick('provider')}, {pick('model')}, "
+        + ", ".join(pick(f"{s}_ms") for s in STAGES)
+        + " FROM interactions WHERE id > ? AND id <= ? ORDER BY id LIMIT ?;"
+    )
+    # rows logged after this point are folded in by the running writer, so stop at the current max id
+    conn.execute("BEGIN IMMEDIATE")
+    clear(conn)
+    (max_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM interactions;").fetchone()
+    conn.commit()
+    last_id, total = 0, 0
+    while last_id < max_id:
+        batch = conn.execute(select, (last_id, max_id, chunk)).fetchall()
+        if not batch:
+            break
+        conn.execute("BEGIN")
+        apply(conn, [(r[1], r[2], r[3], r[4], r[5], r[6:]) for r in batch])
+        conn.commit()
+        last_id = batch[-1][0]
+        total += len(batch)
+    return total
+
+
+# --------- Reads ----------
+def percentiles(bucket_counts, ps=(50, 95)):
+    """Estimates percentiles from {bucket index: count}, interpolating inside the bucket."""
+    n = sum(bucket_counts.values())
+    if not n:
+        return {p: None for p in ps}
+    out = {}
+    for p in ps:
+        rank, seen = n * p / 100.0, 0
+        for i in sorted(bucket_counts):
+            c = bucket_counts[i]
+            if seen + c >= rank:
+                lo = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+                hi = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else lo
+                out[p] = round(lo + (hi - lo) * ((rank - seen) / c), 1)
+                break
+            seen += c
+    return out
+
+
+def summary(conn, since_minute=None, top=5) -> dict:
+    """Totals per provider/model, recent latency percentiles and the most repeated queries.
+
+    Totals are all-time: retention deletes old rows from interactions but not from the rollups (clear resets both).
+    """
+    by_model = [
+        {"provider": p or None, "model": m or None, "count": c,
+         "avg_latency_ms": round(s / c, 1) if c else None, "last_ts": last}
+        for p, m, c, s, last in conn.execute(
+            "SELECT provider, model, count, latency_sum, last_ts FROM rollup_model ORDER BY count DESC;")
+    ]
+    recent = {}
+    if since_minute is not None:
+        row = conn.execute(
+            "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(latency_sum), 0) FROM rollup_minute WHERE minute >= ?;",
+            (since_minute,),
+        ).fetchone()
+        buckets = dict(conn.execute(
+            "SELECT bucket, SUM(count) FROM rollup_latency WHERE minute >= ? GROUP BY bucket;", (since_minute,)))
+        pct = percentiles(buckets)
+        recent = {"since": since_minute, "count": row[0],
+                  "avg_latency_ms": round(row[1] / row[0], 1) if row[0] else None,
+                  "p50_ms": pct[50], "p95_ms": pct[95]}
+    return {
+        "count_all_time": sum(r["count"] for r in by_model),
+        "by_model": by_model,
+        "recent": recent,
+        "top_queries": [
+            {"query": q, "count": c, "last_ts": last}
+            for q, c, last in conn.execute(
+                "SELECT query, count, last_ts FROM query_freq ORDER BY count DESC LIMIT ?;", (top,))
+        ],
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Maintain the interactions rollup tables.")
+    ap.add_argument("command", choices=["backfill"])
+    ap.add_argument("--db", default=os.environ.get(
+        "CHATBOT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs.db")))
+    ap.add_argument("--chunk", type=int, default=5000)
+    args = ap.parse_args(argv)
+
+    conn = Database(args.db).connect("writer")
+    init(conn)
+    n = backfill(conn, chunk=args.chunk)
+    conn.close()
+    print(f"rebuilt rollups from {n} rows in {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
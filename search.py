@@ -0,0 +1,65 @@
+import re
+import time
+
+# --------- Full-text search over interactions (FTS5 table from migration 6) ----------
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def to_match(text, mode="all"):
+    """Turns free text into a safe FTS5 MATCH expression.
+
+    Words are quoted so punctuation in user input ("CORS errors?", "C++") can't
+    break the query syntax; the last word (3+ characters) also matches as a
+    prefix so partial input still finds something. `mode="any"` ORs the words
+    instead of ANDing them.
+    """
+    terms = _TERM.findall(text or "")
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    if len(terms[-1]) >= 3:
+        quoted[-1] += "*"
+    return (" OR " if mode == "any" else " ").join(quoted)
+
+
+def search(conn, text, limit=20, offset=0, provider=None, mode="all", raw=False, sort="rank"):
+    """Matches with a highlighted query and an answer snippet.
+
+    `sort="rank"` orders by bm25 relevance; `sort="recent"` orders newest first,
+    which stays fast even for terms that match most of the log (ranking has to
+    score every match). `raw=True` passes `text` through as FTS5 syntax.
+    """
+    limit = max(1, min(int(limit), 200))
+    offset = max(0, int(offset))
+    match = text if raw else to_match(text, mode)
+    out = {"q": text, "match": match, "results": [], "next_offset": None}
+    if not match:
+        return out
+    where, params = "interactions_fts MATCH ?", [match]
+    if provider:
+        where += " AND i.provider = ?"
+        params.append(provider)
+    # with LIMIT, highlight()/snippet() only run for the rows on this page
+    order = "f.rowid DESC" if sort == "recent" else "f.rank"
+    start = time.perf_counter()
+    rows = conn.execute(
+        f"""
+        SELECT i.id, i.ts, i.provider, i.model, i.latency_ms, f.rank,
+               highlight(interactions_fts, 0, '[', ']'),
+               snippet(interactions_fts, 1, '[', ']', '…', 24)
+        FROM interactions_fts f JOIN interactions i ON i.id = f.rowid
+        WHERE {where}
+        ORDER BY {order} LIMIT ? OFFSET ?;
+        """,
+        params + [limit + 1, offset],
+    ).fetchall()
+    out["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        out["next_offset"] = offset + limit
+    out["results"] = [
+        {"id": r[0], "ts": r[1], "provider": r[2], "model": r[3], "latency_ms": r[4],
+         "score": round(r[5], 4), "query": r[6], "response": r[7]}
+        for r in rows
+    ]
+    return out
@@ -0,0 +1,232 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9_]+")
+# question filler that would otherwise dominate short queries ("how do I fix X" asks the same as "X")
+_STOPWORDS = frozenset(
+    "a an the how do does did i to is are it my what why when where in of for on and or can you me with this that "
+    "fix fixing solve resolve get getting use using way best should could would please help there which be have has "
+    "any at by as if so your we".split()
+)
+
+
+# --------- Embedders (local CPU model, or hashed TF-IDF fallback) ----------
+class HashedTfidfEmbedder:
+    """Word features hashed into `dim` buckets, IDF-weighted, L2-normalized.
+
+    Uses crc32 rather than hash() so vectors stay valid across processes. A
+    plural "s" is dropped so "exits" and "exit" share a bucket.
+    """
+
+    name = "hashed-tfidf-v2"  # bumped when tokenizing changes, so caches saved by the old one are dropped
+
+    def __init__(self, dim=256):
+        self.dim = int(dim)
+        self.df = np.zeros(self.dim, dtype=np.float32)
+        self.n_docs = 0
+
+    def _buckets(self, text: str) -> np.ndarray:
+        words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+                 for w in _TOKEN.findall((text or "").lower()) if w not in _STOPWORDS]
+        return np.fromiter((zlib.crc32(w.encode("utf-8")) % self.dim for w in words), dtype=np.int64, count=len(words))
+
+    def observe(self, text: str):
+        self.df[np.unique(self._buckets(text))] += 1.0
+        self.n_docs += 1
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        buckets = self._buckets(text)
+        if buckets.size == 0:
+            return vec
+        np.add.at(vec, buckets, 1.0)
+        nz = vec > 0
+        idf = np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0
+        vec[nz] = (1.0 + np.log(vec[nz])) * idf[nz]
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = int(self._model.get_sentence_embedding_dimension())
+
+    def observe(self, text: str):
+        pass
+
+    def embed(self, text: str) -> np.ndarray:
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def make_embedder(model_name=None, dim=256):
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            print("Semantic cache: falling back to hashed TF-IDF:", repr(e))
+    return HashedTfidfEmbedder(dim)
+
+
+# --------- Semantic answer cache (cosine similarity over a float32 matrix) ----------
+class SemanticCache:
+    """Returns a stored answer when a new query is close enough to an old one.
+
+    Vectors live in one preallocated, L2-normalized float32 matrix, one column per
+    entry, so lookup is a single vector-matrix product. Hashed TF-IDF queries touch
+    a handful of dimensions, and only those rows of the matrix are read. When
+    full, the oldest columns are overwritten. The matrix is saved to `path` (.npz)
+    with the answers in a .json sidecar, on a background thread at most every
+    `save_every_s` seconds.
+    """
+
+    def __init__(self, embedder, scope, threshold=0.85, max_entries=100_000, path=None, save_every_s=30.0):
+        self.embedder = embedder
+        self.scope = scope
+        self.threshold = float(threshold)
+        self.max_entries = int(max_entries)
+        self.path = path
+        self.save_every_s = float(save_every_s)
+        self._lock = threading.Lock()
+        self._vecs = np.zeros((embedder.dim, min(1024, self.max_entries)), dtype=np.float32)
+        self._entries = []  # [query, response, model] per row
+        self._next = 0  # ring position once full
+        self._dirty = 0
+        self._saved_at = time.monotonic()
+        self._saving = False
+        self._save_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query: str):
+        q = self.embedder.embed(query)
+        with self._lock:
+            n = len(self._entries)
+            if n == 0 or not q.any():
+                self._misses += 1
+                return None
+            dims = np.flatnonzero(q)
+            if len(dims) * 4 < len(q):
+                # hashed TF-IDF: gather just the rows the query touches
+                sims = q[dims] @ self._vecs[dims, :n]
+            else:
+                # dense embedder: a gather would copy the whole matrix first
+                sims = q @ self._vecs[:, :n]
+            best = int(sims.argmax())
+            score = float(sims[best])
+            if score < self.threshold:
+                self._misses += 1
+                return None
+            self._hits += 1
+            _, response, model = self._entries[best]
+            return response, model, score
+
+    def put(self, query: str, value):
+        response, model = value
+        with self._lock:
+            self.embedder.observe(query)
+            vec = self.embedder.embed(query)
+            if not vec.any():
+                return
+            n = len(self._entries)
+            if n < self.max_entries:
+                if n == self._vecs.shape[1]:
+                    grown = np.zeros((self._vecs.shape[0], min(n * 2, self.max_entries)), dtype=np.float32)
+                    grown[:, :n] = self._vecs
+                    self._vecs = grown
+                row = n
+                self._entries.append([query, response, model])
+            else:
+                row = self._next
+                self._next = (self._next + 1) % self.max_entries
+                self._entries[row] = [query, response, model]
+            self._vecs[:, row] = vec
+            self._dirty += 1
+            save = self.path and not self._saving and time.monotonic() - self._saved_at >= self.save_every_s
+            if save:
+                self._saving = True
+        if save:
+            # writing 100k answers takes a while; the request that triggered it shouldn't wait
+            threading.Thread(target=self.save, name="semantic-cache-save", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # --------- persistence ----------
+    def _meta(self) -> dict:
+        return {"scope": self.scope, "embedder": self.embedder.name, "dim": self.embedder.dim}
+
+    def save(self):
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        with self._lock:
+            n = len(self._entries)
+            vecs = self._vecs[:, :n].T.copy()  # saved one row per entry
+            entries = list(self._entries)
+            meta = dict(self._meta(), next=self._next, n_docs=getattr(self.embedder, "n_docs", 0))
+            df = getattr(self.embedder, "df", np.zeros(0, dtype=np.float32)).copy()
+            self._dirty = 0
+            self._saved_at = time.monotonic()
+        try:
+            tmp_npz = self.path + ".tmp.npz"
+            np.savez(tmp_npz, vecs=vecs, df=df)
+            os.replace(tmp_npz, self.path)
+            tmp_json = self.path + ".json.tmp"
+            with open(tmp_json, "w", encoding="utf-8") as f:
+                json.dump({"meta": meta, "entries": entries}, f)
+            os.replace(tmp_json, self.path + ".json")
+        except Exception as e:
+            print("Semantic cache save error:", repr(e))
+        finally:
+            self._saving = False
+
+    def load(self):
+        if not (os.path.exists(self.path) and os.path.exists(self.path + ".json")):
+            return
+        try:
+            with open(self.path + ".json", encoding="utf-8") as f:
+                side = json.load(f)
+            meta = side["meta"]
+            if {k: meta.get(k) for k in ("scope", "embedder", "dim")} != self._meta():
+                return  # different provider/model/embedder: start fresh
+            with np.load(self.path) as npz:
+                vecs, df = npz["vecs"], npz["df"]
+            entries = side["entries"][: self.max_entries]
+            vecs = vecs[: len(entries)]
+        except Exception as e:
+            print("Semantic cache load error:", repr(e))
+            return
+        with self._lock:
+            self._vecs = np.zeros((self.embedder.dim, max(len(entries), min(1024, self.max_entries))), dtype=np.float32)
+            self._vecs[:, : len(entries)] = vecs.T
+            self._entries = entries
+            self._next = int(meta.get("next", 0)) % self.max_entries
+            if isinstance(self.embedder, HashedTfidfEmbedder) and df.shape == self.embedder.df.shape:
+                self.embedder.df = df.astype(np.float32)
+                self.embedder.n_docs = int(meta.get("n_docs", 0))
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+
+# --------- Single-flight: identical concurrent calls share one execution ----------
+class Abandoned(Exception):
+    """The leader stopped for a reason of its own (its deadline passed, its client went away)."""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one in-flight call.
+
+    The first caller for a key becomes the leader and does the work; callers
+    that arrive while it is running wait on the leader's Future instead.
+    Uses concurrent.futures so threads and asyncio (via asyncio.wrap_future)
+    can share the same in-flight call. A leader that stops for its own reasons
+    finishes with `abandoned=True`: waiters get Abandoned instead of its error,
+    and one of them leads a fresh call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._abandoned = 0
+
+    def begin(self, key) -> tuple[Future, bool]:
+        """Returns (future, is_leader). The leader must call finish() for the key."""
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self._coalesced += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self._leaders += 1
+            return fut, True
+
+    def finish(self, key, result=None, error=None, abandoned=False):
+        with self._lock:
+            fut = self._calls.pop(key)
+            if abandoned:
+                self._abandoned += 1
+                error = Abandoned("the leading request stopped before it had an answer")
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def do(self, key, fn, timeout=None, abandoned=None):
+        """Runs fn() once per key among concurrent callers; returns (result, coalesced).
+
+        `timeout` bounds how long this caller waits in all (concurrent.futures.TimeoutError).
+        `abandoned(error)` says whether the leader's error was its own (e.g. its
+        deadline): followers then take over rather than fail with it.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            fut, leader = self.begin(key)
+            if not leader:
+                try:
+                    return fut.result(timeout=None if end is None else max(0.0, end - time.monotonic())), True
+                except Abandoned:
+                    if end is not None and time.monotonic() >= end:
+                        raise TimeoutError() from None
+                    continue
+            try:
+                result = fn()
+            except BaseException as e:
+                self.finish(key, error=e, abandoned=abandoned is not None and bool(abandoned(e)))
+                raise
+            self.finish(key, result)
+            return result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self._leaders, "coalesced": self._coalesced,
+                    "abandoned": self._abandoned}
@@ -0,0 +1,21 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# the app is a set of top-level modules; make them importable from here
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def core(tmp_path_factory):
+    """app_logging_autodetect with the fake provider (fixed 300 ms answers) on a scratch logs.db."""
+    os.environ.update({
+        "PROVIDER": "fake",
+        "CHATBOT_DB": str(tmp_path_factory.mktemp("db") / "logs.db"),
+        "FAKE_LATENCY_DIST": "fixed",
+        "FAKE_LATENCY_MS": "300",
+        "LAZY_STARTUP": "0",
+    })
+    return importlib.import_module("app_logging_autodetect")
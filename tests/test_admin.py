@@ -0,0 +1,16 @@
+def test_export_is_admin_only(core):
+    client = core.app.test_client()
+    assert client.get("/admin/export", environ_base={"REMOTE_ADDR": "10.0.0.7"}).status_code == 403
+    assert client.get("/admin/export?limit=1").status_code == 200
+
+
+def test_export_rejects_non_positive_batch(core):
+    client = core.app.test_client()
+    assert client.get("/admin/export?batch=-1").status_code == 400
+    assert client.get("/admin/export?batch=0").status_code == 400
+
+
+def test_search_is_admin_only(core):
+    client = core.app.test_client()
+    assert client.get("/admin/search?q=error", environ_base={"REMOTE_ADDR": "10.0.0.7"}).status_code == 403
+    assert client.get("/admin/search?q=error").status_code == 200
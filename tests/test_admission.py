@@ -0,0 +1,32 @@
+import pytest
+
+from admission import Admission, Overloaded
+
+
+def _tokens(adm, client):
+    return adm._clients[client].tokens, adm.global_bucket.tokens
+
+
+def test_rejected_requests_get_their_tokens_back():
+    adm = Admission(max_concurrent=1, max_queue=1, queue_timeout_s=0.05,
+                    client_tokens_per_min=6000, global_tokens_per_min=60000)
+    held = adm.admit("ip:a", 100)
+    before = _tokens(adm, "ip:a")
+
+    with pytest.raises(Overloaded) as e:  # waits in the queue, times out
+        adm.admit("ip:a", 100)
+    assert e.value.reason == "queue wait timed out"
+    assert all(now >= then for now, then in zip(_tokens(adm, "ip:a"), before))  # plus a little refill
+
+    adm.max_queue = 0
+    with pytest.raises(Overloaded) as e:
+        adm.admit("ip:a", 100)
+    assert e.value.reason == "server busy"
+    assert all(now >= then for now, then in zip(_tokens(adm, "ip:a"), before))
+    held.release()
+
+
+def test_unknown_api_key_is_budgeted_by_address(core):
+    with core.app.test_request_context("/query", headers={"X-API-Key": "made-up"},
+                                       environ_base={"REMOTE_ADDR": "10.1.2.3"}):
+        assert core.request_client(core.request) == "ip:10.1.2.3"
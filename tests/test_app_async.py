@@ -0,0 +1,24 @@
+import asyncio
+import importlib
+
+import cancellation
+
+
+def test_leader_disconnect_does_not_cancel_followers(core):
+    app_async = importlib.import_module("app_async")
+    query = "leader hangs up, follower stays"
+    key = core.cache_key(query, core.provider_name, core.model_name, core.USE_SYSTEM_PROMPT)
+
+    async def run():
+        leader = asyncio.create_task(app_async._ashared(query, key, cancellation.Deadline(30)))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(app_async._ashared(query, key, cancellation.Deadline(30)))
+        await asyncio.sleep(0.05)
+        leader.cancel()  # what the server does when the leader's client disconnects
+        (answer, model, served_by), coalesced = await follower
+        assert leader.cancelled()
+        return answer, served_by, coalesced
+
+    answer, served_by, coalesced = asyncio.run(run())
+    assert answer and served_by == "fake"
+    assert not coalesced  # the follower led a fresh call
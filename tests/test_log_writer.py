@@ -0,0 +1,35 @@
+import time
+
+import migrations
+from bench_db import V8_INSERT, synthetic_rows
+from db import Database
+import responses
+from log_writer import BatchedLogWriter
+
+
+def test_concurrent_writers_share_one_db(tmp_path):
+    # e.g. gunicorn workers: each has its own writer, all append to the same file
+    path = str(tmp_path / "logs.db")
+    db = Database(path)
+    conn = db.connect()
+    migrations.migrate(conn)
+    conn.close()
+
+    writers = [
+        BatchedLogWriter(db.connect, V8_INSERT, max_batch=20, flush_ms=5, spill_path=str(tmp_path / f"spill{i}.jsonl"),
+                         before_insert=lambda conn, rows: responses.store(conn, [r[2] for r in rows]))
+        for i in range(4)
+    ]
+    epoch = int(time.time())
+    rows = [list(synthetic_rows(500, 0.5, 50, 20, seed=i, start_epoch=epoch)) for i in range(len(writers))]
+    for batch in zip(*rows):
+        for writer, row in zip(writers, batch):
+            writer.write(row)
+    for writer in writers:
+        writer.close(timeout=30)
+
+    assert [w.stats()["written"] for w in writers] == [500] * 4
+    assert [w.stats()["spilled"] for w in writers] == [0] * 4
+    conn = db.connect("reader")
+    assert conn.execute("SELECT COUNT(*) FROM interactions;").fetchone() == (2000,)
+    assert conn.execute("SELECT COUNT(*) FROM interactions WHERE response_id IS NULL;").fetchone() == (0,)
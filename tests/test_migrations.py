@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import migrations
+from db import Database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_workers_migrating_together_apply_each_step_once(tmp_path):
+    # a logs.db as the first release wrote it, before versioning
+    path = str(tmp_path / "logs.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE interactions (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, "
+                 "query TEXT NOT NULL, response TEXT NOT NULL, latency_ms INTEGER NOT NULL);")
+    conn.executemany("INSERT INTO interactions (ts, query, response, latency_ms) VALUES (?, ?, ?, ?);",
+                     [(f"2024-06-01T10:{i % 60:02d}:00", f"q{i % 50}", f"answer {i % 300}", 100 + i % 500)
+                      for i in range(20000)])
+    conn.commit()
+    conn.close()
+
+    code = ("import sys, migrations; from db import Database; "
+            "conn = Database(sys.argv[1]).connect(); print(migrations.migrate(conn))")
+    procs = [subprocess.Popen([sys.executable, "-c", code, path], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True) for _ in range(3)]
+    results = [p.communicate(timeout=120) for p in procs]
+    assert [p.returncode for p in procs] == [0, 0, 0], [err for _, err in results]
+    assert [out.strip().splitlines()[-1] for out, _ in results] == [str(migrations.LATEST)] * 3
+
+    conn = Database(path).connect("reader")
+    # the rollup backfill (step 3) ran exactly once
+    assert conn.execute("SELECT SUM(count) FROM rollup_model;").fetchone() == (20000,)
+
+
+def test_long_busy_timeout_is_only_for_migrating(tmp_path):
+    conn = Database(str(tmp_path / "logs.db"), busy_timeout_ms=3000).connect()
+    assert migrations.migrate(conn) == migrations.LATEST
+    assert conn.execute("PRAGMA busy_timeout;").fetchone() == (3000,)
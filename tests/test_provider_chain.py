@@ -0,0 +1,11 @@
+import pytest
+
+
+def test_chain_entries_are_stripped(core):
+    assert core.parse_provider_chain("gemini, openai ,hf", "hf") == ["gemini", "openai", "hf"]
+    assert core.parse_provider_chain(" ", "fake") == ["fake"]
+
+
+def test_unknown_provider_is_an_error(core):
+    with pytest.raises(ValueError, match="openia"):
+        core.parse_provider_chain("gemini,openia", "hf")
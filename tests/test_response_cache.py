@@ -0,0 +1,18 @@
+from db import Database
+from response_cache import ResponseCache
+
+
+def test_fallback_answer_is_tagged_with_its_provider(core):
+    key = core.cache_key("answered by the fallback", core.provider_name, core.model_name, core.USE_SYSTEM_PROMPT)
+    core._remember_answer("answered by the fallback", key, "an answer", "gemini-1.5-flash", "gemini")
+    answer, model, served_by = core._cached_answer("answered by the fallback", key)
+    assert (model, served_by) == ("gemini-1.5-flash", "cache:gemini")
+
+
+def test_sqlite_tier_keeps_the_provider(tmp_path):
+    db = Database(str(tmp_path / "logs.db"))
+    with db.writer() as conn:  # table as an older release created it
+        conn.execute("CREATE TABLE response_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, model TEXT, "
+                     "created REAL NOT NULL);")
+    ResponseCache(connect=db.writer).put("k", ("an answer", "gpt-4o-mini", "openai"))
+    assert ResponseCache(connect=db.writer).get("k") == ("an answer", "gpt-4o-mini", "openai")
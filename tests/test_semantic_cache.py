@@ -0,0 +1,51 @@
+import numpy as np
+
+from semantic_cache import SemanticCache, make_embedder
+
+
+def test_paraphrase_hits_at_defaults():
+    cache = SemanticCache(make_embedder(), scope="fake|fake-v1|1")
+    cache.put("ModuleNotFoundError numpy", ("pip install numpy", "fake-v1"))
+    cache.put("docker container exits immediately", ("keep a foreground process running", "fake-v1"))
+
+    hit = cache.get("how do I fix ModuleNotFoundError numpy")
+    assert hit is not None and hit[0] == "pip install numpy"
+    hit = cache.get("why does my docker container exit immediately")
+    assert hit is not None and hit[0] == "keep a foreground process running"
+    assert cache.get("ModuleNotFoundError pandas") is None
+
+
+def test_saved_cache_reloads(tmp_path):
+    path = str(tmp_path / "logs.semantic.npz")
+    cache = SemanticCache(make_embedder(), scope="s", path=path)
+    for i in range(1500):  # past the first preallocated block
+        cache.put(f"question number {i} about topic{i}", (f"answer {i}", "m"))
+    cache.save()
+
+    again = SemanticCache(make_embedder(), scope="s", path=path)
+    assert len(again) == 1500
+    for q in ("question number 7 about topic7", "question number 1234 about topic1234"):
+        assert again.get(q) == cache.get(q)
+
+
+class _DenseEmbedder:
+    """Stands in for a sentence-transformers model: every dimension non-zero."""
+
+    name = "dense-test"
+    dim = 8
+
+    def observe(self, text):
+        pass
+
+    def embed(self, text):
+        vec = np.full(self.dim, 0.1, dtype=np.float32)
+        vec[len(text) % self.dim] = 1.0
+        return vec / np.linalg.norm(vec)
+
+
+def test_dense_embedder_lookup():
+    cache = SemanticCache(_DenseEmbedder(), scope="s")
+    cache.put("abc", ("three", "m"))
+    cache.put("abcd", ("four", "m"))
+    assert cache.get("xyz")[0] == "three"
+    assert cache.get("wxyz")[0] == "four"
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import cancellation
+from singleflight import SingleFlight
+
+
+def test_follower_outlives_short_leader_deadline():
+    flight = SingleFlight()
+    results = {}
+
+    def call(name, timeout_s, delay_s):
+        time.sleep(delay_s)
+        deadline = cancellation.start(timeout_s)
+
+        def work():
+            if deadline.wait(0.3):
+                deadline.check()
+            return name
+
+        try:
+            results[name] = flight.do("k", work, timeout=deadline.remaining(),
+                                      abandoned=lambda e: cancellation.stopped(e, deadline) is not None)
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=call, args=("leader", 0.1, 0)),
+               threading.Thread(target=call, args=("follower", 30, 0.02))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert isinstance(results["leader"], cancellation.Cancelled)
+    assert results["follower"] == ("follower", False)  # took over the call rather than failing with the leader
+    assert flight.stats()["abandoned"] == 1
+
+
+def test_flask_follower_keeps_its_own_deadline(core):
+    client = core.app.test_client()
+    out = {}
+
+    def post(name, timeout_s):
+        r = client.post("/query", json={"query": "short leader, patient follower"},
+                        headers={"X-Request-Timeout": str(timeout_s)})
+        out[name] = (r.status_code, r.get_json()["status"])
+
+    leader = threading.Thread(target=post, args=("leader", 0.2))
+    leader.start()
+    time.sleep(0.05)
+    post("follower", 30)
+    leader.join()
+
+    assert out["leader"] == (504, "timeout")
+    assert out["follower"] == (200, "ok")
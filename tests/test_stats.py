@@ -0,0 +1,11 @@
+
+def test_stats_report_live_rows_next_to_all_time_count(core):
+    client = core.app.test_client()
+    client.post("/query", json={"query": "counted once in stats"})
+    core._log_writer.flush(timeout=5)
+    with core.DB.transaction() as conn:  # what retention does to an old row
+        conn.execute("DELETE FROM interactions WHERE id = (SELECT MIN(id) FROM interactions);")
+
+    stats = client.get("/admin/stats").get_json()
+    assert stats["rows"] == core.count_interactions()
+    assert stats["count_all_time"] == stats["rows"] + 1